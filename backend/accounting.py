@@ -0,0 +1,352 @@
+# Módulo de Contabilidad de Almacenamiento (accounting.py)
+# Espacio usado por usuario con escritura diferida: los cambios se anotan en un diario
+# local y se vuelcan por lotes a la tabla almacenamiento cada pocos segundos
+
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.metrics import execute
+
+# flock para saber si el proceso dueño de un diario sigue vivo (no existe en Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Cuota por defecto de un usuario sin fila en almacenamiento: 15GB
+DEFAULT_QUOTA = 16106127360
+
+# Segundos entre volcados del diario a la base
+ACCOUNTING_FLUSH_INTERVAL = float(os.getenv("ACCOUNTING_FLUSH_INTERVAL", "2"))
+
+# Segundos que se confía en el espacio usado leído de la base; al caducar se relee
+# para ver lo que otros procesos ya volcaron
+ACCOUNTING_VIEW_TTL = float(os.getenv("ACCOUNTING_VIEW_TTL", "30"))
+
+
+class QuotaExceededError(ValueError):
+    """El archivo no cabe en el espacio libre del usuario."""
+
+
+class StorageAccounting:
+    """
+    Contabilidad de espacio con escritura diferida, compartida por los hilos del proceso.
+
+    Cada cambio se agrega a un segmento del diario del proceso (una línea
+    "secuencia usuario delta" con O_APPEND, que sobrevive a la caída del proceso)
+    y a los deltas pendientes en memoria. Un hilo vuelca los pendientes con un
+    UPDATE por usuario en una sola transacción, que registra además la última
+    secuencia aplicada en contabilidad_diarios; así la reaplicación del diario de
+    un proceso caído es idempotente. Tras cada volcado se abre un segmento nuevo y
+    se borran los ya aplicados.
+
+    El espacio usado se consulta en memoria: lo leído de la base más lo pendiente.
+    """
+
+    def __init__(self, db_connection, storage_path: str = "./storage",
+                 flush_interval: float = ACCOUNTING_FLUSH_INTERVAL, view_ttl: float = ACCOUNTING_VIEW_TTL):
+        """
+        Inicializa la contabilidad.
+
+        Args:
+            db_connection: Conexión a la base de datos (de uso exclusivo de la contabilidad)
+            storage_path: Ruta base para almacenamiento de archivos (el diario va en contabilidad/)
+            flush_interval: Segundos entre volcados
+            view_ttl: Segundos que se confía en el espacio usado leído de la base
+        """
+        self.db = db_connection
+        self.journal_path = Path(storage_path) / "contabilidad"
+        self.journal_path.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.view_ttl = view_ttl
+
+        # Diario de este proceso: <token>.lock (bloqueado mientras vive) y <token>.<n>.log
+        self.token = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock_file = None
+        self._segment = 0
+        self._segment_fd = None
+        self._sealed: List[Path] = []
+        self._seq = 0
+
+        self._pending: Dict[str, int] = {}
+        # usuario -> [leído en (monotonic), espacio usado, espacio total]
+        self._views: Dict[str, list] = {}
+
+        # _lock protege el diario y los diccionarios; _db_lock la conexión, y se
+        # mantiene durante todo un volcado para que una lectura no vea deltas a medio aplicar
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._flusher = None
+        self._stopping = threading.Event()
+        self.stats = {"recorded": 0, "flushes": 0, "flushed_users": 0, "failed_flushes": 0, "replayed": 0}
+
+    def start(self) -> None:
+        """Reaplicar diarios de procesos caídos y arrancar el hilo de volcado (idempotente)."""
+        if self._flusher is not None:
+            return
+        self._acquire_journal()
+        self.replay()
+        self._open_segment()
+        self._stopping.clear()
+        self._flusher = threading.Thread(target=self._run, name="storage-accounting", daemon=True)
+        self._flusher.start()
+        logger.info(f"Contabilidad de almacenamiento iniciada (volcado cada {self.flush_interval}s)")
+
+    def stop(self) -> None:
+        """Detener el hilo, volcar lo pendiente y liberar el diario."""
+        if self._flusher is None:
+            return
+        self._stopping.set()
+        self._flusher.join()
+        self._flusher = None
+        if not self.flush():
+            # El diario queda en disco y lo reaplicará el próximo proceso
+            return
+        with self._lock:
+            if self._pending or self._sealed:
+                return
+            os.close(self._segment_fd)
+            self._segment_fd = None
+            self._segment_file(self._segment).unlink(missing_ok=True)
+        self._release_journal()
+
+    def record(self, user_id: str, size_change: int) -> None:
+        """Anotar un cambio de espacio usado (positivo al subir, negativo al purgar)."""
+        if not size_change:
+            return
+        with self._lock:
+            if self._segment_fd is None:
+                raise RuntimeError("La contabilidad de almacenamiento no está iniciada")
+            self._seq += 1
+            os.write(self._segment_fd, f"{self._seq}\t{user_id}\t{size_change}\n".encode("utf-8"))
+            self._pending[user_id] = self._pending.get(user_id, 0) + size_change
+            view = self._views.get(user_id)
+            if view is not None:
+                view[1] += size_change
+        self.stats["recorded"] += 1
+
+    def usage(self, user_id: str) -> Dict[str, int]:
+        """Espacio usado (incluidos los cambios sin volcar) y total del usuario."""
+        with self._lock:
+            view = self._views.get(user_id)
+            if view is not None and time.monotonic() - view[0] < self.view_ttl:
+                return {'used': view[1], 'total': view[2]}
+
+        with self._db_lock:
+            row = self._execute(
+                "usage",
+                "SELECT espacio_usado, espacio_total FROM almacenamiento WHERE usuario_id = :user_id",
+                {'user_id': user_id},
+            ).fetchone()
+            used, total = (row[0], row[1]) if row else (0, DEFAULT_QUOTA)
+            with self._lock:
+                used += self._pending.get(user_id, 0)
+                self._views[user_id] = [time.monotonic(), used, total]
+        return {'used': used, 'total': total}
+
+    def check_quota(self, user_id: str, size: int) -> None:
+        """Lanza QuotaExceededError si size bytes más no caben en la cuota del usuario."""
+        usage = self.usage(user_id)
+        if usage['used'] + size > usage['total']:
+            free = max(usage['total'] - usage['used'], 0)
+            raise QuotaExceededError(f"Espacio insuficiente: quedan {free / (1024*1024):.1f}MB libres")
+
+    def flush(self) -> bool:
+        """
+        Volcar los deltas pendientes en una transacción.
+
+        Returns:
+            False si la base falló (los deltas vuelven a pendientes y siguen en el diario)
+        """
+        with self._db_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                deltas, self._pending = self._pending, {}
+                seq = self._seq
+                # Segmento nuevo: el sellado se borra cuando su contenido está en la base
+                self._sealed.append(self._segment_file(self._segment))
+                self._open_segment()
+
+            try:
+                self._apply(self.token, deltas, seq)
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                logger.exception("No se pudo volcar la contabilidad de almacenamiento")
+                with self._lock:
+                    for user_id, delta in deltas.items():
+                        self._pending[user_id] = self._pending.get(user_id, 0) + delta
+                self.stats["failed_flushes"] += 1
+                return False
+            with self._lock:
+                sealed, self._sealed = self._sealed, []
+
+        for path in sealed:
+            path.unlink(missing_ok=True)
+        self.stats["flushes"] += 1
+        self.stats["flushed_users"] += len(deltas)
+        return True
+
+    def replay(self) -> int:
+        """
+        Aplicar los diarios de procesos que terminaron sin volcarlos.
+
+        Returns:
+            Número de diarios recuperados
+        """
+        recovered = 0
+        for lock_path in sorted(self.journal_path.glob("*.lock")):
+            token = lock_path.stem
+            if token == self.token:
+                continue
+            claim = self._claim_orphan(lock_path)
+            if claim is None:
+                continue
+            try:
+                recovered += self._replay_journal(token, lock_path)
+            finally:
+                claim.close()
+
+        self._forget_journals({path.stem for path in self.journal_path.glob("*.lock")})
+        self.stats["replayed"] += recovered
+        with self._lock:
+            self._views.clear()
+        return recovered
+
+    def _forget_journals(self, present: set) -> None:
+        """Borrar las secuencias de diarios que ya no están en disco."""
+        with self._db_lock:
+            rows = self._execute("replay.journals", "SELECT diario FROM contabilidad_diarios").fetchall()
+            for (token,) in rows:
+                if token not in present:
+                    self._execute("replay.forget", "DELETE FROM contabilidad_diarios WHERE diario = :token", {'token': token})
+            self.db.commit()
+
+    def _replay_journal(self, token: str, lock_path: Path) -> int:
+        # Otro proceso pudo reaplicarlo y borrarlo antes de que se obtuviera el bloqueo
+        if not lock_path.exists():
+            return 0
+        segments = sorted(self.journal_path.glob(f"{token}.*.log"))
+        with self._db_lock:
+            row = self._execute(
+                "replay.select",
+                "SELECT secuencia FROM contabilidad_diarios WHERE diario = :token",
+                {'token': token},
+            ).fetchone()
+            applied = row[0] if row else 0
+
+            deltas, seq = {}, applied
+            for segment in segments:
+                for line in segment.read_text(encoding="utf-8").splitlines():
+                    parts = line.split("\t")
+                    # Una línea cortada por la caída se descarta
+                    if len(parts) != 3 or not parts[0].isdigit():
+                        continue
+                    if int(parts[0]) > applied:
+                        deltas[parts[1]] = deltas.get(parts[1], 0) + int(parts[2])
+                        seq = max(seq, int(parts[0]))
+
+            try:
+                # La secuencia queda registrada hasta que el diario desaparece del disco:
+                # una caída antes de borrarlo no lo vuelve a sumar
+                self._apply(token, deltas, seq)
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+
+        for path in segments:
+            path.unlink(missing_ok=True)
+        lock_path.unlink(missing_ok=True)
+        logger.info(f"Diario de contabilidad {token} reaplicado ({len(deltas)} usuarios)")
+        return 1
+
+    def info(self) -> Dict[str, int]:
+        with self._lock:
+            pending = len(self._pending)
+            views = len(self._views)
+        return {"running": self._flusher is not None, "flush_interval": self.flush_interval,
+                "pending_users": pending, "cached_users": views, "sequence": self._seq, **self.stats}
+
+    def _apply(self, token: str, deltas: Dict[str, int], seq: int) -> None:
+        now = datetime.now()
+        for user_id, delta in deltas.items():
+            if not delta:
+                continue
+            params = {'size_change': delta, 'updated_at': now, 'user_id': user_id}
+            cursor = self._execute(
+                "flush",
+                """
+                UPDATE almacenamiento
+                SET espacio_usado = espacio_usado + :size_change,
+                    fecha_actualizacion = :updated_at
+                WHERE usuario_id = :user_id
+                """,
+                params,
+            )
+            if cursor.rowcount == 0:
+                self._execute(
+                    "flush.insert",
+                    """
+                    INSERT INTO almacenamiento (usuario_id, espacio_usado, espacio_total, fecha_actualizacion)
+                    VALUES (:user_id, :size_change, :total, :updated_at)
+                    """,
+                    {**params, 'total': DEFAULT_QUOTA},
+                )
+        self._execute(
+            "flush.sequence",
+            "INSERT OR REPLACE INTO contabilidad_diarios (diario, secuencia) VALUES (:token, :seq)",
+            {'token': token, 'seq': seq},
+        )
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+    def _segment_file(self, segment: int) -> Path:
+        return self.journal_path / f"{self.token}.{segment:06d}.log"
+
+    def _open_segment(self) -> None:
+        if self._segment_fd is not None:
+            os.close(self._segment_fd)
+            self._segment += 1
+        self._segment_fd = os.open(self._segment_file(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _acquire_journal(self) -> None:
+        self._lock_file = open(self.journal_path / f"{self.token}.lock", "w")
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _release_journal(self) -> None:
+        self._lock_file.close()
+        (self.journal_path / f"{self.token}.lock").unlink(missing_ok=True)
+        self._lock_file = None
+
+    def _claim_orphan(self, lock_path: Path):
+        """
+        Bloquear el diario de un proceso que ya no existe; None si su dueño sigue
+        vivo u otro proceso lo está reaplicando.
+        """
+        handle = open(lock_path, "a")
+        if fcntl is None:
+            # Sin flock se asume un solo proceso por directorio de almacenamiento
+            return handle
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return None
+        return handle
+
+    def _execute(self, name: str, query: str, params: Optional[Dict] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"accounting.{name}", query, params)
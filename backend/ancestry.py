@@ -0,0 +1,168 @@
+# Módulo de Ancestros (ancestry.py)
+# Tabla de cierre de la jerarquía de carpetas: un par (ancestro, descendiente) por
+# cada camino, mantenida en la misma transacción que crea o mueve la carpeta
+
+import logging
+from typing import Dict, List, Optional
+
+from utils.metrics import execute
+
+logger = logging.getLogger(__name__)
+
+# Tope de niveles al reconstruir la tabla: corta la recursión si hubiera un ciclo
+MAX_FOLDER_DEPTH = 1000
+
+
+class AncestryIndex:
+    """
+    Mantiene carpetas_ancestros (ancestro_id, descendiente_id, profundidad), con
+    el par (c, c, 0) de cada carpeta. "¿X está bajo Y?" es una búsqueda por clave
+    primaria y los descendientes o ancestros de una carpeta salen de un rango del
+    índice, sin recorrer la jerarquía.
+
+    Los métodos de escritura no confirman: los llama FolderManager dentro de la
+    transacción de la operación.
+    """
+
+    def __init__(self, db_connection):
+        """
+        Inicializa el índice de ancestros.
+
+        Args:
+            db_connection: Conexión a la base de datos
+        """
+        self.db = db_connection
+
+    def add(self, folder_id: str, parent_folder_id: Optional[str]) -> None:
+        """Registrar una carpeta nueva bajo su padre (o en la raíz)."""
+        self._execute(
+            "add",
+            "INSERT INTO carpetas_ancestros (ancestro_id, descendiente_id, profundidad) VALUES (:folder_id, :folder_id, 0)",
+            {'folder_id': folder_id},
+        )
+        if parent_folder_id:
+            self._execute(
+                "add.ancestors",
+                """
+                INSERT INTO carpetas_ancestros (ancestro_id, descendiente_id, profundidad)
+                SELECT ancestro_id, :folder_id, profundidad + 1
+                FROM carpetas_ancestros
+                WHERE descendiente_id = :parent_folder_id
+                """,
+                {'folder_id': folder_id, 'parent_folder_id': parent_folder_id},
+            )
+
+    def move(self, folder_id: str, new_parent_id: Optional[str]) -> None:
+        """
+        Reubicar el subárbol de una carpeta: se borran los caminos desde sus
+        ancestros anteriores y se crean los de los nuevos (producto con el subárbol).
+        """
+        params = {'folder_id': folder_id, 'new_parent_id': new_parent_id}
+        self._execute(
+            "move.detach",
+            """
+            DELETE FROM carpetas_ancestros
+            WHERE descendiente_id IN (SELECT descendiente_id FROM carpetas_ancestros WHERE ancestro_id = :folder_id)
+              AND ancestro_id NOT IN (SELECT descendiente_id FROM carpetas_ancestros WHERE ancestro_id = :folder_id)
+            """,
+            params,
+        )
+        if new_parent_id:
+            self._execute(
+                "move.attach",
+                """
+                INSERT INTO carpetas_ancestros (ancestro_id, descendiente_id, profundidad)
+                SELECT a.ancestro_id, d.descendiente_id, a.profundidad + d.profundidad + 1
+                FROM carpetas_ancestros a
+                JOIN carpetas_ancestros d ON d.ancestro_id = :folder_id
+                WHERE a.descendiente_id = :new_parent_id
+                """,
+                params,
+            )
+
+    def remove_subtree(self, folder_id: str) -> None:
+        """Borrar los caminos de un subárbol purgado (sin confirmar)."""
+        self._execute(
+            "remove_subtree",
+            """
+            DELETE FROM carpetas_ancestros
+            WHERE descendiente_id IN (SELECT descendiente_id FROM carpetas_ancestros WHERE ancestro_id = :folder_id)
+            """,
+            {'folder_id': folder_id},
+        )
+
+    def is_descendant(self, ancestor_id: str, folder_id: str) -> bool:
+        """True si folder_id es ancestor_id o está dentro de él."""
+        row = self._execute(
+            "is_descendant",
+            "SELECT 1 FROM carpetas_ancestros WHERE ancestro_id = :ancestor_id AND descendiente_id = :folder_id",
+            {'ancestor_id': ancestor_id, 'folder_id': folder_id},
+        ).fetchone()
+        return row is not None
+
+    def ancestor_ids(self, folder_id: str) -> List[str]:
+        """IDs desde la raíz hasta la carpeta (incluida)."""
+        rows = self._execute(
+            "ancestor_ids",
+            "SELECT ancestro_id FROM carpetas_ancestros WHERE descendiente_id = :folder_id ORDER BY profundidad DESC",
+            {'folder_id': folder_id},
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def descendant_ids(self, folder_id: str, max_depth: Optional[int] = None) -> List[str]:
+        """IDs del subárbol de una carpeta (incluida), opcionalmente hasta max_depth niveles."""
+        query = "SELECT descendiente_id FROM carpetas_ancestros WHERE ancestro_id = :folder_id"
+        params = {'folder_id': folder_id}
+        if max_depth is not None:
+            query += " AND profundidad <= :max_depth"
+            params['max_depth'] = max_depth
+        return [row[0] for row in self._execute("descendant_ids", query, params).fetchall()]
+
+    def ensure(self) -> bool:
+        """
+        Reconstruir la tabla si alguna carpeta no está indexada (p. ej. una base
+        anterior a la tabla de cierre). Devuelve True si se reconstruyó.
+        """
+        missing = self._execute(
+            "ensure",
+            """
+            SELECT 1 FROM carpetas c
+            WHERE NOT EXISTS (SELECT 1 FROM carpetas_ancestros a WHERE a.ancestro_id = c.id AND a.descendiente_id = c.id)
+            LIMIT 1
+            """,
+        ).fetchone()
+        if missing is None:
+            return False
+        try:
+            self.rebuild()
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return True
+
+    def rebuild(self) -> int:
+        """Recalcular todos los caminos desde carpeta_padre_id (sin confirmar)."""
+        self._execute("rebuild.clear", "DELETE FROM carpetas_ancestros")
+        cursor = self._execute(
+            "rebuild",
+            f"""
+            INSERT INTO carpetas_ancestros (ancestro_id, descendiente_id, profundidad)
+            WITH caminos (ancestro_id, descendiente_id, profundidad) AS (
+                SELECT id, id, 0 FROM carpetas
+                UNION ALL
+                SELECT p.ancestro_id, c.id, p.profundidad + 1
+                FROM caminos p
+                JOIN carpetas c ON c.carpeta_padre_id = p.descendiente_id
+                WHERE p.profundidad < {MAX_FOLDER_DEPTH}
+            )
+            SELECT ancestro_id, descendiente_id, MIN(profundidad) FROM caminos
+            GROUP BY ancestro_id, descendiente_id
+            """,
+        )
+        logger.info(f"Tabla de ancestros de carpetas reconstruida ({cursor.rowcount} caminos)")
+        return cursor.rowcount
+
+    def _execute(self, name: str, query: str, params: Optional[Dict] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"ancestry.{name}", query, params)
@@ -0,0 +1 @@
+# Suite de benchmarks de la Drive API (ver `python -m benchmarks --help`)
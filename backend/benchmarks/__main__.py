@@ -0,0 +1,80 @@
+# Punto de entrada: python -m benchmarks [opciones] (desde backend/)
+
+import asyncio
+import logging
+import argparse
+from dataclasses import asdict
+
+from utils.backends import SQLiteBackend
+from utils.cache import warm_reference_caches
+from utils.database import close_pool, init_pool, set_backend
+from benchmarks.datos import Volumen, poblar_api
+from benchmarks.resultados import write_results
+
+ESCENARIOS = ("datos", "serializacion", "gestores", "carga")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks reproducibles de la Drive API")
+    parser.add_argument("--escenarios", nargs="+", choices=ESCENARIOS, default=list(ESCENARIOS))
+    parser.add_argument("--usuarios", type=int, default=Volumen.usuarios)
+    parser.add_argument("--carpetas-por-usuario", type=int, default=Volumen.carpetas_por_usuario)
+    parser.add_argument("--profundidad", type=int, default=Volumen.profundidad)
+    parser.add_argument("--archivos", type=int, default=Volumen.archivos)
+    parser.add_argument("--comentarios", type=int, default=Volumen.comentarios)
+    parser.add_argument("--compartidos", type=int, default=Volumen.compartidos)
+    parser.add_argument("--seed", type=int, default=Volumen.seed)
+    parser.add_argument("--iteraciones", type=int, default=200, help="repeticiones por microbenchmark")
+    parser.add_argument("--clientes", type=int, default=20, help="clientes concurrentes en el escenario de carga")
+    parser.add_argument("--peticiones", type=int, default=2000, help="peticiones totales del escenario de carga")
+    parser.add_argument("--sqlite-path", default=":memory:", help="base SQLite (por defecto en memoria)")
+    parser.add_argument("--salida", help="archivo JSON de resultados (por defecto benchmarks/resultados/)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Una línea de log por petición distorsiona el escenario de carga
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    volumen = Volumen(
+        usuarios=args.usuarios,
+        carpetas_por_usuario=args.carpetas_por_usuario,
+        profundidad=args.profundidad,
+        archivos=args.archivos,
+        comentarios=args.comentarios,
+        compartidos=args.compartidos,
+        seed=args.seed,
+    )
+
+    # Siempre sobre SQLite: los resultados no dependen de una instancia Oracle
+    set_backend(SQLiteBackend(path=args.sqlite_path, seed=True))
+    init_pool()
+    results = {}
+    try:
+        ids = poblar_api(volumen)
+        warm_reference_caches()
+
+        # Importes diferidos: cargan la app y los controladores con el backend ya elegido
+        from benchmarks import micro
+        if "datos" in args.escenarios:
+            results["datos"] = micro.bench_capa_datos(ids, args.iteraciones, args.seed)
+        if "serializacion" in args.escenarios:
+            results["serializacion"] = micro.bench_serializacion(args.iteraciones)
+        if "gestores" in args.escenarios:
+            results["gestores"] = micro.bench_gestores(volumen, args.iteraciones)
+        if "carga" in args.escenarios:
+            from main import app
+            from benchmarks.carga import ejecutar_carga
+            results["carga"] = asyncio.run(
+                ejecutar_carga(app, ids, args.clientes, args.peticiones, args.seed)
+            )
+    finally:
+        close_pool()
+
+    config = {**asdict(volumen), **{k: v for k, v in vars(args).items() if k not in asdict(volumen)}}
+    path = write_results(results, config, args.salida)
+    print(f"Resultados guardados en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Escenario de carga en proceso: clientes concurrentes contra la app ASGI
+
+import time
+import random
+import asyncio
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.resultados import summarize
+
+# (método, url, kwargs de httpx)
+Peticion = Tuple[str, str, Dict[str, Any]]
+
+
+def mezcla_trafico(ids: Dict[str, list]) -> List[Tuple[int, str, Callable[[random.Random], Peticion]]]:
+    """(peso, nombre, constructor de la petición): mezcla de lecturas y escrituras."""
+    usuarios = ids["usuarios"]
+    return [
+        (30, "GET /archivos", lambda rng: ("GET", "/archivos", {"params": {"limit": 100}})),
+        (15, "GET /carpetas", lambda rng: ("GET", "/carpetas", {"params": {"limit": 100}})),
+        (10, "GET /comentarios", lambda rng: ("GET", "/comentarios", {"params": {"limit": 50}})),
+        (15, "GET /colores", lambda rng: ("GET", "/colores", {})),
+        (10, "GET /usuarios", lambda rng: (
+            "GET", "/usuarios", {"params": {"correo": f"bench{rng.choice(usuarios)}@drive.test"}}
+        )),
+        (10, "POST /archivos", lambda rng: ("POST", "/archivos", {"json": {
+            "nombre": f"carga_{rng.getrandbits(32):08x}.txt",
+            "id_usuario_propietario": rng.choice(usuarios),
+            "id_tipo_archivo": 5,
+        }})),
+        (10, "POST /comentarios/batch", lambda rng: ("POST", "/comentarios/batch", {"json": [
+            {
+                "descripcion": "carga",
+                "id_usuario_comentador": rng.choice(usuarios),
+                "id_archivo": rng.choice(ids["archivos"]),
+            }
+            for _ in range(20)
+        ]})),
+    ]
+
+
+async def ejecutar_carga(app, ids: Dict[str, list], clientes: int, peticiones: int, seed: int) -> Dict[str, Any]:
+    """
+    Lanza `clientes` corrutinas que reparten `peticiones` en total sobre la app,
+    usando httpx.ASGITransport (sin red ni servidor). Resume por ruta y en global.
+    """
+    rng = random.Random(seed)
+    mezcla = mezcla_trafico(ids)
+    pesos = [peso for peso, _, _ in mezcla]
+    plan = [rng.choices(mezcla, weights=pesos)[0] for _ in range(peticiones)]
+
+    latencias: Dict[str, List[float]] = {nombre: [] for _, nombre, _ in mezcla}
+    errores: Dict[str, int] = {nombre: 0 for _, nombre, _ in mezcla}
+    cola: asyncio.Queue = asyncio.Queue()
+    for item in plan:
+        cola.put_nowait(item)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def cliente(semilla: int):
+            rng_cliente = random.Random(semilla)
+            while not cola.empty():
+                _, nombre, construir = cola.get_nowait()
+                metodo, url, kwargs = construir(rng_cliente)
+                t0 = time.perf_counter()
+                respuesta = await client.request(metodo, url, **kwargs)
+                latencias[nombre].append(time.perf_counter() - t0)
+                if respuesta.status_code >= 400:
+                    errores[nombre] += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(seed + i) for i in range(clientes)))
+        duracion = time.perf_counter() - inicio
+
+    por_ruta = {
+        nombre: summarize(valores, duracion, errores[nombre])
+        for nombre, valores in latencias.items() if valores
+    }
+    todas = [valor for valores in latencias.values() for valor in valores]
+    return {
+        "clientes": clientes,
+        "duracion_s": round(duracion, 3),
+        "global": summarize(todas, duracion, sum(errores.values())),
+        "rutas": por_ruta,
+    }
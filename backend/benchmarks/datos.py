@@ -0,0 +1,213 @@
+# Generador de datos sintéticos reproducibles para los benchmarks
+
+import random
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from utils.database import execute_many, execute_query
+from utils.managers import connect_storage
+
+
+@dataclass
+class Volumen:
+    """Tamaño del conjunto de datos generado (mismo seed -> mismos datos)."""
+    usuarios: int = 50
+    carpetas_por_usuario: int = 40
+    profundidad: int = 12
+    archivos: int = 5000
+    comentarios: int = 5000
+    compartidos: int = 2000
+    seed: int = 42
+
+
+TIPOS_ARCHIVOS = [
+    (1, "Documento", ".docx"),
+    (2, "Hoja de cálculo", ".xlsx"),
+    (3, "PDF", ".pdf"),
+    (4, "Imagen", ".png"),
+    (5, "Texto", ".txt"),
+]
+
+FECHA_BASE = datetime(2024, 1, 1)
+
+
+def _fecha(rng: random.Random) -> datetime:
+    return FECHA_BASE + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+
+
+def _arbol_carpetas(rng: random.Random, primer_id: int, cantidad: int, profundidad: int) -> List[tuple]:
+    """
+    (id, id_padre) de un árbol con una rama de `profundidad` niveles (peor caso de
+    breadcrumb) y el resto de carpetas colgando de padres aleatorios.
+    """
+    arbol = []
+    for i in range(cantidad):
+        carpeta_id = primer_id + i
+        if i == 0:
+            padre = None
+        elif i < profundidad:
+            padre = carpeta_id - 1
+        else:
+            padre = rng.choice(arbol)[0]
+        arbol.append((carpeta_id, padre))
+    return arbol
+
+
+def _siguiente_id(tabla: str, columna: str) -> int:
+    return execute_query(f"SELECT COALESCE(MAX({columna}), 0) + 1 AS siguiente FROM {tabla}")[0]["siguiente"]
+
+
+def poblar_api(volumen: Volumen) -> Dict[str, List[int]]:
+    """
+    Inserta usuarios, carpetas, archivos, comentarios y compartidos con el esquema
+    de db/DDL.sql a través de la capa de datos (utils.database).
+
+    Los IDs se asignan explícitamente, así que está pensado para el backend SQLite.
+    """
+    rng = random.Random(volumen.seed)
+
+    if not execute_query("SELECT id_tipo_archivo FROM tipos_archivos"):
+        execute_many(
+            "INSERT INTO tipos_archivos (id_tipo_archivo, nombre, extension) VALUES (:1, :2, :3)",
+            TIPOS_ARCHIVOS,
+        )
+
+    primer_usuario = _siguiente_id("usuarios2", "id_usuario")
+    usuarios = list(range(primer_usuario, primer_usuario + volumen.usuarios))
+    execute_many(
+        """INSERT INTO usuarios2 (id_usuario, nombre, apellido, correo_electronico, contrasena, id_almacenamiento, id_pais)
+           VALUES (:1, :2, :3, :4, :5, :6, :7)""",
+        [(u, f"Nombre{u}", f"Apellido{u}", f"bench{u}@drive.test", "secreta", 1, rng.randint(1, 15))
+         for u in usuarios],
+    )
+
+    carpetas = []
+    filas = []
+    siguiente = _siguiente_id("carpetas", "id_carpeta")
+    for usuario in usuarios:
+        arbol = _arbol_carpetas(rng, siguiente, volumen.carpetas_por_usuario, volumen.profundidad)
+        siguiente += len(arbol)
+        for carpeta_id, padre in arbol:
+            creada = _fecha(rng)
+            filas.append((carpeta_id, f"carpeta_{carpeta_id}", creada, creada, usuario, padre,
+                          rng.randint(1, 10), 0))
+            carpetas.append((carpeta_id, usuario))
+    execute_many(
+        """INSERT INTO carpetas (id_carpeta, nombre, fecha_creacion, fecha_ultima_modificacion,
+                                 id_usuario_propietario, id_carpeta_padre, id_color, estado_papelera)
+           VALUES (:1, :2, :3, :4, :5, :6, :7, :8)""",
+        filas,
+    )
+
+    primer_archivo = _siguiente_id("archivos", "id_archivo")
+    archivos = list(range(primer_archivo, primer_archivo + volumen.archivos))
+    filas = []
+    for archivo_id in archivos:
+        carpeta_id, usuario = rng.choice(carpetas)
+        tipo, _, extension = rng.choice(TIPOS_ARCHIVOS)
+        creado = _fecha(rng)
+        filas.append((archivo_id, f"archivo_{archivo_id}{extension}", creado, creado,
+                      rng.randint(1_000, 50_000_000), tipo, usuario, carpeta_id, 0))
+    execute_many(
+        """INSERT INTO archivos (id_archivo, nombre, fecha_creacion, fecha_visto, tamano_archivo,
+                                 id_tipo_archivo, id_usuario_propietario, id_carpeta_ubicacion, estado_papelera)
+           VALUES (:1, :2, :3, :4, :5, :6, :7, :8, :9)""",
+        filas,
+    )
+
+    execute_many(
+        """INSERT INTO comentarios (descripcion, fecha_comentario, id_usuario_comentador, id_archivo)
+           VALUES (:1, :2, :3, :4)""",
+        [(f"Comentario {i}", _fecha(rng), rng.choice(usuarios), rng.choice(archivos))
+         for i in range(volumen.comentarios)],
+    )
+
+    # La PK de compartidos es (receptor, archivo): se descartan pares repetidos
+    pares = {(rng.choice(usuarios), rng.choice(archivos)) for _ in range(volumen.compartidos)}
+    execute_many(
+        """INSERT INTO compartidos (id_usuario_receptor, id_usuario_comparte, id_carpeta_compartida,
+                                    id_archivo_compartido, id_tipo_acceso)
+           VALUES (:1, :2, :3, :4, :5)""",
+        [(receptor, rng.choice(usuarios), None, archivo, rng.randint(1, 3))
+         for receptor, archivo in sorted(pares)],
+    )
+
+    return {
+        "usuarios": usuarios,
+        "carpetas": [carpeta_id for carpeta_id, _ in carpetas],
+        "archivos": archivos,
+    }
+
+
+def conexion_gestores(path: str = ":memory:") -> sqlite3.Connection:
+    """Conexión SQLite con el esquema de los gestores (db/gestores.sql)."""
+    return connect_storage(path)
+
+
+def poblar_gestores(conn: sqlite3.Connection, volumen: Volumen) -> Dict[str, List[str]]:
+    """
+    Inserta el mismo volumen de datos con el esquema de los gestores.
+    Los archivos solo existen como registros (sin contenido en disco).
+    """
+    rng = random.Random(volumen.seed)
+
+    usuarios = [f"user_{i:04d}" for i in range(volumen.usuarios)]
+    conn.executemany(
+        "INSERT INTO usuarios (id, email) VALUES (?, ?)",
+        [(u, f"{u}@drive.test") for u in usuarios],
+    )
+    conn.executemany(
+        "INSERT INTO tipo_archivo (nombre) VALUES (?)",
+        [(t,) for t in ("document", "spreadsheet", "pdf", "image", "text")],
+    )
+
+    carpetas = []
+    for usuario in usuarios:
+        arbol = _arbol_carpetas(rng, len(carpetas), volumen.carpetas_por_usuario, volumen.profundidad)
+        filas = []
+        for carpeta_id, padre in arbol:
+            creada = _fecha(rng)
+            filas.append((f"folder_{carpeta_id:06d}", f"carpeta_{carpeta_id}",
+                          f"folder_{padre:06d}" if padre is not None else None,
+                          usuario, creada, creada, 0, "#3B82F6"))
+        conn.executemany(
+            """INSERT INTO carpetas (id, nombre, carpeta_padre_id, usuario_id, fecha_creacion,
+                                     fecha_actualizacion, eliminado, color)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            filas,
+        )
+        carpetas.extend((fila[0], usuario) for fila in filas)
+
+    archivos = []
+    filas = []
+    for i in range(volumen.archivos):
+        carpeta_id, usuario = rng.choice(carpetas)
+        archivo_id = f"file_{i:08d}"
+        creado = _fecha(rng)
+        filas.append((archivo_id, f"archivo_{i}.txt", f"archivo_{i}.txt", rng.randint(1, 5),
+                      rng.randint(1_000, 50_000_000), f"{rng.getrandbits(256):064x}", carpeta_id, usuario,
+                      None, f"/api/files/{archivo_id}/download", None, creado, creado, 0))
+        archivos.append((archivo_id, usuario))
+    conn.executemany(
+        """INSERT INTO archivos (id, nombre, nombre_original, tipo_archivo_id, tamaño, hash_archivo, carpeta_id,
+                                 usuario_id, ruta_almacenamiento, url, thumbnail_url, fecha_creacion,
+                                 fecha_actualizacion, eliminado)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        filas,
+    )
+
+    conn.executemany(
+        "INSERT INTO compartidos (archivo_id, carpeta_id, email_compartido, tipo_acceso_id, activo) VALUES (?, NULL, ?, ?, 1)",
+        [(rng.choice(archivos)[0], f"{rng.choice(usuarios)}@drive.test", rng.randint(1, 2))
+         for _ in range(volumen.compartidos)],
+    )
+    conn.commit()
+
+    return {
+        "usuarios": usuarios,
+        "carpetas": [carpeta_id for carpeta_id, _ in carpetas],
+        "archivos": [archivo_id for archivo_id, _ in archivos],
+        "propietarios": dict(archivos),
+    }
@@ -0,0 +1,119 @@
+# Microbenchmarks: capa de datos, serialización y gestores de archivos/carpetas
+
+import io
+import json
+import random
+import tempfile
+from typing import Any, Dict
+
+from fastapi.encoders import jsonable_encoder
+
+from controllers.archivoscontroller import get_all_archivos
+from controllers.carpetacontroller import get_all_folders
+from controllers.colores_controller import get_all_colores
+from controllers.firebase import SELECT_USUARIO_LOGIN, get_usuario_por_correo
+from files import FileManager
+from folders import FolderManager
+from models.archivos import Archivos
+from utils.database import execute_query, execute_query_json
+from benchmarks.datos import Volumen, conexion_gestores, poblar_gestores
+from benchmarks.resultados import measure
+
+
+def bench_capa_datos(ids: Dict[str, list], iterations: int, seed: int) -> Dict[str, Any]:
+    """Consultas de la API contra el backend activo (utils.database)."""
+    rng = random.Random(seed)
+    usuarios = ids["usuarios"]
+    archivos = ids["archivos"]
+    _, cursor = get_all_archivos(limit=100)
+
+    return {
+        "archivos.pagina_100": measure(lambda: get_all_archivos(limit=100), iterations),
+        "archivos.pagina_100_con_cursor": measure(lambda: get_all_archivos(after=cursor, limit=100), iterations),
+        "carpetas.pagina_100": measure(lambda: get_all_folders(limit=100), iterations),
+        "archivos.por_id": measure(
+            lambda: execute_query("SELECT * FROM archivos WHERE id_archivo = :id", {"id": rng.choice(archivos)}),
+            iterations,
+        ),
+        # /login valida contra Firebase por REST; aquí solo se mide su consulta a la base
+        "login.consulta_usuario": measure(
+            lambda: execute_query(SELECT_USUARIO_LOGIN, (f"bench{rng.choice(usuarios)}@drive.test",)),
+            iterations,
+        ),
+        "usuarios.por_correo": measure(
+            lambda: get_usuario_por_correo(f"bench{rng.choice(usuarios)}@drive.test"), iterations
+        ),
+        "colores.cache": measure(get_all_colores, iterations),
+    }
+
+
+def bench_serializacion(iterations: int) -> Dict[str, Any]:
+    """Costo de convertir una página de 100 archivos a JSON por cada camino disponible."""
+    filas, _ = get_all_archivos(limit=100)
+
+    return {
+        "json.execute_query_json": measure(
+            lambda: execute_query_json("SELECT * FROM archivos FETCH FIRST 100 ROWS ONLY"), iterations
+        ),
+        "json.jsonable_encoder": measure(lambda: json.dumps(jsonable_encoder(filas)), iterations),
+        "json.pydantic_modelos": measure(
+            lambda: [Archivos.model_validate(fila).model_dump_json() for fila in filas], iterations
+        ),
+    }
+
+
+def bench_gestores(volumen: Volumen, iterations: int) -> Dict[str, Any]:
+    """FileManager y FolderManager sobre una base SQLite con su propio esquema."""
+    rng = random.Random(volumen.seed)
+    conn = conexion_gestores()
+    ids = poblar_gestores(conn, volumen)
+    resultados = {}
+
+    with tempfile.TemporaryDirectory() as storage:
+        files = FileManager(conn, storage_path=storage)
+        folders = FolderManager(conn)
+        usuario = ids["usuarios"][0]
+        # Las primeras `profundidad` carpetas de cada usuario forman la rama más profunda
+        hoja = ids["carpetas"][volumen.profundidad - 1]
+        raiz = ids["carpetas"][0]
+        contenido = io.BytesIO(rng.randbytes(256 * 1024))
+        contador = iter(range(1 << 62))
+
+        def subir():
+            contenido.seek(0)
+            return files.upload_file(usuario, contenido, "bench.bin", folder_id=raiz)
+
+        def subir_nuevo():
+            # Cambia los primeros bytes para que el hash no exista en el almacén
+            contenido.seek(0)
+            contenido.write(next(contador).to_bytes(8, "big"))
+            return subir()
+
+        subido = subir()
+
+        def descargar():
+            _, data = files.download_file(usuario, subido["id"])
+            with data:
+                data.read()
+
+        resultados.update({
+            "files.upload_256k_nuevo": measure(subir_nuevo, max(iterations // 10, 1)),
+            "files.upload_256k_duplicado": measure(subir, max(iterations // 10, 1)),
+            "files.download_256k": measure(descargar, iterations),
+            "files.get_file": measure(lambda: files.get_file(rng.choice(ids["archivos"])), iterations),
+            "files.list_folder_files": measure(
+                lambda: files.list_folder_files(usuario, folder_id=raiz), iterations
+            ),
+            "files.search_files": measure(lambda: files.search_files(usuario, "archivo_1"), iterations),
+            "files.validate_file_access": measure(
+                lambda: files.validate_file_access(usuario, rng.choice(ids["archivos"])), iterations
+            ),
+            "folders.get_folder_path_profunda": measure(lambda: folders.get_folder_path(hoja), iterations),
+            "folders.is_descendant_profunda": measure(lambda: folders.is_descendant(raiz, hoja), iterations),
+            "folders.get_folder_statistics": measure(
+                lambda: folders.get_folder_statistics(usuario, raiz), iterations
+            ),
+        })
+
+    conn.close()
+    return resultados
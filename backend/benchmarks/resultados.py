@@ -0,0 +1,90 @@
+# Medición y persistencia de resultados de los benchmarks
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+RESULTS_DIR = Path(__file__).resolve().parent / "resultados"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentil por interpolación lineal sobre valores ya ordenados."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Any]:
+    """Resume latencias (segundos) en p50/p95/p99 (ms) y throughput (ops/s)."""
+    values = sorted(latencies)
+    return {
+        "ops": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 50) * 1000, 4),
+        "p95_ms": round(percentile(values, 95) * 1000, 4),
+        "p99_ms": round(percentile(values, 99) * 1000, 4),
+        "mean_ms": round(sum(values) / len(values) * 1000, 4) if values else 0.0,
+        "throughput_ops_s": round(len(values) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int = 5) -> Dict[str, Any]:
+    """Ejecuta `func` `iterations` veces (tras un calentamiento) y resume los tiempos."""
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def peak_rss_mb() -> float:
+    """Memoria residente máxima del proceso (ru_maxrss es KB en Linux y bytes en macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 2)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def write_results(results: Dict[str, Any], config: Dict[str, Any], output: str = None) -> Path:
+    """Guarda los resultados junto con la configuración y el entorno de la corrida."""
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+
+    if output:
+        path = Path(output)
+    else:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
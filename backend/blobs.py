@@ -0,0 +1,323 @@
+# Módulo de Blobs (blobs.py)
+# Almacenamiento direccionado por contenido: un solo archivo físico por hash SHA-256
+
+import os
+import hashlib
+import tempfile
+from datetime import datetime
+from typing import Optional, Dict, Any, BinaryIO, List
+from pathlib import Path
+
+from utils.compression import GZIP, IDENTITY, ZSTD, compressor, open_blob, worth_compressing
+from utils.metrics import execute, executemany
+
+# Sufijo del archivo físico según el códec: cada (hash, códec) tiene su propia ruta,
+# así un archivo ya publicado en disco siempre está en el códec que indica su nombre
+CODEC_SUFFIXES = {IDENTITY: "", GZIP: ".gz", ZSTD: ".zst"}
+
+
+class BlobStore:
+    """
+    Almacén de contenidos deduplicado con conteo de referencias.
+
+    Cada contenido se guarda una sola vez en `blobs/<hash[:2]>/<hash[2:4]>/<hash>`
+    y la tabla `blobs` (hash_archivo, tamaño, ruta_almacenamiento, referencias,
+    fecha_creacion) cuenta cuántos registros de `archivos` lo usan.
+
+    El contenido puede guardarse comprimido (columna codec); el hash y `tamaño` son
+    siempre los del contenido original y `tamaño_fisico` lo que ocupa en disco.
+
+    Publicar un archivo y borrarlo se serializan con el cerrojo de escritura de la
+    base: un contenido nuevo solo se enlaza en su ruta dentro de la transacción que
+    registra su fila, y una ruta solo se borra con el cerrojo tomado y tras comprobar
+    que ninguna fila la usa. Así un borrado no alcanza a una subida en curso.
+    """
+
+    def __init__(self, db_connection, storage_path: str = "./storage",
+                 buffer_size: int = 1024 * 1024, memory_limit: int = 8 * 1024 * 1024):
+        """
+        Inicializa el almacén de blobs.
+
+        Args:
+            db_connection: Conexión a la base de datos
+            storage_path: Ruta base para almacenamiento de archivos
+            buffer_size: Tamaño del buffer de lectura/escritura
+            memory_limit: Contenidos hasta este tamaño se reciben en memoria y,
+                          si ya existen, nunca se escriben a disco
+        """
+        self.db = db_connection
+        self.blobs_path = Path(storage_path) / "blobs"
+        self.blobs_path.mkdir(parents=True, exist_ok=True)
+        self.buffer_size = buffer_size
+        self.memory_limit = memory_limit
+
+    def blob_path(self, file_hash: str, codec: str = IDENTITY) -> Path:
+        """Ruta física del contenido con ese hash guardado con ese códec."""
+        return self.blobs_path / file_hash[:2] / file_hash[2:4] / f"{file_hash}{CODEC_SUFFIXES[codec]}"
+
+    def ingest(self, file_data: BinaryIO, max_size: int, codec: str = IDENTITY) -> Dict[str, Any]:
+        """
+        Recibir un contenido en una sola pasada por el stream, sin contar referencias
+        ni publicarlo: el llamador lo hace con add_reference en la transacción de su
+        registro y termina con finish.
+
+        Los primeros `memory_limit` bytes se acumulan en memoria; solo si el stream
+        los supera se vuelca a un temporal en disco. Al terminar, si el hash ya existe
+        se descarta lo recibido; si no, queda en un temporal (temp_path) listo para
+        publicarse en la ruta de su hash y códec.
+
+        Con un códec, lo que se escribe a disco se comprime al vuelo; si una muestra
+        del inicio no comprime lo suficiente se guarda sin comprimir.
+
+        Args:
+            file_data: Stream con el contenido
+            max_size: Tamaño máximo permitido (se aborta al superarlo)
+            codec: Códec de utils.compression con el que guardar el contenido
+
+        Returns:
+            Dict con hash, tamaño original, ruta, códec, si el contenido ya existía
+            (deduplicated) y, si es nuevo, su temporal y su tamaño en disco
+        """
+        too_large = f"Archivo demasiado grande. Máximo: {max_size / (1024*1024):.1f}MB"
+
+        # Con streams posicionables el tamaño se conoce sin leer nada
+        if file_data.seekable():
+            if file_data.seek(0, 2) > max_size:
+                raise ValueError(too_large)
+            file_data.seek(0)
+
+        hash_sha256 = hashlib.sha256()
+        size = 0
+        head = bytearray()
+        spill = None
+        temp_name = None
+        publish = False
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        readinto = getattr(file_data, 'readinto', None)
+        stream = None
+
+        def open_spill():
+            # Se decide el códec con los datos ya recibidos, antes de escribir nada
+            nonlocal codec, stream
+            if codec != IDENTITY and not worth_compressing(codec, head):
+                codec = IDENTITY
+            stream = compressor(codec) if codec != IDENTITY else None
+            spill, name = self._open_temp()
+            spill.write(stream.compress(bytes(head)) if stream else head)
+            return spill, name
+
+        try:
+            while True:
+                if readinto:
+                    read = readinto(buffer)
+                    chunk = view[:read]
+                else:
+                    chunk = file_data.read(self.buffer_size)
+                    read = len(chunk)
+                if not read:
+                    break
+
+                size += read
+                if size > max_size:
+                    raise ValueError(too_large)
+
+                hash_sha256.update(chunk)
+                if spill is None and size <= self.memory_limit:
+                    head += chunk
+                    continue
+
+                if spill is None:
+                    spill, temp_name = open_spill()
+                    head = bytearray()
+                spill.write(stream.compress(chunk) if stream else chunk)
+
+            file_hash = hash_sha256.hexdigest()
+
+            stored_size = None
+            existing = self.get_blob(file_hash)
+            if existing:
+                deduplicated = True
+                codec = existing['codec']
+                destination = existing['storage_path']
+            else:
+                if spill is None:
+                    spill, temp_name = open_spill()
+                if stream:
+                    spill.write(stream.flush())
+                spill.close()
+                stored_size = os.path.getsize(temp_name)
+                destination = self.blob_path(file_hash, codec)
+                deduplicated = False
+                publish = True
+        finally:
+            if spill is not None and not spill.closed:
+                spill.close()
+            # El temporal solo sigue vivo si hay que publicarlo
+            if temp_name and not publish:
+                os.unlink(temp_name)
+                temp_name = None
+
+        return {
+            'file_hash': file_hash,
+            'file_size': size,
+            'storage_path': str(destination),
+            'deduplicated': deduplicated,
+            'codec': codec,
+            'stored_size': stored_size,
+            'temp_path': temp_name
+        }
+
+    def add_reference(self, blob: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Sumar una referencia a un contenido recibido con ingest, en la transacción
+        del llamador (sin commit) para que cuente solo si su registro se confirma.
+        Si otra subida del mismo contenido lo registró antes (quizá con otro códec),
+        solo se suma y vale su fila. Si no, el temporal se publica con os.link, que
+        nunca sobrescribe (si la ruta existe es una publicación anterior sin registro
+        del mismo hash y códec, ya completa), y se registra con una referencia.
+
+        El UPDATE inicial toma el cerrojo de escritura hasta el commit del llamador:
+        ningún borrado puede comprobar la ruta entre la publicación y el registro.
+
+        Returns:
+            Registro del contenido (get_blob): su ruta y códec son los que hay que usar
+
+        Raises:
+            ValueError: Si el contenido deduplicado se purgó durante la subida
+        """
+        query = """
+        UPDATE blobs
+        SET referencias = referencias + 1
+        WHERE hash_archivo = :file_hash
+        """
+        if self._execute("add_reference", query, {'file_hash': blob['file_hash']}).rowcount == 0:
+            if not blob['temp_path']:
+                raise ValueError("El contenido se eliminó durante la subida, vuelve a intentarlo")
+
+            destination = Path(blob['storage_path'])
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(blob['temp_path'], destination)
+            except FileExistsError:
+                pass
+
+            query = """
+            INSERT INTO blobs (hash_archivo, tamaño, ruta_almacenamiento, referencias, fecha_creacion,
+                               codec, tamaño_fisico)
+            VALUES (:file_hash, :file_size, :storage_path, 1, :created_at, :codec, :stored_size)
+            """
+            params = {
+                'file_hash': blob['file_hash'],
+                'file_size': blob['file_size'],
+                'storage_path': blob['storage_path'],
+                'created_at': datetime.now(),
+                'codec': blob['codec'],
+                'stored_size': blob['stored_size']
+            }
+            self._execute("insert_blob", query, params)
+        return self.get_blob(blob['file_hash'])
+
+    def finish(self, blob: Dict[str, Any], registered: bool) -> None:
+        """
+        Borrar el temporal de ingest una vez resuelta la subida. Si el registro no
+        se confirmó, también la copia publicada por add_reference (si llegó a
+        publicarse y ninguna otra fila la usa).
+        """
+        if blob['temp_path']:
+            Path(blob['temp_path']).unlink(missing_ok=True)
+            if not registered:
+                self.unlink_many([blob['storage_path']])
+
+    def release_many(self, references: Dict[str, int]) -> List[str]:
+        """
+        Quitar varias referencias por hash en la transacción del llamador (sin commit).
+
+        Returns:
+            Rutas de los contenidos cuyo registro se borró; se eliminan con
+            unlink_many una vez confirmada la transacción
+        """
+        self._executemany(
+            "release_many",
+            """
+            UPDATE blobs
+            SET referencias = CASE WHEN referencias > ? THEN referencias - ? ELSE 0 END
+            WHERE hash_archivo = ?
+            """,
+            [(count, count, file_hash) for file_hash, count in references.items()],
+        )
+        removed = []
+        hashes = list(references)
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            rows = self._execute(
+                "release_many.unused",
+                f"SELECT ruta_almacenamiento FROM blobs WHERE referencias = 0 AND hash_archivo IN ({placeholders})",
+                batch,
+            ).fetchall()
+            removed.extend(row[0] for row in rows)
+            self._execute(
+                "release_many.delete",
+                f"DELETE FROM blobs WHERE referencias = 0 AND hash_archivo IN ({placeholders})",
+                batch,
+            )
+        return removed
+
+    def unlink_many(self, paths: List[str]) -> None:
+        """
+        Borrar del disco contenidos cuyo registro se eliminó (fuera de una transacción).
+        Con el cerrojo de escritura tomado se vuelve a comprobar cada ruta: si otra
+        subida registró entretanto el mismo contenido en ella, el archivo se conserva.
+        """
+        if not paths:
+            return
+        self._execute("unlink_many.lock", "BEGIN IMMEDIATE")
+        try:
+            for start in range(0, len(paths), 500):
+                batch = paths[start:start + 500]
+                placeholders = ", ".join("?" * len(batch))
+                in_use = {row[0] for row in self._execute(
+                    "unlink_many.in_use",
+                    f"SELECT ruta_almacenamiento FROM blobs WHERE ruta_almacenamiento IN ({placeholders})",
+                    batch,
+                ).fetchall()}
+                for path in batch:
+                    if path not in in_use:
+                        Path(path).unlink(missing_ok=True)
+        finally:
+            self.db.rollback()
+
+    def open(self, file_hash: str) -> BinaryIO:
+        """Abrir un contenido para leer sus bytes originales (descomprimiendo si hace falta)."""
+        blob = self.get_blob(file_hash)
+        if not blob:
+            raise FileNotFoundError("Contenido no encontrado")
+        return open_blob(blob['storage_path'], blob['codec'], self.buffer_size)
+
+    def get_blob(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Obtener el registro de un contenido."""
+        query = """
+        SELECT hash_archivo as file_hash, tamaño as file_size,
+               ruta_almacenamiento as storage_path, referencias as refcount,
+               codec, tamaño_fisico as stored_size
+        FROM blobs
+        WHERE hash_archivo = :file_hash
+        """
+
+        cursor = self._execute("get_blob", query, {'file_hash': file_hash})
+        row = cursor.fetchone()
+
+        return dict(row) if row else None
+
+    def _open_temp(self):
+        """Temporal en el mismo sistema de archivos que los blobs (os.replace atómico)."""
+        fd, temp_name = tempfile.mkstemp(dir=self.blobs_path, prefix=".upload-")
+        return os.fdopen(fd, 'wb'), temp_name
+
+    def _execute(self, name: str, query: str, params: Optional[Dict[str, Any]] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"blobs.{name}", query, params)
+
+    def _executemany(self, name: str, query: str, rows: List[tuple]):
+        return executemany(self.db, f"blobs.{name}", query, rows)
@@ -1,25 +1,34 @@
-import json
-from utils.database import execute_query_json
+from utils.database import execute_query, execute_many, batch_results, iter_query
+from utils.pagination import DEFAULT_PAGE_SIZE, keyset_query, split_page, register_keyset_statements
+from utils.statements import register_statement
 from models.archivos import Archivos
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from datetime import datetime
 
 
-def get_all_archivos() -> List[Archivos]:
-    query = "SELECT * FROM archivos ORDER BY nombre"
-    
-    # execute_query_json returns JSON string
-    result_json = execute_query_json(query)
-    
-    # Convert JSON string to Python list of dicts
-    result_list = json.loads(result_json)
-    
-    # Convert each dict to Carpetas Pydantic model
-    return [Archivos(**folder) for folder in result_list]
+# Columnas de ordenamiento (indexadas) usadas para la paginación por keyset
+ARCHIVOS_KEYSET = ("nombre", "id_archivo")
+register_keyset_statements("archivos.listar", "SELECT * FROM archivos", ARCHIVOS_KEYSET)
 
-def create_archivo(nombre: str,id_usuario_propietario: int, id_tipo_archivo: int) -> dict:
-    
-    query = """
+
+def get_all_archivos(after: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[dict], Optional[str]]:
+    """
+    Devuelve una página del listado y el cursor de la siguiente (None si no hay más).
+    """
+    # Se pide una fila de más para saber si existe página siguiente
+    query, params = keyset_query("SELECT * FROM archivos", ARCHIVOS_KEYSET, after, limit + 1)
+
+    return split_page(execute_query(query, params=params, arraysize=limit + 1), ARCHIVOS_KEYSET, limit)
+
+
+def stream_archivos(after: Optional[str] = None, limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Recorre el listado desde el cursor `after` entregando filas por lotes.
+    """
+    query, params = keyset_query("SELECT * FROM archivos", ARCHIVOS_KEYSET, after, limit)
+    return iter_query(query, params=params)
+
+INSERT_ARCHIVO = register_statement("archivos.insertar", """
         INSERT INTO archivos (
             nombre,
             fecha_creacion,
@@ -41,7 +50,12 @@ def create_archivo(nombre: str,id_usuario_propietario: int, id_tipo_archivo: int
             :id_carpeta_ubicacion, 
             :estado_papelera
         )
-    """
+    """)
+
+
+def create_archivo(nombre: str,id_usuario_propietario: int, id_tipo_archivo: int) -> dict:
+    
+    query = INSERT_ARCHIVO
 
 
 
@@ -58,7 +72,7 @@ def create_archivo(nombre: str,id_usuario_propietario: int, id_tipo_archivo: int
 
     
         
-    execute_query_json(query, params=params, needs_commit=True)
+    execute_query(query, params=params, needs_commit=True)
 
         # Devuelve solo el nombre y datos por defecto
     return {
@@ -73,21 +87,47 @@ def create_archivo(nombre: str,id_usuario_propietario: int, id_tipo_archivo: int
         }
 
 
-def delete_archivo(id_archivo: int) -> dict:
-    query = """
+DELETE_ARCHIVO = register_statement("archivos.eliminar", """
         DELETE FROM archivos
         WHERE id_archivo = :id_archivo
-    """
+    """)
+
+
+def delete_archivo(id_archivo: int) -> dict:
+    query = DELETE_ARCHIVO
     
     params = {
         "id_archivo": id_archivo
     }
 
     # Ejecuta la eliminación y confirma cambios
-    execute_query_json(query, params=params, needs_commit=True)
+    execute_query(query, params=params, needs_commit=True)
 
     # Devuelve un mensaje indicando éxito
     return {
         "message": f"Archivo con id {id_archivo} eliminado correctamente."
     }
 
+
+def create_archivos_batch(archivos: List[Archivos]) -> List[dict]:
+    """
+    Inserta varios archivos con un solo executemany y un solo commit.
+    Devuelve el resultado de cada fila para reintentar solo las que fallaron.
+    """
+    now = datetime.now()
+    rows = [
+        {
+            "nombre": archivo.nombre,
+            "fecha_creacion": archivo.fecha_creacion or now,
+            "fecha_visto": archivo.fecha_visto or now,
+            "tamano_archivo": archivo.tamano_archivo if archivo.tamano_archivo is not None else 1024,
+            "id_tipo_archivo": archivo.id_tipo_archivo or 1,
+            "id_usuario_propietario": archivo.id_usuario_propietario,
+            "id_carpeta_ubicacion": archivo.id_carpeta_ubicacion,
+            "estado_papelera": archivo.estado_papelera or 0
+        }
+        for archivo in archivos
+    ]
+
+    errors = execute_many(INSERT_ARCHIVO, rows)
+    return batch_results(rows, errors)
@@ -1,21 +1,32 @@
-import json
-from utils.database import execute_query_json
+from utils.database import execute_query, iter_query
+from utils.pagination import DEFAULT_PAGE_SIZE, keyset_query, split_page, register_keyset_statements
+from utils.statements import register_statement
 from models.carpetas import Carpetas
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from datetime import datetime
 
 
-def get_all_folders() -> List[Carpetas]:
-    query = "SELECT * FROM carpetas ORDER BY nombre"
-    
-    # execute_query_json returns JSON string
-    result_json = execute_query_json(query)
-    
-    # Convert JSON string to Python list of dicts
-    result_list = json.loads(result_json)
-    
-    # Convert each dict to Carpetas Pydantic model
-    return [Carpetas(**folder) for folder in result_list]
+# Columnas de ordenamiento (indexadas) usadas para la paginación por keyset
+CARPETAS_KEYSET = ("nombre", "id_carpeta")
+register_keyset_statements("carpetas.listar", "SELECT * FROM carpetas", CARPETAS_KEYSET)
+
+
+def get_all_folders(after: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[dict], Optional[str]]:
+    """
+    Devuelve una página del listado y el cursor de la siguiente (None si no hay más).
+    """
+    # Se pide una fila de más para saber si existe página siguiente
+    query, params = keyset_query("SELECT * FROM carpetas", CARPETAS_KEYSET, after, limit + 1)
+
+    return split_page(execute_query(query, params=params, arraysize=limit + 1), CARPETAS_KEYSET, limit)
+
+
+def stream_folders(after: Optional[str] = None, limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Recorre el listado desde el cursor `after` entregando filas por lotes.
+    """
+    query, params = keyset_query("SELECT * FROM carpetas", CARPETAS_KEYSET, after, limit)
+    return iter_query(query, params=params)
 
 
 def create_carpeta(nombre: str, id_usuario_propietario: int) -> dict:
@@ -55,7 +66,7 @@ def create_carpeta(nombre: str, id_usuario_propietario: int) -> dict:
     }
 
     # Ejecuta la inserción y confirma cambios
-    execute_query_json(query, params=params, needs_commit=True)
+    execute_query(query, params=params, needs_commit=True)
 
     # Devuelve solo el nombre y datos por defecto
     return {
@@ -68,18 +79,21 @@ def create_carpeta(nombre: str, id_usuario_propietario: int) -> dict:
         "estado_papelera": params["estado_papelera"]
     }
 
-def delete_carpeta(id_carpeta: int) -> dict:
-    query = """
+DELETE_CARPETA = register_statement("carpetas.eliminar", """
         DELETE FROM carpetas
         WHERE id_carpeta = :id_carpeta
-    """
+    """)
+
+
+def delete_carpeta(id_carpeta: int) -> dict:
+    query = DELETE_CARPETA
 
     params = {
         "id_carpeta": id_carpeta
     }
 
     # Ejecuta la eliminación y confirma cambios
-    execute_query_json(query, params=params, needs_commit=True)
+    execute_query(query, params=params, needs_commit=True)
 
     # Devuelve un mensaje indicando éxito
     return {
@@ -1,8 +1,11 @@
-import json
-from utils.database import execute_query_json
+from utils.database import execute_query
+from utils.statements import register_statement
+from utils.cache import register_reference_cache
 from models.colores import Colores
 
+SELECT_COLORES = register_statement("colores.listar", "SELECT id_color, nombre, codigo_hex FROM colores", arraysize=50)
+
+colores_cache = register_reference_cache("colores", lambda: execute_query(SELECT_COLORES))
+
 def get_all_colores():
-    query = "SELECT id_color, nombre, codigo_hex FROM colores"
-    result = execute_query_json(query)
-    return [Colores(**c) for c in json.loads(result)]
+    return [Colores(**c) for c in colores_cache.rows()]
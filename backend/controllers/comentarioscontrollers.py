@@ -1,23 +1,33 @@
-import json
 from datetime import datetime
-from typing import List
-from utils.database import execute_query_json
+from typing import Iterator, List, Optional, Tuple
+from utils.database import execute_query, execute_many, batch_results, iter_query
+from utils.pagination import DEFAULT_PAGE_SIZE, keyset_query, split_page, register_keyset_statements
+from utils.statements import register_statement
 from models.comentarios import Comentarios
 
-def get_all_comentarios() -> List[Comentarios]:
-    query = "SELECT * FROM comentarios ORDER BY fecha_comentario"
+# Columnas de ordenamiento (indexadas) usadas para la paginación por keyset
+COMENTARIOS_KEYSET = ("fecha_comentario", "id_comentario")
+register_keyset_statements("comentarios.listar", "SELECT * FROM comentarios", COMENTARIOS_KEYSET)
 
-    # execute_query_json returns a JSON string
-    result_json = execute_query_json(query)
 
-    # Convert JSON string to Python list of dicts
-    result_list = json.loads(result_json)
+def get_all_comentarios(after: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[dict], Optional[str]]:
+    """
+    Devuelve una página del listado y el cursor de la siguiente (None si no hay más).
+    """
+    # Se pide una fila de más para saber si existe página siguiente
+    query, params = keyset_query("SELECT * FROM comentarios", COMENTARIOS_KEYSET, after, limit + 1)
 
-    # Convert each dict to Comentarios Pydantic model
-    return [Comentarios(**comentario) for comentario in result_list]
+    return split_page(execute_query(query, params=params, arraysize=limit + 1), COMENTARIOS_KEYSET, limit)
 
-def create_comentario(descripcion: str, id_usuario_comentador: int, id_archivo: int) -> dict:
-    query = """
+
+def stream_comentarios(after: Optional[str] = None, limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Recorre el listado desde el cursor `after` entregando filas por lotes.
+    """
+    query, params = keyset_query("SELECT * FROM comentarios", COMENTARIOS_KEYSET, after, limit)
+    return iter_query(query, params=params)
+
+INSERT_COMENTARIO = register_statement("comentarios.insertar", """
         INSERT INTO comentarios (
             descripcion,
             fecha_comentario,
@@ -30,7 +40,11 @@ def create_comentario(descripcion: str, id_usuario_comentador: int, id_archivo:
             :id_usuario_comentador,
             :id_archivo
         )
-    """
+    """)
+
+
+def create_comentario(descripcion: str, id_usuario_comentador: int, id_archivo: int) -> dict:
+    query = INSERT_COMENTARIO
 
     params = {
         "descripcion": descripcion,
@@ -39,7 +53,7 @@ def create_comentario(descripcion: str, id_usuario_comentador: int, id_archivo:
         "id_archivo": id_archivo
     }
 
-    execute_query_json(query, params=params, needs_commit=True)
+    execute_query(query, params=params, needs_commit=True)
 
     return {
         "descripcion": params["descripcion"],
@@ -48,14 +62,37 @@ def create_comentario(descripcion: str, id_usuario_comentador: int, id_archivo:
         "id_archivo": params["id_archivo"]
     }
 
+DELETE_COMENTARIO = register_statement("comentarios.eliminar", "DELETE FROM comentarios WHERE id_comentario = :id_comentario")
+
+
 # Controller
 def delete_comentario(id_comentario: int) -> dict:
     """
     Elimina un comentario por su id_comentario.
     """
-    query = "DELETE FROM comentarios WHERE id_comentario = :id_comentario"
+    query = DELETE_COMENTARIO
     params = {"id_comentario": id_comentario}
 
-    execute_query_json(query, params=params, needs_commit=True)
+    execute_query(query, params=params, needs_commit=True)
 
     return {"message": f"Comentario {id_comentario} eliminado correctamente."}
+
+
+def create_comentarios_batch(comentarios: List[Comentarios]) -> List[dict]:
+    """
+    Inserta varios comentarios con un solo executemany y un solo commit.
+    Devuelve el resultado de cada fila.
+    """
+    now = datetime.now()
+    rows = [
+        {
+            "descripcion": comentario.descripcion,
+            "fecha_comentario": comentario.fecha_comentario or now,
+            "id_usuario_comentador": comentario.id_usuario_comentador,
+            "id_archivo": comentario.id_archivo
+        }
+        for comentario in comentarios
+    ]
+
+    errors = execute_many(INSERT_COMENTARIO, rows)
+    return batch_results(rows, errors)
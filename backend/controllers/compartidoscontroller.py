@@ -1,26 +1,35 @@
-import json
-from utils.database import execute_query_json
+from utils.database import execute_query, execute_many, batch_results, iter_query
+from utils.pagination import DEFAULT_PAGE_SIZE, keyset_query, split_page, register_keyset_statements
+from utils.statements import register_statement
 from models.compartidos import Compartidos
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from datetime import datetime
 
 
-def get_all_compartidos() -> List[Compartidos]:
-    query = "SELECT * FROM compartidos"
-    
-    # execute_query_json returns JSON string
-    result_json = execute_query_json(query)
-    
-    # Convert JSON string to Python list of dicts
-    result_list = json.loads(result_json)
-    
-    # Convert each dict to Carpetas Pydantic model
-    return [Compartidos(**folder) for folder in result_list]
+# Columnas de ordenamiento (indexadas) usadas para la paginación por keyset
+COMPARTIDOS_KEYSET = ("id_usuario_receptor", "id_archivo_compartido")
+register_keyset_statements("compartidos.listar", "SELECT * FROM compartidos", COMPARTIDOS_KEYSET)
 
 
-def create_compartido(id_usuario_comparte: int,id_archivo_compartido:int, id_usuario_receptor:int) -> dict:
-    
-    query = """
+def get_all_compartidos(after: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[dict], Optional[str]]:
+    """
+    Devuelve una página del listado y el cursor de la siguiente (None si no hay más).
+    """
+    # Se pide una fila de más para saber si existe página siguiente
+    query, params = keyset_query("SELECT * FROM compartidos", COMPARTIDOS_KEYSET, after, limit + 1)
+
+    return split_page(execute_query(query, params=params, arraysize=limit + 1), COMPARTIDOS_KEYSET, limit)
+
+
+def stream_compartidos(after: Optional[str] = None, limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Recorre el listado desde el cursor `after` entregando filas por lotes.
+    """
+    query, params = keyset_query("SELECT * FROM compartidos", COMPARTIDOS_KEYSET, after, limit)
+    return iter_query(query, params=params)
+
+
+INSERT_COMPARTIDO = register_statement("compartidos.insertar", """
         INSERT INTO compartidos (
             id_usuario_receptor,
             id_usuario_comparte,
@@ -33,7 +42,12 @@ def create_compartido(id_usuario_comparte: int,id_archivo_compartido:int, id_usu
             :id_archivo_compartido, 
             :id_tipo_acceso
         )
-    """
+    """)
+
+
+def create_compartido(id_usuario_comparte: int,id_archivo_compartido:int, id_usuario_receptor:int) -> dict:
+    
+    query = INSERT_COMPARTIDO
 
     params = {
         "id_usuario_receptor": id_usuario_receptor,
@@ -43,7 +57,7 @@ def create_compartido(id_usuario_comparte: int,id_archivo_compartido:int, id_usu
     }
 
     # Ejecuta la inserción y confirma cambios
-    execute_query_json(query, params=params, needs_commit=True)
+    execute_query(query, params=params, needs_commit=True)
 
     # Devuelve solo el nombre y datos por defecto
     return {
@@ -54,3 +68,22 @@ def create_compartido(id_usuario_comparte: int,id_archivo_compartido:int, id_usu
         "id_tipo_acceso": params["id_tipo_acceso"],
 
     }
+
+
+def create_compartidos_batch(compartidos: List[Compartidos]) -> List[dict]:
+    """
+    Inserta varios compartidos con un solo executemany y un solo commit.
+    Devuelve el resultado de cada fila (p. ej. duplicados de la PK fallan solos).
+    """
+    rows = [
+        {
+            "id_usuario_receptor": compartido.id_usuario_receptor,
+            "id_usuario_comparte": compartido.id_usuario_comparte,
+            "id_archivo_compartido": compartido.id_archivo_compartido,
+            "id_tipo_acceso": compartido.id_tipo_acceso or 1,
+        }
+        for compartido in compartidos
+    ]
+
+    errors = execute_many(INSERT_COMPARTIDO, rows)
+    return batch_results(rows, errors)
@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 import logging
 import firebase_admin
 import requests
@@ -8,8 +9,9 @@ from fastapi import HTTPException
 from firebase_admin import credentials, auth as firebase_auth
 from dotenv import load_dotenv
 
-from utils.database import execute_query_json
+from utils.database import execute_query, execute_query_async
 from utils.security import create_jwt_token
+from utils.statements import register_statement
 from models.userregister import UserRegister
 from models.userlogin import UserLogin, Usuario
 
@@ -19,21 +21,48 @@ logger = logging.getLogger(__name__)
 # Detectar ruta del proyecto y del JSON de Firebase
 BASE_DIR = Path(__file__).resolve().parent.parent
 SERVICE_ACCOUNT_PATH = BASE_DIR / "secrets" / "credenciales.json"
-print(f"Usando service account: {SERVICE_ACCOUNT_PATH}")
 
-# Inicializar Firebase solo si no está inicializado
-if not firebase_admin._apps:
-    cred = credentials.Certificate(str(SERVICE_ACCOUNT_PATH))
-    firebase_admin.initialize_app(cred)
+
+def init_firebase():
+    """
+    Inicializar Firebase solo si no está inicializado. Se hace al primer uso
+    para que la API pueda arrancar sin credenciales (p. ej. con DB_BACKEND=sqlite).
+    """
+    if not firebase_admin._apps:
+        logger.info(f"Usando service account: {SERVICE_ACCOUNT_PATH}")
+        cred = credentials.Certificate(str(SERVICE_ACCOUNT_PATH))
+        firebase_admin.initialize_app(cred)
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Búsquedas de una sola fila: prefetchrows=2 las resuelve en el mismo viaje del execute
+SELECT_USUARIO_LOGIN = register_statement("usuarios.login", """
+        SELECT correo_electronico, nombre, apellido
+        FROM usuarios2
+        WHERE correo_electronico = :correo_electronico
+
+    """, arraysize=1, prefetchrows=2)
+
+SELECT_USUARIO_POR_CORREO = register_statement("usuarios.por_correo", """
+        SELECT 
+            id_usuario,
+            nombre,
+            apellido,
+            correo_electronico,
+            id_pais,
+            id_almacenamiento
+        FROM USUARIOS2
+        WHERE correo_electronico = :correo
+    """, arraysize=1, prefetchrows=2)
+
 
 async def register_user_firebase(user: UserRegister) -> dict:
     try:
+        init_firebase()
         # Crear usuario en Firebase
-        user_record = firebase_auth.create_user(
+        user_record = await asyncio.to_thread(
+            firebase_auth.create_user,
             email=user.correo_electronico,
             password=user.contrasena
         )
@@ -66,13 +95,12 @@ async def register_user_firebase(user: UserRegister) -> dict:
     }
 
     try:
-        result_json = execute_query_json(
+        return await execute_query_async(
             query,
             params=params,
             needs_commit=True,
             returning_vars=returning_vars
         )
-        return json.loads(result_json)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al registrar usuario: {e}")
 
@@ -82,7 +110,7 @@ async def login_user_firebase(user: UserLogin):
     url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={api_key}"
 
     payload = {"email": user.correo_electronico, "password": user.contrasena, "returnSecureToken": True}
-    response = requests.post(url, json=payload)
+    response = await asyncio.to_thread(requests.post, url, json=payload)
     response_data = response.json()
 
     if "error" in response_data:
@@ -92,16 +120,10 @@ async def login_user_firebase(user: UserLogin):
             detail=f"Error al autenticar usuario: {response_data['error']['message']}"
         )
 
-    query = """
-        SELECT correo_electronico, nombre, apellido
-        FROM usuarios2
-        WHERE correo_electronico = :correo_electronico
-
-    """
+    query = SELECT_USUARIO_LOGIN
 
     try:
-        result_json =  execute_query_json(query, (user.correo_electronico,), needs_commit=False)
-        result_dict = json.loads(result_json)
+        result_dict = await execute_query_async(query, (user.correo_electronico,), needs_commit=False)
 
         if not result_dict:
             raise HTTPException(status_code=404, detail="Usuario no encontrado en la base de datos")
@@ -122,19 +144,8 @@ async def login_user_firebase(user: UserLogin):
 
 #Usuario autenticado 
 def get_usuario_por_correo(correo: str) -> Usuario | None:
-    query = """
-        SELECT 
-            id_usuario,
-            nombre,
-            apellido,
-            correo_electronico,
-            id_pais,
-            id_almacenamiento
-        FROM USUARIOS2
-        WHERE correo_electronico = :correo
-    """
-    result = execute_query_json(query, params={"correo": correo})
-    usuarios = json.loads(result)
+    query = SELECT_USUARIO_POR_CORREO
+    usuarios = execute_query(query, params={"correo": correo})
     if usuarios:
         u = usuarios[0] 
         return Usuario(
@@ -0,0 +1,20 @@
+from utils.database import execute_query
+from utils.statements import register_statement
+from utils.cache import register_reference_cache
+
+# Tablas de referencia: cambian casi nunca, se sirven desde memoria
+SELECT_PAISES = register_statement("paises.listar", "SELECT id_pais, nombre FROM paises ORDER BY nombre", arraysize=50)
+SELECT_TIPOS_ARCHIVOS = register_statement(
+    "tipos_archivos.listar",
+    "SELECT id_tipo_archivo, nombre, extension FROM tipos_archivos ORDER BY id_tipo_archivo",
+    arraysize=50
+)
+SELECT_TIPOS_ACCESOS = register_statement(
+    "tipos_accesos.listar",
+    "SELECT id_tipo_acceso, tipo_acceso, enlace, rol FROM tipos_accesos ORDER BY id_tipo_acceso",
+    arraysize=50
+)
+
+paises_cache = register_reference_cache("paises", lambda: execute_query(SELECT_PAISES))
+tipos_archivos_cache = register_reference_cache("tipos_archivos", lambda: execute_query(SELECT_TIPOS_ARCHIVOS))
+tipos_accesos_cache = register_reference_cache("tipos_accesos", lambda: execute_query(SELECT_TIPOS_ACCESOS))
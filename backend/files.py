@@ -2,26 +2,50 @@
 # Responsable de la gestión completa de archivos en el sistema Drive
 
 import os
-import hashlib
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any, BinaryIO
 from pathlib import Path
 
+from blobs import BlobStore
+from accounting import DEFAULT_QUOTA, QuotaExceededError, StorageAccounting
+from permissions import ACCESS_RANK, FILE, FOLDER, PermissionResolver
+from rollups import FolderRollups
+from search import SearchIndex
+from utils.compression import select_codec
+from thumbnails import PENDING as THUMBNAIL_PENDING, THUMBNAIL_SIZES, render_thumbnail, thumbnail_dir, thumbnail_name, thumbnail_url
+from utils.cache import ReferenceCache
+from utils.metrics import execute
+
 class FileManager:
     """
     Gestor de archivos con soporte para subida, descarga, 
     organización en carpetas y operaciones CRUD completas.
     """
     
-    def __init__(self, db_connection, storage_path: str = "./storage"):
+    def __init__(self, db_connection, storage_path: str = "./storage", thumbnail_pipeline=None,
+                 permissions: Optional[PermissionResolver] = None, accounting: Optional[StorageAccounting] = None):
         """
         Inicializa el gestor de archivos.
         
         Args:
             db_connection: Conexión a la base de datos Oracle
             storage_path: Ruta base para almacenamiento de archivos
+            thumbnail_pipeline: ThumbnailPipeline para generar miniaturas en segundo
+                                plano (sin él se generan en línea durante la subida)
+            permissions: PermissionResolver compartido con FolderManager
+            accounting: StorageAccounting del proceso (sin ella el espacio usado se
+                        actualiza en la base en cada subida)
         """
         self.db = db_connection
+        self.thumbnail_pipeline = thumbnail_pipeline
+        self.permissions = permissions or PermissionResolver(db_connection)
+        self.accounting = accounting
+        
+        # Índice de nombres para search_files (se mantiene al crear, renombrar y purgar)
+        self.search_index = SearchIndex(db_connection)
+        
+        # Totales recursivos de las carpetas que contienen cada archivo
+        self.rollups = FolderRollups(db_connection)
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(exist_ok=True)
         
@@ -37,6 +61,15 @@ class FileManager:
         
         # Límite de tamaño por archivo (100MB por defecto)
         self.max_file_size = 100 * 1024 * 1024
+        
+        # Buffer de lectura/escritura en subidas: acota la memoria por subida
+        self.upload_buffer_size = 1024 * 1024
+        
+        # Contenidos deduplicados por hash: los registros de archivos apuntan a blobs compartidos
+        self.blobs = BlobStore(db_connection, storage_path, buffer_size=self.upload_buffer_size)
+        
+        # Caché de la tabla tipo_archivo (nombre -> id), evita una consulta por subida
+        self.file_types = ReferenceCache("tipo_archivo", self.load_file_types)
     
     def upload_file(self, user_id: str, file_data: BinaryIO, filename: str,
                    folder_id: Optional[str] = None) -> Dict[str, Any]:
@@ -52,15 +85,9 @@ class FileManager:
         Returns:
             Dict con información del archivo subido
         """
+        blob = None
+        registered = False
         try:
-            # Validar tamaño del archivo
-            file_data.seek(0, 2)  # Ir al final
-            file_size = file_data.tell()
-            file_data.seek(0)  # Volver al inicio
-            
-            if file_size > self.max_file_size:
-                raise ValueError(f"Archivo demasiado grande. Máximo: {self.max_file_size / (1024*1024):.1f}MB")
-            
             # Validar permisos de carpeta si se especifica
             if folder_id:
                 if not self.validate_folder_access(user_id, folder_id, "write"):
@@ -69,27 +96,30 @@ class FileManager:
             # Determinar tipo de archivo
             file_type = self.determine_file_type(filename)
             
-            # Generar ID único y hash del archivo
+            # Generar ID único
             file_id = self.generate_file_id()
-            file_hash = self.calculate_file_hash(file_data)
-            file_data.seek(0)  # Resetear posición
-            
-            # Crear estructura de carpetas de almacenamiento
-            storage_dir = self.storage_path / user_id[:2] / user_id[2:4]
-            storage_dir.mkdir(parents=True, exist_ok=True)
             
-            # Guardar archivo físicamente
-            file_extension = Path(filename).suffix.lower()
-            stored_filename = f"{file_id}{file_extension}"
-            storage_file_path = storage_dir / stored_filename
+            # Recibir contenido: hash, tamaño y escritura en una sola pasada; si el
+            # hash ya existe no se escribe nada. El contenido nuevo se publica y la
+            # referencia al blob se suma al insertar el registro, en la misma transacción
+            blob = self.blobs.ingest(file_data, self.max_file_size, codec=select_codec(file_type, filename))
+            file_size = blob['file_size']
+            file_hash = blob['file_hash']
+            storage_file_path = Path(blob['storage_path'])
             
-            with open(storage_file_path, 'wb') as f:
-                f.write(file_data.read())
+            # El tamaño real se conoce al terminar de leer: la cuota se valida aquí
+            self.check_storage_quota(user_id, file_size)
             
-            # Generar thumbnail si es imagen
+            # Generar thumbnail si es imagen: en segundo plano si hay pipeline
             thumbnail_url = None
+            thumbnail_status = None
             if file_type == 'image':
-                thumbnail_url = self.generate_thumbnail(storage_file_path, file_id)
+                if self.thumbnail_pipeline:
+                    thumbnail_status = THUMBNAIL_PENDING
+                else:
+                    # El contenido nuevo aún no está publicado: se lee del temporal
+                    source = Path(blob['temp_path']) if blob['temp_path'] else storage_file_path
+                    thumbnail_url = self.generate_thumbnail(source, file_id, file_hash)
             
             # Insertar en base de datos
             file_record = {
@@ -104,23 +134,30 @@ class FileManager:
                 'storage_path': str(storage_file_path),
                 'url': f"/api/files/{file_id}/download",
                 'thumbnail_url': thumbnail_url,
+                'thumbnail_status': thumbnail_status,
                 'created_at': datetime.now(),
                 'updated_at': datetime.now(),
                 'is_deleted': False
             }
             
-            self.insert_file_record(file_record)
+            self.insert_file_record(file_record, blob)
+            registered = True
+            storage_file_path = Path(file_record['storage_path'])
             
             # Actualizar estadísticas de almacenamiento
             self.update_user_storage(user_id, file_size)
             
+            # Encolar miniaturas una vez que el registro existe
+            if thumbnail_status == THUMBNAIL_PENDING:
+                self.thumbnail_pipeline.submit(file_id, file_hash, storage_file_path)
+            
             return file_record
             
-        except Exception as e:
-            # Limpiar archivo físico si hay error
-            if 'storage_file_path' in locals() and storage_file_path.exists():
-                storage_file_path.unlink()
-            raise e
+        finally:
+            # Sin registro confirmado no se contó la referencia: solo sobran el
+            # temporal y, si llegó a publicarse, la copia que nadie registró
+            if blob is not None:
+                self.blobs.finish(blob, registered)
     
     def list_folder_files(self, user_id: str, folder_id: Optional[str] = None,
                          include_deleted: bool = False) -> List[Dict[str, Any]]:
@@ -151,7 +188,8 @@ class FileManager:
         SELECT a.id, a.nombre as name, a.nombre_original as original_name,
                ta.nombre as file_type, a.tamaño as file_size,
                a.carpeta_id as folder_id, a.usuario_id as user_id,
-               a.url, a.thumbnail_url, a.fecha_creacion as created_at,
+               a.url, a.thumbnail_url, a.estado_miniatura as thumbnail_status,
+               a.fecha_creacion as created_at,
                a.fecha_actualizacion as updated_at, a.eliminado as is_deleted
         FROM archivos a
         LEFT JOIN tipo_archivo ta ON a.tipo_archivo_id = ta.id
@@ -159,9 +197,48 @@ class FileManager:
         ORDER BY a.nombre
         """
         
-        cursor = self.db.execute(query, params)
+        cursor = self._execute("list_folder_files", query, params)
         return [dict(row) for row in cursor.fetchall()]
     
+    def list_shared_files(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Listar los archivos que otros usuarios compartieron con este, con su nivel
+        de acceso, en una sola consulta. Los niveles quedan en la ACL: abrir o
+        descargar los archivos listados no vuelve a consultar permisos.
+        
+        Args:
+            user_id: ID del usuario
+            
+        Returns:
+            Lista de archivos (con access_type), de más a menos reciente
+        """
+        query = """
+        SELECT a.id, a.nombre as name, a.nombre_original as original_name,
+               ta.nombre as file_type, a.tamaño as file_size,
+               a.carpeta_id as folder_id, a.usuario_id as user_id,
+               a.url, a.thumbnail_url, a.estado_miniatura as thumbnail_status,
+               a.fecha_creacion as created_at,
+               a.fecha_actualizacion as updated_at, a.eliminado as is_deleted,
+               acceso.nombre as access_type
+        FROM compartidos s
+        JOIN usuarios u ON u.email = s.email_compartido
+        JOIN tipo_acceso acceso ON acceso.id = s.tipo_acceso_id
+        JOIN archivos a ON a.id = s.archivo_id
+        LEFT JOIN tipo_archivo ta ON a.tipo_archivo_id = ta.id
+        WHERE u.id = :user_id AND s.activo = 1 AND a.eliminado = 0 AND a.usuario_id <> :user_id
+        ORDER BY a.fecha_actualizacion DESC, a.id
+        """
+        
+        files: Dict[str, Dict[str, Any]] = {}
+        for row in self._execute("list_shared_files", query, {'user_id': user_id}).fetchall():
+            current = files.get(row['id'])
+            # Varios compartidos del mismo archivo: gana el de mayor nivel
+            if current is None or ACCESS_RANK.get(row['access_type'], 0) > ACCESS_RANK.get(current['access_type'], 0):
+                files[row['id']] = dict(row)
+        
+        self.permissions.remember(user_id, {(FILE, file_id): row['access_type'] for file_id, row in files.items()})
+        return list(files.values())
+    
     def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
         """
         Obtener información de un archivo específico.
@@ -176,15 +253,18 @@ class FileManager:
         SELECT a.id, a.nombre as name, a.nombre_original as original_name,
                ta.nombre as file_type, a.tamaño as file_size,
                a.carpeta_id as folder_id, a.usuario_id as user_id,
-               a.ruta_almacenamiento as storage_path, a.url, a.thumbnail_url,
+               a.hash_archivo as file_hash, a.ruta_almacenamiento as storage_path,
+               a.url, a.thumbnail_url, a.estado_miniatura as thumbnail_status,
                a.fecha_creacion as created_at, a.fecha_actualizacion as updated_at,
-               a.eliminado as is_deleted
+               a.eliminado as is_deleted,
+               COALESCE(b.codec, 'identity') as storage_codec, b.tamaño_fisico as stored_size
         FROM archivos a
         LEFT JOIN tipo_archivo ta ON a.tipo_archivo_id = ta.id
+        LEFT JOIN blobs b ON b.hash_archivo = a.hash_archivo
         WHERE a.id = :file_id
         """
         
-        cursor = self.db.execute(query, {'file_id': file_id})
+        cursor = self._execute("get_file", query, {'file_id': file_id})
         row = cursor.fetchone()
         
         return dict(row) if row else None
@@ -200,6 +280,25 @@ class FileManager:
         Returns:
             Tuple con (filename, file_data)
         """
+        file_info = self.resolve_download(user_id, file_id)
+        
+        # Abrir archivo para lectura (descomprimiendo por bloques si se guardó comprimido)
+        file_data = self.blobs.open(file_info['file_hash'])
+        
+        return file_info['original_name'], file_data
+    
+    def resolve_download(self, user_id: str, file_id: str) -> Dict[str, Any]:
+        """
+        Validar una descarga y devolver la información del archivo sin abrirlo, para
+        que la respuesta HTTP lo envíe directamente desde disco (rangos, sendfile).
+        
+        Args:
+            user_id: ID del usuario
+            file_id: ID del archivo
+            
+        Returns:
+            Diccionario con información del archivo (incluye storage_path y file_hash)
+        """
         # Obtener información del archivo
         file_info = self.get_file(file_id)
         if not file_info:
@@ -214,10 +313,7 @@ class FileManager:
         if not storage_path.exists():
             raise FileNotFoundError("Archivo físico no encontrado")
         
-        # Abrir archivo para lectura
-        file_data = open(storage_path, 'rb')
-        
-        return file_info['original_name'], file_data
+        return file_info
     
     def delete_file(self, user_id: str, file_id: str) -> bool:
         """
@@ -238,7 +334,7 @@ class FileManager:
             query = """
             UPDATE archivos 
             SET eliminado = 1, fecha_actualizacion = :updated_at
-            WHERE id = :file_id AND usuario_id = :user_id
+            WHERE id = :file_id AND usuario_id = :user_id AND eliminado = 0
             """
             
             params = {
@@ -247,7 +343,9 @@ class FileManager:
                 'user_id': user_id
             }
             
-            cursor = self.db.execute(query, params)
+            cursor = self._execute("delete_file", query, params)
+            if cursor.rowcount > 0:
+                self.rollups.count_file(file_id, -1)
             self.db.commit()
             
             return cursor.rowcount > 0
@@ -270,7 +368,7 @@ class FileManager:
         try:
             query = """
             UPDATE archivos 
-            SET eliminado = 0, fecha_actualizacion = :updated_at
+            SET eliminado = 0, papelera_id = NULL, fecha_actualizacion = :updated_at
             WHERE id = :file_id AND usuario_id = :user_id AND eliminado = 1
             """
             
@@ -280,7 +378,9 @@ class FileManager:
                 'user_id': user_id
             }
             
-            cursor = self.db.execute(query, params)
+            cursor = self._execute("restore_file", query, params)
+            if cursor.rowcount > 0:
+                self.rollups.count_file(file_id, 1)
             self.db.commit()
             
             return cursor.rowcount > 0
@@ -289,6 +389,52 @@ class FileManager:
             self.db.rollback()
             raise e
     
+    def purge_file(self, user_id: str, file_id: str) -> bool:
+        """
+        Eliminación definitiva de archivo: borra el registro y sus compartidos,
+        y libera su referencia al blob (el contenido se borra con la última).
+        
+        Args:
+            user_id: ID del usuario
+            file_id: ID del archivo
+            
+        Returns:
+            True si se eliminó exitosamente
+        """
+        try:
+            query = """
+            SELECT hash_archivo, tamaño, eliminado
+            FROM archivos
+            WHERE id = :file_id AND usuario_id = :user_id
+            """
+            
+            params = {'file_id': file_id, 'user_id': user_id}
+            
+            row = self._execute("purge_file.select", query, params).fetchone()
+            if not row:
+                return False
+            
+            file_hash, file_size = row[0], row[1]
+            if not row[2]:
+                self.rollups.count_file(file_id, -1)
+            
+            self._execute("purge_file.shares", "DELETE FROM compartidos WHERE archivo_id = :file_id", {'file_id': file_id})
+            self._execute("purge_file", "DELETE FROM archivos WHERE id = :file_id AND usuario_id = :user_id", params)
+            self.search_index.remove(FILE, file_id)
+            # La referencia se quita en la misma transacción; el archivo físico, tras confirmarla
+            removed_blobs = self.blobs.release_many({file_hash: 1}) if file_hash else []
+            self.db.commit()
+            
+        except Exception as e:
+            self.db.rollback()
+            raise e
+        
+        self.permissions.invalidate((FILE, file_id))
+        self.blobs.unlink_many(removed_blobs)
+        self.update_user_storage(user_id, -file_size)
+        
+        return True
+    
     def move_file(self, user_id: str, file_id: str, 
                  target_folder_id: Optional[str]) -> bool:
         """
@@ -303,14 +449,22 @@ class FileManager:
             True si se movió exitosamente
         """
         try:
-            # Validar permisos del archivo
-            if not self.validate_file_access(user_id, file_id, "write"):
+            # Validar permisos del archivo y de la carpeta destino en una sola consulta
+            resources = [(FILE, file_id)] + ([(FOLDER, target_folder_id)] if target_folder_id else [])
+            allowed = self.permissions.check_many(user_id, resources, "write")
+            if not allowed[(FILE, file_id)]:
                 raise PermissionError("No tienes permisos para mover este archivo")
-            
-            # Validar permisos de la carpeta destino
-            if target_folder_id:
-                if not self.validate_folder_access(user_id, target_folder_id, "write"):
-                    raise PermissionError("No tienes permisos en la carpeta de destino")
+            if target_folder_id and not allowed[(FOLDER, target_folder_id)]:
+                raise PermissionError("No tienes permisos en la carpeta de destino")
+            
+            row = self._execute(
+                "move_file.select",
+                "SELECT eliminado FROM archivos WHERE id = :file_id AND usuario_id = :user_id",
+                {'file_id': file_id, 'user_id': user_id},
+            ).fetchone()
+            if not row:
+                return False
+            counted = not row[0]
             
             query = """
             UPDATE archivos 
@@ -325,7 +479,12 @@ class FileManager:
                 'user_id': user_id
             }
             
-            cursor = self.db.execute(query, params)
+            # Los totales pasan de las carpetas de origen a las de destino
+            if counted:
+                self.rollups.count_file(file_id, -1)
+            cursor = self._execute("move_file", query, params)
+            if counted:
+                self.rollups.count_file(file_id, 1)
             self.db.commit()
             
             return cursor.rowcount > 0
@@ -334,38 +493,86 @@ class FileManager:
             self.db.rollback()
             raise e
     
-    def search_files(self, user_id: str, search_term: str) -> List[Dict[str, Any]]:
+    def search_files(self, user_id: str, search_term: str, limit: int = 100) -> List[Dict[str, Any]]:
         """
-        Buscar archivos por nombre.
+        Buscar archivos por nombre usando el índice de búsqueda: cada término coincide
+        como prefijo de una palabra del nombre (sin acentos ni mayúsculas) y, si no hay
+        ninguna, de forma aproximada.
         
         Args:
             user_id: ID del usuario
-            search_term: Término de búsqueda
+            search_term: Términos de búsqueda
+            limit: Máximo de resultados
             
         Returns:
-            Lista de archivos que coinciden
+            Lista de archivos encontrados, de más a menos reciente
         """
-        query = """
+        matches, _ = self.search_index.search(user_id, search_term, kinds=(FILE,), limit=limit)
+        if not matches:
+            return []
+        
+        ids = [match['id'] for match in matches]
+        placeholders = ", ".join(f":id{i}" for i in range(len(ids)))
+        query = f"""
         SELECT a.id, a.nombre as name, a.nombre_original as original_name,
                ta.nombre as file_type, a.tamaño as file_size,
                a.carpeta_id as folder_id, a.usuario_id as user_id,
-               a.url, a.thumbnail_url, a.fecha_creacion as created_at,
+               a.url, a.thumbnail_url, a.estado_miniatura as thumbnail_status,
+               a.fecha_creacion as created_at,
                a.fecha_actualizacion as updated_at
         FROM archivos a
         LEFT JOIN tipo_archivo ta ON a.tipo_archivo_id = ta.id
-        WHERE a.usuario_id = :user_id 
-        AND a.eliminado = 0
-        AND UPPER(a.nombre) LIKE UPPER(:search_term)
-        ORDER BY a.fecha_actualizacion DESC
+        WHERE a.id IN ({placeholders})
         """
         
-        params = {
-            'user_id': user_id,
-            'search_term': f'%{search_term}%'
-        }
+        params = {f"id{i}": file_id for i, file_id in enumerate(ids)}
         
-        cursor = self.db.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+        cursor = self._execute("search_files", query, params)
+        rows = {row['id']: dict(row) for row in cursor.fetchall()}
+        return [rows[file_id] for file_id in ids if file_id in rows]
+    
+    def rename_file(self, user_id: str, file_id: str, new_name: str) -> bool:
+        """
+        Renombrar archivo y reindexar su nombre.
+        
+        Args:
+            user_id: ID del usuario
+            file_id: ID del archivo
+            new_name: Nombre nuevo
+            
+        Returns:
+            True si se renombró exitosamente
+        """
+        try:
+            if not new_name or not new_name.strip():
+                raise ValueError("El nombre no puede estar vacío")
+            
+            if not self.validate_file_access(user_id, file_id, "write"):
+                raise PermissionError("No tienes permisos para renombrar este archivo")
+            
+            query = """
+            UPDATE archivos 
+            SET nombre = :name, fecha_actualizacion = :updated_at
+            WHERE id = :file_id
+            """
+            
+            params = {
+                'name': new_name.strip(),
+                'updated_at': datetime.now(),
+                'file_id': file_id
+            }
+            
+            cursor = self._execute("rename_file", query, params)
+            if cursor.rowcount > 0:
+                owner = self.get_file(file_id)['user_id']
+                self.search_index.rename(FILE, file_id, owner, params['name'])
+            self.db.commit()
+            
+            return cursor.rowcount > 0
+            
+        except Exception as e:
+            self.db.rollback()
+            raise e
     
     def get_recent_files(self, user_id: str, days: int = 30) -> List[Dict[str, Any]]:
         """
@@ -382,21 +589,27 @@ class FileManager:
         SELECT a.id, a.nombre as name, a.nombre_original as original_name,
                ta.nombre as file_type, a.tamaño as file_size,
                a.carpeta_id as folder_id, a.usuario_id as user_id,
-               a.url, a.thumbnail_url, a.fecha_creacion as created_at,
+               a.url, a.thumbnail_url, a.estado_miniatura as thumbnail_status,
+               a.fecha_creacion as created_at,
                a.fecha_actualizacion as updated_at
         FROM archivos a
         LEFT JOIN tipo_archivo ta ON a.tipo_archivo_id = ta.id
         WHERE a.usuario_id = :user_id 
         AND a.eliminado = 0
-        AND a.fecha_actualizacion >= (SYSDATE - :days)
+        AND a.fecha_actualizacion >= :since
         ORDER BY a.fecha_actualizacion DESC
         """
         
-        cursor = self.db.execute(query, {'user_id': user_id, 'days': days})
+        params = {'user_id': user_id, 'since': datetime.now() - timedelta(days=days)}
+        cursor = self._execute("get_recent_files", query, params)
         return [dict(row) for row in cursor.fetchall()]
     
     # Métodos auxiliares
     
+    def _execute(self, name: str, query: str, params: Optional[Dict[str, Any]] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"files.{name}", query, params)
+    
     def determine_file_type(self, filename: str) -> str:
         """Determinar tipo de archivo basado en extensión."""
         extension = Path(filename).suffix.lower()
@@ -407,34 +620,15 @@ class FileManager:
         
         return 'other'
     
-    def calculate_file_hash(self, file_data: BinaryIO) -> str:
-        """Calcular hash SHA-256 del archivo."""
-        hash_sha256 = hashlib.sha256()
-        file_data.seek(0)
-        for chunk in iter(lambda: file_data.read(4096), b""):
-            hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
-    
-    def generate_thumbnail(self, image_path: Path, file_id: str) -> Optional[str]:
-        """Generar thumbnail para imágenes."""
+    def generate_thumbnail(self, image_path: Path, file_id: str, file_hash: str) -> Optional[str]:
+        """Generar el thumbnail por defecto en línea (los demás tamaños se generan al pedirlos)."""
         try:
-            from PIL import Image
-            
-            # Crear directorio de thumbnails
-            thumb_dir = self.storage_path / "thumbnails"
-            thumb_dir.mkdir(exist_ok=True)
-            
-            # Generar thumbnail
-            with Image.open(image_path) as img:
-                img.thumbnail((200, 200))
-                thumb_path = thumb_dir / f"{file_id}_thumb.jpg"
-                img.save(thumb_path, "JPEG", quality=85)
-                
-                return f"/api/thumbnails/{file_id}_thumb.jpg"
-                
-        except ImportError:
-            # PIL no disponible
-            return None
+            output = thumbnail_dir(self.storage_path / "thumbnails", file_hash) / thumbnail_name("medium", "webp")
+            if not output.exists():
+                if render_thumbnail(str(image_path), str(output), THUMBNAIL_SIZES["medium"], "webp") is None:
+                    # PIL no disponible
+                    return None
+            return thumbnail_url(file_id)
         except Exception:
             # Error generando thumbnail
             return None
@@ -442,7 +636,7 @@ class FileManager:
     def validate_file_access(self, user_id: str, file_id: str, 
                            access_type: str = "read") -> bool:
         """
-        Validar permisos de acceso a un archivo.
+        Validar permisos de acceso a un archivo (propietario o compartido).
         
         Args:
             user_id: ID del usuario
@@ -452,91 +646,102 @@ class FileManager:
         Returns:
             True si tiene permisos
         """
-        # Verificar si es propietario
-        file_info = self.get_file(file_id)
-        if file_info and file_info['user_id'] == user_id:
-            return True
-        
-        # Verificar permisos compartidos
-        query = """
-        SELECT ta.nombre as access_type
-        FROM compartidos c
-        JOIN usuarios u ON u.email = c.email_compartido
-        JOIN tipo_acceso ta ON ta.id = c.tipo_acceso_id
-        WHERE c.archivo_id = :file_id 
-        AND u.id = :user_id 
-        AND c.activo = 1
-        """
-        
-        cursor = self.db.execute(query, {'file_id': file_id, 'user_id': user_id})
-        result = cursor.fetchone()
-        
-        if not result:
-            return False
-        
-        shared_access = result[0]
-        if access_type == "read":
-            return shared_access in ["solo_lectura", "lectura_escritura"]
-        elif access_type == "write":
-            return shared_access == "lectura_escritura"
-        
-        return False
+        return self.permissions.check(user_id, (FILE, file_id), access_type)
     
     def validate_folder_access(self, user_id: str, folder_id: str, 
                               access_type: str = "read") -> bool:
-        """
-        Validar permisos de acceso a una carpeta.
-        Implementación simplificada - en producción sería más compleja.
-        """
-        # Por ahora, asumimos que si el usuario puede ver la carpeta, puede acceder
-        query = """
-        SELECT usuario_id 
-        FROM carpetas 
-        WHERE id = :folder_id
-        """
-        
-        cursor = self.db.execute(query, {'folder_id': folder_id})
-        result = cursor.fetchone()
-        
-        return result and result[0] == user_id
+        """Validar permisos de acceso a una carpeta (propietario o compartida)."""
+        return self.permissions.check(user_id, (FOLDER, folder_id), access_type)
+    
+    def share_file(self, user_id: str, file_id: str, email: str, access_type: str) -> None:
+        """Compartir un archivo propio con un email (invalida la ACL en todos los hilos)."""
+        self.permissions.share(user_id, (FILE, file_id), email, access_type)
+    
+    def unshare_file(self, user_id: str, file_id: str, email: str) -> bool:
+        """Dejar de compartir un archivo propio con un email."""
+        return self.permissions.unshare(user_id, (FILE, file_id), email)
     
-    def insert_file_record(self, file_record: Dict[str, Any]) -> None:
-        """Insertar registro de archivo en la base de datos."""
+    def insert_file_record(self, file_record: Dict[str, Any], blob: Optional[Dict[str, Any]] = None) -> None:
+        """Insertar registro de archivo en la base de datos, con la referencia a su blob si se pasa."""
         # Obtener ID del tipo de archivo
         type_id = self.get_file_type_id(file_record['file_type'])
         
         query = """
         INSERT INTO archivos (id, nombre, nombre_original, tipo_archivo_id, 
                             tamaño, hash_archivo, carpeta_id, usuario_id,
-                            ruta_almacenamiento, url, thumbnail_url,
+                            ruta_almacenamiento, url, thumbnail_url, estado_miniatura,
                             fecha_creacion, fecha_actualizacion, eliminado)
         VALUES (:id, :name, :original_name, :type_id, :file_size, :file_hash,
-               :folder_id, :user_id, :storage_path, :url, :thumbnail_url,
+               :folder_id, :user_id, :storage_path, :url, :thumbnail_url, :thumbnail_status,
                :created_at, :updated_at, :is_deleted)
         """
         
         params = {**file_record, 'type_id': type_id}
         
-        self.db.execute(query, params)
-        self.db.commit()
+        try:
+            if blob:
+                # Si otra subida registró antes el mismo contenido, el archivo apunta a su ruta
+                params['storage_path'] = file_record['storage_path'] = self.blobs.add_reference(blob)['storage_path']
+            self._execute("insert_file_record", query, params)
+            self.search_index.add(FILE, file_record['id'], file_record['user_id'], file_record['name'])
+            if not file_record['is_deleted']:
+                self.rollups.count_file(file_record['id'], 1)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+    
+    def load_file_types(self) -> List[Dict[str, Any]]:
+        """Cargar la tabla tipo_archivo para la caché de referencia."""
+        cursor = self._execute("load_file_types", "SELECT id, nombre FROM tipo_archivo")
+        return [{'id': row[0], 'nombre': row[1]} for row in cursor.fetchall()]
     
     def get_file_type_id(self, file_type: str) -> int:
-        """Obtener ID del tipo de archivo."""
-        query = "SELECT id FROM tipo_archivo WHERE nombre = :file_type"
-        cursor = self.db.execute(query, {'file_type': file_type})
-        result = cursor.fetchone()
+        """Obtener ID del tipo de archivo (desde la caché de referencia)."""
+        for row in self.file_types.rows():
+            if row['nombre'] == file_type:
+                return row['id']
         
-        if result:
-            return result[0]
-        else:
-            # Crear tipo si no existe
-            query = "INSERT INTO tipo_archivo (nombre) VALUES (:file_type)"
-            self.db.execute(query, {'file_type': file_type})
+        # Crear tipo si no existe (otra subida concurrente puede haberlo creado ya)
+        query = "INSERT OR IGNORE INTO tipo_archivo (nombre) VALUES (:file_type)"
+        try:
+            self._execute("get_file_type_id", query, {'file_type': file_type})
             self.db.commit()
-            return self.db.lastrowid
+        except Exception:
+            self.db.rollback()
+            raise
+        self.file_types.invalidate()
+        
+        query = "SELECT id FROM tipo_archivo WHERE nombre = :file_type"
+        return self._execute("get_file_type_id.select", query, {'file_type': file_type}).fetchone()[0]
+    
+    def get_storage_usage(self, user_id: str) -> Dict[str, int]:
+        """Espacio usado y total del usuario (en memoria si hay contabilidad diferida)."""
+        if self.accounting:
+            return self.accounting.usage(user_id)
+        
+        query = "SELECT espacio_usado, espacio_total FROM almacenamiento WHERE usuario_id = :user_id"
+        row = self._execute("get_storage_usage", query, {'user_id': user_id}).fetchone()
+        return {'used': row[0], 'total': row[1]} if row else {'used': 0, 'total': DEFAULT_QUOTA}
+    
+    def check_storage_quota(self, user_id: str, size: int) -> None:
+        """Lanza QuotaExceededError si el archivo no cabe en el espacio libre del usuario."""
+        if self.accounting:
+            self.accounting.check_quota(user_id, size)
+            return
+        
+        usage = self.get_storage_usage(user_id)
+        if usage['used'] + size > usage['total']:
+            free = max(usage['total'] - usage['used'], 0)
+            raise QuotaExceededError(f"Espacio insuficiente: quedan {free / (1024*1024):.1f}MB libres")
     
     def update_user_storage(self, user_id: str, size_change: int) -> None:
         """Actualizar estadísticas de almacenamiento del usuario."""
+        if self.accounting:
+            # Escritura diferida: se anota en el diario y se vuelca por lotes
+            self.accounting.record(user_id, size_change)
+            return
+        
         query = """
         UPDATE almacenamiento 
         SET espacio_usado = espacio_usado + :size_change,
@@ -550,16 +755,16 @@ class FileManager:
             'user_id': user_id
         }
         
-        cursor = self.db.execute(query, params)
+        cursor = self._execute("update_user_storage", query, params)
         
         # Si no existe registro, crear uno
         if cursor.rowcount == 0:
             insert_query = """
             INSERT INTO almacenamiento (usuario_id, espacio_usado, espacio_total, fecha_actualizacion)
-            VALUES (:user_id, :size_change, 16106127360, :updated_at)
-            """  # 15GB por defecto
+            VALUES (:user_id, :size_change, :total, :updated_at)
+            """
             
-            self.db.execute(insert_query, params)
+            self._execute("update_user_storage.insert", insert_query, {**params, 'total': DEFAULT_QUOTA})
         
         self.db.commit()
     
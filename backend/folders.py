@@ -1,8 +1,25 @@
 # Módulo de Carpetas (folders.py)
 # Responsable de la gestión completa de carpetas en el sistema Drive
 
+import uuid
+from collections import Counter
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence
+
+from ancestry import AncestryIndex
+from permissions import FILE, FOLDER, PermissionResolver
+from rollups import FolderRollups
+from search import SearchIndex
+from utils.metrics import execute
+
+# IDs del subárbol de :folder_id (incluida) según la tabla de ancestros
+SUBTREE = "(SELECT descendiente_id FROM carpetas_ancestros WHERE ancestro_id = :folder_id)"
+
+# Columnas de carpetas con los nombres que devuelve FolderManager
+FOLDER_COLUMNS = """id, nombre as name, carpeta_padre_id as parent_folder_id,
+               usuario_id as user_id, fecha_creacion as created_at,
+               fecha_actualizacion as updated_at, eliminado as is_deleted,
+               color"""
 
 class FolderManager:
     """
@@ -10,14 +27,27 @@ class FolderManager:
     permisos de acceso y operaciones CRUD completas.
     """
     
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, permissions: Optional[PermissionResolver] = None, files=None):
         """
         Inicializa el gestor de carpetas.
         
         Args:
             db_connection: Conexión a la base de datos Oracle
+            permissions: PermissionResolver compartido con FileManager
+            files: FileManager de la misma conexión (blobs y espacio usado al purgar)
         """
         self.db = db_connection
+        self.files = files
+        self.permissions = permissions or PermissionResolver(db_connection)
+        self.search_index = SearchIndex(db_connection)
+        
+        # Tabla de cierre para preguntas de ancestros en una consulta
+        self.ancestry = AncestryIndex(db_connection)
+        self.ancestry.ensure()
+        
+        # Totales recursivos por carpeta (se recalculan sobre la tabla de ancestros)
+        self.rollups = FolderRollups(db_connection)
+        self.rollups.ensure()
     
     def create_folder(self, user_id: str, name: str, parent_folder_id: Optional[str] = None, 
                      color: str = "#1a73e8") -> Dict[str, Any]:
@@ -62,7 +92,10 @@ class FolderManager:
                    :created_at, :updated_at, :is_deleted, :color)
             """
             
-            self.db.execute(query, folder_data)
+            self._execute("create_folder", query, folder_data)
+            self.ancestry.add(folder_data['id'], parent_folder_id)
+            self.rollups.add_folder(folder_data['id'])
+            self.search_index.add(FOLDER, folder_data['id'], user_id, name)
             self.db.commit()
             
             return folder_data
@@ -106,7 +139,7 @@ class FolderManager:
         ORDER BY nombre
         """
         
-        cursor = self.db.execute(query, params)
+        cursor = self._execute("list_user_folders", query, params)
         return [dict(row) for row in cursor.fetchall()]
     
     def get_folder(self, folder_id: str) -> Optional[Dict[str, Any]]:
@@ -128,7 +161,7 @@ class FolderManager:
         WHERE id = :folder_id
         """
         
-        cursor = self.db.execute(query, {'folder_id': folder_id})
+        cursor = self._execute("get_folder", query, {'folder_id': folder_id})
         row = cursor.fetchone()
         
         return dict(row) if row else None
@@ -147,14 +180,13 @@ class FolderManager:
             True si se movió exitosamente
         """
         try:
-            # Validar permisos de la carpeta a mover
-            if not self.validate_folder_access(user_id, folder_id, "write"):
+            # Validar permisos de la carpeta a mover y del destino en una sola consulta
+            resources = [(FOLDER, folder_id)] + ([(FOLDER, new_parent_id)] if new_parent_id else [])
+            allowed = self.permissions.check_many(user_id, resources, "write")
+            if not allowed[(FOLDER, folder_id)]:
                 raise PermissionError("No tienes permisos para mover esta carpeta")
-            
-            # Validar permisos del destino
-            if new_parent_id:
-                if not self.validate_folder_access(user_id, new_parent_id, "write"):
-                    raise PermissionError("No tienes permisos en la carpeta de destino")
+            if new_parent_id and not allowed[(FOLDER, new_parent_id)]:
+                raise PermissionError("No tienes permisos en la carpeta de destino")
             
             # Prevenir bucles (carpeta padre no puede ser descendiente)
             if new_parent_id and self.is_descendant(folder_id, new_parent_id):
@@ -174,7 +206,12 @@ class FolderManager:
                 'user_id': user_id
             }
             
-            cursor = self.db.execute(query, params)
+            cursor = self._execute("move_folder", query, params)
+            if cursor.rowcount > 0:
+                # Los totales del subárbol salen de los ancestros viejos y entran en los nuevos
+                self.rollups.shift_subtree(folder_id, -1)
+                self.ancestry.move(folder_id, new_parent_id)
+                self.rollups.shift_subtree(folder_id, 1)
             self.db.commit()
             
             return cursor.rowcount > 0
@@ -183,36 +220,169 @@ class FolderManager:
             self.db.rollback()
             raise e
     
-    def soft_delete_folder(self, user_id: str, folder_id: str) -> bool:
+    def move_items(self, user_id: str, file_ids: Sequence[str], folder_ids: Sequence[str],
+                   target_folder_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Mover un lote de archivos y carpetas a una carpeta en una transacción.
+        Los permisos de todos los elementos y del destino se comprueban con una
+        consulta, los elementos se leen por lotes y los bucles se detectan con
+        los ancestros del destino, que no cambian al mover hacia él.
+        
+        Args:
+            user_id: ID del usuario
+            file_ids: IDs de los archivos a mover
+            folder_ids: IDs de las carpetas a mover
+            target_folder_id: ID de la carpeta destino (None para raíz)
+            
+        Returns:
+            Resultado por elemento (id, tipo, ok, error), archivos primero y en el
+            orden recibido
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        folder_ids = list(dict.fromkeys(folder_ids))
+        
+        try:
+            if target_folder_id and not self._execute(
+                "move_items.target",
+                "SELECT 1 FROM carpetas WHERE id = :folder_id",
+                {'folder_id': target_folder_id},
+            ).fetchone():
+                raise FileNotFoundError("Carpeta de destino no encontrada")
+            
+            resources = [(FILE, file_id) for file_id in file_ids] + [(FOLDER, folder_id) for folder_id in folder_ids]
+            if target_folder_id:
+                resources.append((FOLDER, target_folder_id))
+            allowed = self.permissions.check_many(user_id, resources, "write")
+            if target_folder_id and not allowed[(FOLDER, target_folder_id)]:
+                raise PermissionError("No tienes permisos en la carpeta de destino")
+            
+            files = self._select_owned("archivos", "id, carpeta_id, eliminado, tamaño", user_id, file_ids)
+            folders = self._select_owned("carpetas", "id, carpeta_padre_id", user_id, folder_ids)
+            # Mover una carpeta al destino o a un descendiente suyo crearía un bucle
+            target_path = set(self.ancestry.ancestor_ids(target_folder_id)) if target_folder_id else set()
+            
+            def verdict(kind: str, item_id: str, rows: Dict[str, Any]) -> Optional[str]:
+                if not allowed[(kind, item_id)]:
+                    return "Sin permisos para mover este elemento"
+                if item_id not in rows:
+                    return "Elemento no encontrado"
+                if kind == FOLDER and item_id in target_path:
+                    return "No se puede mover: crearía un bucle en la estructura"
+                return None
+            
+            results = (
+                [{'id': file_id, 'tipo': FILE, 'error': verdict(FILE, file_id, files)} for file_id in file_ids]
+                + [{'id': folder_id, 'tipo': FOLDER, 'error': verdict(FOLDER, folder_id, folders)} for folder_id in folder_ids]
+            )
+            # Los que ya están en el destino cuentan como movidos sin tocar nada
+            moving_files = [item['id'] for item in results
+                            if item['tipo'] == FILE and not item['error'] and files[item['id']]['carpeta_id'] != target_folder_id]
+            moving_folders = [item['id'] for item in results
+                              if item['tipo'] == FOLDER and not item['error'] and folders[item['id']]['carpeta_padre_id'] != target_folder_id]
+            updated_at = datetime.now()
+            
+            if moving_files:
+                # Totales de los archivos contados, agrupados por carpeta de origen
+                sources: Dict[str, List[int]] = {}
+                for file_id in moving_files:
+                    row = files[file_id]
+                    if not row['eliminado']:
+                        totals = sources.setdefault(row['carpeta_id'], [0, 0])
+                        totals[0] += 1
+                        totals[1] += row['tamaño']
+                self.rollups.shift_files(sources, -1)
+                self._update_parent("archivos", "carpeta_id", moving_files, user_id, target_folder_id, updated_at)
+                moved = [sum(totals) for totals in zip(*sources.values())] or [0, 0]
+                self.rollups.shift_files({target_folder_id: tuple(moved)}, 1)
+            
+            if moving_folders:
+                self._update_parent("carpetas", "carpeta_padre_id", moving_folders, user_id, target_folder_id, updated_at)
+                # Una a una y en orden: si el lote trae una carpeta y un descendiente
+                # suyo, el segundo se mueve con los ancestros ya actualizados
+                for folder_id in moving_folders:
+                    self.rollups.shift_subtree(folder_id, -1)
+                    self.ancestry.move(folder_id, target_folder_id)
+                    self.rollups.shift_subtree(folder_id, 1)
+            
+            self.db.commit()
+            
+        except Exception as e:
+            self.db.rollback()
+            raise e
+        
+        for item in results:
+            item['ok'] = item['error'] is None
+        return results
+    
+    def _select_owned(self, table: str, columns: str, user_id: str, ids: List[str],
+                      batch_size: int = 500) -> Dict[str, Dict[str, Any]]:
+        """Filas del usuario con esos IDs (por lotes), indexadas por ID."""
+        rows = {}
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            placeholders = ", ".join("?" * len(batch))
+            cursor = self._execute(
+                f"move_items.{table}",
+                f"SELECT {columns} FROM {table} WHERE usuario_id = ? AND id IN ({placeholders})",
+                [user_id, *batch],
+            )
+            rows.update({row['id']: dict(row) for row in cursor.fetchall()})
+        return rows
+    
+    def _update_parent(self, table: str, column: str, ids: List[str], user_id: str,
+                       target_folder_id: Optional[str], updated_at: datetime, batch_size: int = 500) -> None:
+        """Cambiar la carpeta contenedora de un lote de filas del usuario (sin commit)."""
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            placeholders = ", ".join("?" * len(batch))
+            self._execute(
+                f"move_items.update_{table}",
+                f"UPDATE {table} SET {column} = ?, fecha_actualizacion = ? WHERE usuario_id = ? AND id IN ({placeholders})",
+                [target_folder_id, updated_at, user_id, *batch],
+            )
+    
+    def rename_folder(self, user_id: str, folder_id: str, new_name: str) -> bool:
         """
-        Eliminación lógica de carpeta (soft delete).
+        Renombrar carpeta y reindexar su nombre.
         
         Args:
             user_id: ID del usuario
             folder_id: ID de la carpeta
+            new_name: Nombre nuevo
             
         Returns:
-            True si se eliminó exitosamente
+            True si se renombró exitosamente
         """
         try:
-            # Validar permisos
+            if not new_name or not new_name.strip():
+                raise ValueError("El nombre no puede estar vacío")
+            
             if not self.validate_folder_access(user_id, folder_id, "write"):
-                raise PermissionError("No tienes permisos para eliminar esta carpeta")
+                raise PermissionError("No tienes permisos para renombrar esta carpeta")
+            
+            folder = self.get_folder(folder_id)
+            if not folder:
+                return False
+            
+            # Validar nombre único en el mismo nivel (del propietario)
+            if (new_name.strip() != folder['name']
+                    and self.folder_name_exists(folder['user_id'], new_name.strip(), folder['parent_folder_id'])):
+                raise ValueError("Ya existe una carpeta con ese nombre en esta ubicación")
             
-            # Marcar como eliminada
             query = """
             UPDATE carpetas 
-            SET eliminado = 1, fecha_actualizacion = :updated_at
-            WHERE id = :folder_id AND usuario_id = :user_id
+            SET nombre = :name, fecha_actualizacion = :updated_at
+            WHERE id = :folder_id
             """
             
             params = {
+                'name': new_name.strip(),
                 'updated_at': datetime.now(),
-                'folder_id': folder_id,
-                'user_id': user_id
+                'folder_id': folder_id
             }
             
-            cursor = self.db.execute(query, params)
+            cursor = self._execute("rename_folder", query, params)
+            self.search_index.rename(FOLDER, folder_id, folder['user_id'], params['name'])
             self.db.commit()
             
             return cursor.rowcount > 0
@@ -221,9 +391,22 @@ class FolderManager:
             self.db.rollback()
             raise e
     
+    def soft_delete_folder(self, user_id: str, folder_id: str) -> bool:
+        """
+        Eliminación lógica de carpeta (soft delete) junto con su contenido.
+        
+        Args:
+            user_id: ID del usuario
+            folder_id: ID de la carpeta
+            
+        Returns:
+            True si se eliminó exitosamente
+        """
+        return self.trash_folder(user_id, folder_id)['folders'] > 0
+    
     def restore_folder(self, user_id: str, folder_id: str) -> bool:
         """
-        Restaurar carpeta eliminada.
+        Restaurar carpeta eliminada junto con lo que se eliminó con ella.
         
         Args:
             user_id: ID del usuario
@@ -232,92 +415,314 @@ class FolderManager:
         Returns:
             True si se restauró exitosamente
         """
+        return self.restore_folder_tree(user_id, folder_id)['folders'] > 0
+    
+    def trash_folder(self, user_id: str, folder_id: str) -> Dict[str, int]:
+        """
+        Enviar a la papelera una carpeta, sus subcarpetas y todos sus archivos con
+        unas pocas sentencias sobre la tabla de ancestros, en una transacción.
+        Lo marcado lleva el ID de esta operación: al restaurar vuelve solo eso, no
+        lo que ya estaba en la papelera.
+        
+        Args:
+            user_id: ID del usuario (propietario de la carpeta)
+            folder_id: ID de la carpeta
+            
+        Returns:
+            Dict con carpetas, archivos y bytes enviados a la papelera
+        """
         try:
-            query = """
+            folder = self._owned_folder(user_id, folder_id)
+            if folder['eliminado']:
+                return {'folders': 0, 'files': 0, 'bytes': 0}
+            
+            totals = self.rollups.get(folder_id) or {'total_size': 0}
+            params = {
+                'folder_id': folder_id,
+                'trash_id': f"papelera_{uuid.uuid4().hex[:12]}",
+                'updated_at': datetime.now()
+            }
+            
+            # Los totales de la carpeta salen de sus ancestros antes de marcar nada
+            self.rollups.shift_subtree(folder_id, -1)
+            
+            folders = self._execute("trash_folder.folders", f"""
             UPDATE carpetas 
-            SET eliminado = 0, fecha_actualizacion = :updated_at
-            WHERE id = :folder_id AND usuario_id = :user_id AND eliminado = 1
-            """
+            SET eliminado = 1, papelera_id = :trash_id, fecha_actualizacion = :updated_at
+            WHERE id IN {SUBTREE} AND eliminado = 0
+            """, params).rowcount
+            
+            files = self._execute("trash_folder.files", f"""
+            UPDATE archivos 
+            SET eliminado = 1, papelera_id = :trash_id, fecha_actualizacion = :updated_at
+            WHERE carpeta_id IN {SUBTREE} AND eliminado = 0
+            """, params).rowcount
+            
+            # Todo el subárbol quedó eliminado: sus totales son cero
+            self.rollups.clear_subtree(folder_id)
+            self.db.commit()
+            
+            return {'folders': folders, 'files': files, 'bytes': totals['total_size']}
+            
+        except Exception as e:
+            self.db.rollback()
+            raise e
+    
+    def restore_folder_tree(self, user_id: str, folder_id: str) -> Dict[str, int]:
+        """
+        Restaurar una carpeta de la papelera con todo lo que se eliminó con ella,
+        en una transacción. Lo eliminado antes o por separado sigue en la papelera.
+        
+        Args:
+            user_id: ID del usuario (propietario de la carpeta)
+            folder_id: ID de la carpeta
+            
+        Returns:
+            Dict con carpetas, archivos y bytes restaurados
+        """
+        try:
+            folder = self._owned_folder(user_id, folder_id)
+            if not folder['eliminado']:
+                return {'folders': 0, 'files': 0, 'bytes': 0}
             
             params = {
-                'updated_at': datetime.now(),
                 'folder_id': folder_id,
-                'user_id': user_id
+                'trash_id': folder['papelera_id'],
+                'updated_at': datetime.now()
             }
+            # Eliminada sin operación de papelera (antes de existir): vuelve solo ella
+            same_trash = "papelera_id = :trash_id" if folder['papelera_id'] else "id = :folder_id"
             
-            cursor = self.db.execute(query, params)
+            self.rollups.shift_subtree(folder_id, -1)
+            
+            folders = self._execute("restore_folder_tree.folders", f"""
+            UPDATE carpetas 
+            SET eliminado = 0, papelera_id = NULL, fecha_actualizacion = :updated_at
+            WHERE id IN {SUBTREE} AND eliminado = 1 AND {same_trash}
+            """, params).rowcount
+            
+            files = 0
+            if folder['papelera_id']:
+                files = self._execute("restore_folder_tree.files", f"""
+                UPDATE archivos 
+                SET eliminado = 0, papelera_id = NULL, fecha_actualizacion = :updated_at
+                WHERE carpeta_id IN {SUBTREE} AND eliminado = 1 AND papelera_id = :trash_id
+                """, params).rowcount
+            
+            # Totales del subárbol recalculados y sumados de nuevo en los ancestros
+            self.rollups.rebuild_subtree(folder_id)
+            self.rollups.shift_subtree(folder_id, 1)
+            totals = self.rollups.get(folder_id)
             self.db.commit()
             
-            return cursor.rowcount > 0
+            return {'folders': folders, 'files': files, 'bytes': totals['total_size']}
             
         except Exception as e:
             self.db.rollback()
             raise e
     
+    def purge_folder(self, user_id: str, folder_id: str) -> Dict[str, int]:
+        """
+        Eliminación definitiva de una carpeta y su subárbol: carpetas, archivos,
+        compartidos, índice de búsqueda y referencias a blobs se borran por
+        conjuntos en una transacción. Los contenidos sin referencias se borran del
+        disco al confirmar.
+        
+        Args:
+            user_id: ID del usuario (propietario de la carpeta)
+            folder_id: ID de la carpeta
+            
+        Returns:
+            Dict con carpetas, archivos y bytes eliminados
+        """
+        if self.files is None:
+            raise RuntimeError("purge_folder necesita el FileManager de la misma conexión")
+        
+        try:
+            self._owned_folder(user_id, folder_id)
+            params = {'folder_id': folder_id}
+            
+            folder_ids = self.ancestry.descendant_ids(folder_id)
+            files = self._execute("purge_folder.select", f"""
+            SELECT id, usuario_id, hash_archivo, tamaño
+            FROM archivos
+            WHERE carpeta_id IN {SUBTREE}
+            """, params).fetchall()
+            
+            self.rollups.shift_subtree(folder_id, -1)
+            self.search_index.remove_many(FILE, [row[0] for row in files])
+            self.search_index.remove_many(FOLDER, folder_ids)
+            
+            self._execute("purge_folder.file_shares", f"""
+            DELETE FROM compartidos
+            WHERE archivo_id IN (SELECT id FROM archivos WHERE carpeta_id IN {SUBTREE})
+            """, params)
+            self._execute("purge_folder.folder_shares", f"DELETE FROM compartidos WHERE carpeta_id IN {SUBTREE}", params)
+            
+            removed_blobs = self.files.blobs.release_many(Counter(row[2] for row in files if row[2]))
+            
+            self._execute("purge_folder.files", f"DELETE FROM archivos WHERE carpeta_id IN {SUBTREE}", params)
+            self.rollups.remove_subtree(folder_id)
+            self._execute("purge_folder.folders", f"DELETE FROM carpetas WHERE id IN {SUBTREE}", params)
+            # La tabla de ancestros define el subárbol: se borra al final
+            self.ancestry.remove_subtree(folder_id)
+            self.db.commit()
+            
+        except Exception as e:
+            self.db.rollback()
+            raise e
+        
+        self.files.blobs.unlink_many(removed_blobs)
+        
+        # Espacio usado de cada propietario (puede haber archivos de colaboradores)
+        freed: Dict[str, int] = {}
+        for row in files:
+            freed[row[1]] = freed.get(row[1], 0) + row[3]
+        for owner_id, size in freed.items():
+            self.files.update_user_storage(owner_id, -size)
+        
+        self.permissions.invalidate_many(
+            [(FILE, row[0]) for row in files] + [(FOLDER, folder) for folder in folder_ids]
+        )
+        
+        return {'folders': len(folder_ids), 'files': len(files), 'bytes': sum(freed.values())}
+    
+    def _owned_folder(self, user_id: str, folder_id: str) -> Dict[str, Any]:
+        """Carpeta del usuario con su estado de papelera; las operaciones de subárbol son del propietario."""
+        row = self._execute(
+            "owned_folder",
+            "SELECT usuario_id, eliminado, papelera_id FROM carpetas WHERE id = :folder_id",
+            {'folder_id': folder_id},
+        ).fetchone()
+        if not row:
+            raise FileNotFoundError("Carpeta no encontrada")
+        if row['usuario_id'] != user_id or not self.validate_folder_access(user_id, folder_id, "write"):
+            raise PermissionError("No tienes permisos para eliminar esta carpeta")
+        return dict(row)
+    
     def get_folder_path(self, folder_id: str) -> List[Dict[str, Any]]:
         """
-        Obtener la ruta completa de una carpeta (breadcrumb).
+        Obtener la ruta completa de una carpeta (breadcrumb) con una sola consulta
+        sobre la tabla de ancestros, sin importar la profundidad.
         
         Args:
             folder_id: ID de la carpeta
             
         Returns:
             Lista de carpetas desde la raíz hasta la carpeta especificada
+            (depth 0 es la raíz)
+        """
+        query = f"""
+        SELECT {FOLDER_COLUMNS}
+        FROM carpetas_ancestros a
+        JOIN carpetas ON carpetas.id = a.ancestro_id
+        WHERE a.descendiente_id = :folder_id
+        ORDER BY a.profundidad DESC
         """
-        path = []
-        current_id = folder_id
-        
-        while current_id:
-            folder = self.get_folder(current_id)
-            if not folder:
-                break
-            path.insert(0, folder)
-            current_id = folder['parent_folder_id']
         
-        return path
+        rows = self._execute("get_folder_path", query, {'folder_id': folder_id}).fetchall()
+        return [{**dict(row), 'depth': depth} for depth, row in enumerate(rows)]
     
-    def validate_folder_access(self, user_id: str, folder_id: str, 
-                              access_type: str = "read") -> bool:
+    def get_breadcrumb(self, user_id: str, folder_id: str) -> List[Dict[str, Any]]:
         """
-        Validar permisos de acceso a una carpeta.
+        Breadcrumb de una carpeta para un usuario: la ruta se corta en el último
+        ancestro que no puede leer (p. ej. una carpeta compartida dentro de otra ajena).
         
         Args:
             user_id: ID del usuario
             folder_id: ID de la carpeta
-            access_type: Tipo de acceso ("read" o "write")
             
         Returns:
-            True si tiene permisos
+            Lista de carpetas desde el primer ancestro visible hasta la carpeta
         """
-        # Verificar si es propietario
-        folder = self.get_folder(folder_id)
-        if folder and folder['user_id'] == user_id:
-            return True
+        path = self.get_folder_path(folder_id)
+        if not path:
+            raise FileNotFoundError("Carpeta no encontrada")
+        
+        allowed = self.permissions.check_many(user_id, [(FOLDER, folder['id']) for folder in path], "read")
+        if not allowed[(FOLDER, folder_id)]:
+            raise PermissionError("No tienes permisos para ver esta carpeta")
+        
+        start = len(path) - 1
+        while start > 0 and allowed[(FOLDER, path[start - 1]['id'])]:
+            start -= 1
+        return path[start:]
+    
+    def get_subtree(self, user_id: str, folder_id: str, max_depth: Optional[int] = None,
+                    include_deleted: bool = False) -> List[Dict[str, Any]]:
+        """
+        Subárbol de una carpeta con una sola consulta jerárquica.
         
-        # Verificar permisos compartidos
-        query = """
-        SELECT tipo_acceso_id
-        FROM compartidos c
-        JOIN usuarios u ON u.email = c.email_compartido
-        WHERE c.carpeta_id = :folder_id 
-        AND u.id = :user_id 
-        AND c.activo = 1
+        Args:
+            user_id: ID del usuario
+            folder_id: ID de la carpeta raíz del subárbol
+            max_depth: Niveles por debajo de la carpeta (None para el subárbol completo)
+            include_deleted: Incluir carpetas eliminadas (y lo que cuelga de ellas)
+            
+        Returns:
+            Lista plana ordenada por nivel y nombre, con los totales recursivos de
+            cada carpeta; depth 0 es la carpeta pedida y parent_folder_id permite
+            armar el árbol
         """
+        if max_depth is not None and max_depth < 0:
+            raise ValueError("La profundidad no puede ser negativa")
+        if not self.validate_folder_access(user_id, folder_id, "read"):
+            raise PermissionError("No tienes permisos para ver esta carpeta")
         
-        cursor = self.db.execute(query, {'folder_id': folder_id, 'user_id': user_id})
-        result = cursor.fetchone()
+        conditions = ["a.ancestro_id = :folder_id"]
+        params = {'folder_id': folder_id}
+        
+        if max_depth is not None:
+            conditions.append("a.profundidad <= :max_depth")
+            params['max_depth'] = max_depth
         
-        if not result:
-            return False
+        if not include_deleted:
+            # Fuera lo eliminado y lo que cuelga de ello (la carpeta pedida no se filtra)
+            conditions.append("""a.descendiente_id NOT IN (
+                SELECT x.descendiente_id
+                FROM carpetas_ancestros d
+                JOIN carpetas e ON e.id = d.descendiente_id
+                JOIN carpetas_ancestros x ON x.ancestro_id = d.descendiente_id
+                WHERE d.ancestro_id = :folder_id AND d.profundidad > 0 AND e.eliminado = 1
+            )""")
         
-        # Verificar tipo de acceso
-        access_id = result[0]
-        if access_type == "read":
-            return access_id in [1, 2]  # 1: solo lectura, 2: lectura/escritura
-        elif access_type == "write":
-            return access_id == 2  # 2: lectura/escritura
+        query = f"""
+        SELECT {FOLDER_COLUMNS}, a.profundidad as depth,
+               t.archivos as total_files, t.carpetas as total_folders, t.bytes as total_size
+        FROM carpetas_ancestros a
+        JOIN carpetas ON carpetas.id = a.descendiente_id
+        LEFT JOIN carpetas_totales t ON t.carpeta_id = a.descendiente_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY a.profundidad, nombre, id
+        """
         
-        return False
+        rows = self._execute("get_subtree", query, params).fetchall()
+        if not rows:
+            raise FileNotFoundError("Carpeta no encontrada")
+        return [dict(row) for row in rows]
+    
+    def validate_folder_access(self, user_id: str, folder_id: str, 
+                              access_type: str = "read") -> bool:
+        """
+        Validar permisos de acceso a una carpeta.
+        
+        Args:
+            user_id: ID del usuario
+            folder_id: ID de la carpeta
+            access_type: Tipo de acceso ("read" o "write")
+            
+        Returns:
+            True si tiene permisos
+        """
+        return self.permissions.check(user_id, (FOLDER, folder_id), access_type)
+    
+    def share_folder(self, user_id: str, folder_id: str, email: str, access_type: str) -> None:
+        """Compartir una carpeta propia con un email (invalida la ACL en todos los hilos)."""
+        self.permissions.share(user_id, (FOLDER, folder_id), email, access_type)
+    
+    def unshare_folder(self, user_id: str, folder_id: str, email: str) -> bool:
+        """Dejar de compartir una carpeta propia con un email."""
+        return self.permissions.unshare(user_id, (FOLDER, folder_id), email)
     
     def folder_name_exists(self, user_id: str, name: str, 
                           parent_folder_id: Optional[str]) -> bool:
@@ -347,7 +752,7 @@ class FolderManager:
         WHERE {' AND '.join(conditions)}
         """
         
-        cursor = self.db.execute(query, params)
+        cursor = self._execute("folder_name_exists", query, params)
         return cursor.fetchone()[0] > 0
     
     def is_descendant(self, ancestor_id: str, potential_descendant_id: str) -> bool:
@@ -361,18 +766,11 @@ class FolderManager:
         Returns:
             True si es descendiente
         """
-        current_id = potential_descendant_id
-        visited = set()
-        
-        while current_id and current_id not in visited:
-            if current_id == ancestor_id:
-                return True
-            
-            visited.add(current_id)
-            folder = self.get_folder(current_id)
-            current_id = folder['parent_folder_id'] if folder else None
-        
-        return False
+        return self.ancestry.is_descendant(ancestor_id, potential_descendant_id)
+    
+    def _execute(self, name: str, query: str, params: Optional[Dict[str, Any]] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"folders.{name}", query, params)
     
     def generate_folder_id(self) -> str:
         """Generar ID único para carpeta."""
@@ -381,55 +779,40 @@ class FolderManager:
     
     def get_folder_statistics(self, user_id: str, folder_id: Optional[str] = None) -> Dict[str, int]:
         """
-        Obtener estadísticas de una carpeta.
+        Obtener estadísticas recursivas de una carpeta: archivos, subcarpetas y bytes
+        no eliminados de todo su subárbol.
         
         Args:
             user_id: ID del usuario
-            folder_id: ID de la carpeta (None para estadísticas generales)
+            folder_id: ID de la carpeta (None para todo el drive del usuario)
             
         Returns:
             Diccionario con estadísticas
         """
-        stats = {
-            'total_folders': 0,
-            'total_files': 0,
-            'total_size': 0
-        }
+        if folder_id:
+            if not self.validate_folder_access(user_id, folder_id, "read"):
+                raise PermissionError("No tienes permisos para ver esta carpeta")
+            # Una fila de carpetas_totales, sin recorrer el subárbol
+            return self.rollups.get(folder_id) or {'total_folders': 0, 'total_files': 0, 'total_size': 0}
+        
+        stats = {}
         
-        # Contar subcarpetas
         folder_query = """
         SELECT COUNT(*) 
         FROM carpetas 
         WHERE usuario_id = :user_id AND eliminado = 0
         """
-        folder_params = {'user_id': user_id}
-        
-        if folder_id:
-            folder_query += " AND carpeta_padre_id = :folder_id"
-            folder_params['folder_id'] = folder_id
-        else:
-            folder_query += " AND carpeta_padre_id IS NULL"
-        
-        cursor = self.db.execute(folder_query, folder_params)
+        cursor = self._execute("get_folder_statistics.folders", folder_query, {'user_id': user_id})
         stats['total_folders'] = cursor.fetchone()[0]
         
-        # Contar archivos
         file_query = """
         SELECT COUNT(*), COALESCE(SUM(tamaño), 0)
         FROM archivos 
         WHERE usuario_id = :user_id AND eliminado = 0
         """
-        file_params = {'user_id': user_id}
-        
-        if folder_id:
-            file_query += " AND carpeta_id = :folder_id"
-            file_params['folder_id'] = folder_id
-        else:
-            file_query += " AND carpeta_id IS NULL"
-        
-        cursor = self.db.execute(file_query, file_params)
+        cursor = self._execute("get_folder_statistics.files", file_query, {'user_id': user_id})
         result = cursor.fetchone()
         stats['total_files'] = result[0]
         stats['total_size'] = result[1]
         
-        return stats
\ No newline at end of file
+        return stats
@@ -1,23 +1,40 @@
-from http.client import HTTPException
+import asyncio
+from pathlib import Path
 import uvicorn
 import json
-from fastapi import FastAPI, Request, Response, Query, Body
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request, Response, Query, Body, Header, Depends
+from typing import List, Literal, Optional
 from models.paises import Pais
-from utils.database import execute_query_json
+from utils.database import run_db, init_pool, close_pool, get_pool_stats
 from models.userregister import UserRegister
 from models.userlogin import UserLogin, Usuario
 from controllers.firebase import get_usuario_por_correo, register_user_firebase, login_user_firebase
 from models.colores import Colores
-from controllers.colores_controller import get_all_colores
-from models.carpetas import Carpetas
-from models.compartidos import Compartidos
+from controllers.colores_controller import colores_cache
+from controllers.referencias_controller import paises_cache, tipos_archivos_cache, tipos_accesos_cache
+from models.tipoacceso import TiposAccesos
+from models.tipoarchivo import TiposArchivos
+from models.carpetas import Carpetas, EstadisticasCarpeta, NodoCarpeta, ResultadoPapelera
+from models.compartidos import Compartidos, CompartirRecurso
 from models.archivos import Archivos
 from models.comentarios import Comentarios
-from controllers.comentarioscontrollers import get_all_comentarios,create_comentario, delete_comentario
-from controllers.archivoscontroller import get_all_archivos,create_archivo, delete_archivo
-from controllers.compartidoscontroller import get_all_compartidos, create_compartido
-from controllers.carpetacontroller import get_all_folders, create_carpeta,delete_carpeta
+from models.lotes import MovimientoLote, ResultadoLote, ResultadoMovimiento, MAX_BATCH_SIZE
+from models.subidas import SesionSubidaCrear, SesionSubida, ParteSubida, ArchivoSubido
+from models.busqueda import ResultadoBusqueda
+from controllers.comentarioscontrollers import get_all_comentarios, stream_comentarios, create_comentario, create_comentarios_batch, delete_comentario
+from controllers.archivoscontroller import get_all_archivos, stream_archivos, create_archivo, create_archivos_batch, delete_archivo
+from controllers.compartidoscontroller import get_all_compartidos, stream_compartidos, create_compartido, create_compartidos_batch
+from controllers.carpetacontroller import get_all_folders, stream_folders, create_carpeta,delete_carpeta
+from utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ndjson_lines
+from utils.statements import statement_stats
+from utils.metrics import render_prometheus
+from utils.cache import ReferenceCache, invalidate_reference_caches, invalidation_endpoint_enabled, warm_reference_caches
+from utils.managers import get_access_cache, get_file_manager, get_folder_manager, get_permission_resolver, get_search_index, get_upload_manager, get_thumbnail_cache, shutdown_thumbnail_pipeline, thumbnail_pipeline_stats, storage_path
+from utils.managers import shutdown_storage_accounting, start_search_backfill, storage_accounting_stats
+from utils.downloads import BlobFileResponse, accel_redirect_response, compressed_blob_response, etag_matches, file_etag
+from utils.compression import IDENTITY
+from uploads import MAX_CHUNK_SIZE, UPLOAD_PURGE_INTERVAL
+from thumbnails import InvalidImageError
 
 
 from contextlib import asynccontextmanager
@@ -27,8 +44,7 @@ import logging
 from utils.security import validate
 
 from fastapi.middleware.cors import CORSMiddleware
-
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 
 
@@ -39,8 +55,16 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting API...")
+    init_pool()
+    await run_db(warm_reference_caches)
+    start_search_backfill()
+    upload_purge = asyncio.create_task(purge_upload_sessions())
     yield
     logger.info("Shutting down API...")
+    upload_purge.cancel()
+    await asyncio.to_thread(shutdown_thumbnail_pipeline)
+    await asyncio.to_thread(shutdown_storage_accounting)
+    await asyncio.to_thread(close_pool)
 
 
 app = FastAPI(title="Drive API", version="0.0.1",  lifespan=lifespan)
@@ -51,13 +75,127 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Accept-Ranges", "Content-Range", "Content-Disposition"],
 )
 
+
+async def paginated_listing(response: Response, page_func, stream_func,
+                            after: Optional[str], limit: Optional[int], stream: bool):
+    """
+    Resuelve un listado paginado por keyset. Con stream=true responde NDJSON
+    fila por fila; con after o limit devuelve una página y el cursor siguiente en
+    X-Next-Cursor. Sin ninguno devuelve el listado completo, como antes de paginar
+    (los clientes que no siguen el cursor no pierden filas).
+    """
+    if stream:
+        return StreamingResponse(ndjson_lines(stream_func(after, limit)), media_type="application/x-ndjson")
+
+    if after is None and limit is None:
+        return await run_db(lambda: list(stream_func(None, None)))
+
+    rows, next_cursor = await run_db(page_func, after, limit or DEFAULT_PAGE_SIZE)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+async def cached_reference(request: Request, response: Response, cache: ReferenceCache):
+    """
+    Sirve una tabla de referencia desde memoria con ETag y Cache-Control;
+    si el navegador ya tiene la versión actual responde 304 sin cuerpo.
+    """
+    rows, etag = await run_db(cache.get)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={cache.ttl}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return rows
+
+async def run_manager(getter, method: str, *args, **kwargs):
+    """
+    Llama a un método de un gestor de almacenamiento (files, folders, uploads) en
+    un hilo de run_db y traduce sus excepciones a respuestas HTTP.
+    """
+    def call():
+        return getattr(getter(), method)(*args, **kwargs)
+
+    try:
+        return await run_db(call)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@validate
+async def authenticated_email(request: Request) -> str:
+    return request.state.correo_electronico
+
+
+async def current_user(email: str = Depends(authenticated_email)) -> str:
+    """
+    Usuario de las rutas /api/* y /uploads/*: el del JWT (validate), traducido a
+    su ID en la base de los gestores. Nunca se toma de la petición.
+    """
+    return await run_manager(get_permission_resolver, "user_for_email", email)
+
+
+async def receive_body(request: Request, path: Path, limit: int) -> None:
+    """
+    Escribe el cuerpo de la petición en `path` según llega, cortando en cuanto
+    supera `limit` bytes: en memoria solo hay un bloque de la red a la vez. La
+    apertura, las escrituras y el cierre van a un hilo para no bloquear el bucle.
+    """
+    size = 0
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > limit:
+                raise HTTPException(status_code=413, detail=f"El cuerpo supera el máximo de {limit} bytes")
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+async def purge_upload_sessions():
+    """Mantenimiento periódico de las subidas por partes (sesiones abandonadas y ensamblados cortados)."""
+    while True:
+        try:
+            purged = await run_manager(get_upload_manager, "purge_expired_sessions")
+            if purged:
+                logger.info(f"{purged} sesiones de subida abandonadas eliminadas")
+        except Exception:
+            logger.exception("Error purgando sesiones de subida")
+        await asyncio.sleep(UPLOAD_PURGE_INTERVAL)
+
 @app.get("/health")
 @validate
 async def health_check(request: Request):
     return {"status": "healthy", "version": "0.0.1"}
 
+@app.get("/health/pool")
+async def pool_stats():
+    return get_pool_stats()
+
+@app.get("/health/statements")
+async def statements_stats():
+    return statement_stats()
+
+@app.get("/health/thumbnails")
+async def thumbnails_stats():
+    return thumbnail_pipeline_stats()
+
+@app.get("/health/accounting")
+async def accounting_stats():
+    return storage_accounting_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_prometheus(get_pool_stats()), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def read_root():
     return {"hello": "world"}
@@ -72,76 +210,308 @@ async def login(user: UserLogin):
 
 @app.get("/usuarios", response_model=Usuario)
 async def obtener_usuario(correo: str):
-    usuario = get_usuario_por_correo(correo)
+    usuario = await run_db(get_usuario_por_correo, correo)
     if usuario:
         return usuario
     raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
 @app.get("/paises", response_model=List[Pais])
-def get_paises():
-    result = execute_query_json("SELECT id_pais, nombre FROM paises ORDER BY nombre")
-    return json.loads(result)
+async def get_paises(request: Request, response: Response):
+    return await cached_reference(request, response, paises_cache)
+
+@app.get("/tipos-archivos", response_model=List[TiposArchivos])
+async def list_tipos_archivos(request: Request, response: Response):
+    return await cached_reference(request, response, tipos_archivos_cache)
+
+@app.get("/tipos-accesos", response_model=List[TiposAccesos])
+async def list_tipos_accesos(request: Request, response: Response):
+    return await cached_reference(request, response, tipos_accesos_cache)
+
+@app.post("/cache/invalidate")
+@validate
+async def invalidate_cache(request: Request, tabla: Optional[str] = None):
+    if not invalidation_endpoint_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    try:
+        return {"invalidated": invalidate_reference_caches(tabla)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Tabla de referencia desconocida: {tabla}")
 
 @app.get("/carpetas", response_model=List[Carpetas])
-async def list_carpetas():
-    return get_all_folders()
+async def list_carpetas(response: Response,
+                        after: Optional[str] = None,
+                        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                        stream: bool = False):
+    return await paginated_listing(response, get_all_folders, stream_folders, after, limit, stream)
 
 @app.post("/carpetas", response_model=Carpetas)
 async def add_carpeta(carpeta: Carpetas):
-    return create_carpeta(nombre = carpeta.nombre, id_usuario_propietario = carpeta.id_usuario_propietario )
+    return await run_db(create_carpeta, nombre = carpeta.nombre, id_usuario_propietario = carpeta.id_usuario_propietario )
 
 @app.get("/colores", response_model=List[Colores])
-async def list_colores():
-    return get_all_colores()
+async def list_colores(request: Request, response: Response):
+    return await cached_reference(request, response, colores_cache)
 
 @app.delete("/carpetas/{id_carpeta}")
 async def remove_carpeta(id_carpeta: int):
-    return delete_carpeta(id_carpeta)
+    return await run_db(delete_carpeta, id_carpeta)
 
 @app.get("/compartidos", response_model=List[Compartidos])
-async def list_compartidos():
-    return get_all_compartidos()
+async def list_compartidos(response: Response,
+                           after: Optional[str] = None,
+                           limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                           stream: bool = False):
+    return await paginated_listing(response, get_all_compartidos, stream_compartidos, after, limit, stream)
 
 
 @app.post("/compartidos", response_model=Compartidos)
 async def add_compartido(compartido:Compartidos):
-    return create_compartido( id_usuario_comparte=compartido.id_usuario_comparte,
+    result = await run_db(create_compartido, id_usuario_comparte=compartido.id_usuario_comparte,
                             id_archivo_compartido=compartido.id_archivo_compartido,
                             id_usuario_receptor=compartido.id_usuario_receptor
                             )
+    # Los IDs de Oracle no son los de los gestores: se olvidan todas las ACL cacheadas
+    get_access_cache().clear()
+    return result
+
+@app.post("/compartidos/batch", response_model=List[ResultadoLote])
+async def add_compartidos_batch(compartidos: List[Compartidos] = Body(..., max_length=MAX_BATCH_SIZE)):
+    results = await run_db(create_compartidos_batch, compartidos)
+    get_access_cache().clear()
+    return results
 
 
 @app.get("/archivos", response_model=List[Archivos])
-async def list_archivos():
-    return get_all_archivos()
+async def list_archivos(response: Response,
+                        after: Optional[str] = None,
+                        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                        stream: bool = False):
+    return await paginated_listing(response, get_all_archivos, stream_archivos, after, limit, stream)
 
 
 @app.post("/archivos", response_model=Archivos)
 async def add_archivo(archivo:Archivos):
-    return create_archivo( nombre = archivo.nombre,
+    return await run_db(create_archivo, nombre = archivo.nombre,
                            id_usuario_propietario=archivo.id_usuario_propietario,
                             id_tipo_archivo=archivo.id_tipo_archivo
                         )
 
+@app.post("/archivos/batch", response_model=List[ResultadoLote])
+async def add_archivos_batch(archivos: List[Archivos] = Body(..., max_length=MAX_BATCH_SIZE)):
+    return await run_db(create_archivos_batch, archivos)
+
 @app.delete("/archivos/{id_archivo}")
 async def remove_archivo(id_archivo: int):
-    return delete_archivo(id_archivo)
+    return await run_db(delete_archivo, id_archivo)
 
 @app.get("/comentarios", response_model=List[Comentarios])
-async def list_comentarios():
-    return get_all_comentarios()
+async def list_comentarios(response: Response,
+                           after: Optional[str] = None,
+                           limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                           stream: bool = False):
+    return await paginated_listing(response, get_all_comentarios, stream_comentarios, after, limit, stream)
 
 @app.post("/comentarios", response_model=Comentarios)
 async def add_comentario(comentario: Comentarios):
-    return create_comentario(
+    return await run_db(
+        create_comentario,
         descripcion=comentario.descripcion,
         id_usuario_comentador=comentario.id_usuario_comentador,
         id_archivo=comentario.id_archivo
     )
 
+@app.post("/comentarios/batch", response_model=List[ResultadoLote])
+async def add_comentarios_batch(comentarios: List[Comentarios] = Body(..., max_length=MAX_BATCH_SIZE)):
+    return await run_db(create_comentarios_batch, comentarios)
+
 @app.delete("/comentarios/{id_comentario}")
 async def remove_comentario(id_comentario: int):
-    return delete_comentario(id_comentario)
+    return await run_db(delete_comentario, id_comentario)
+
+@app.api_route("/api/files/{file_id}/download", methods=["GET", "HEAD"])
+async def download_file(file_id: str, request: Request, inline: bool = False, user_id: str = Depends(current_user)):
+    """
+    Descarga con soporte de Range/If-Range (p. ej. para reproducir video) y ETag
+    fuerte derivado del hash del contenido. El archivo se envía desde disco sin
+    cargarlo en memoria (sendfile si el servidor o el proxy lo permiten).
+    """
+    info = await run_manager(get_file_manager, "resolve_download", user_id, file_id)
+
+    headers = {"Cache-Control": "private, no-cache"}
+    if info["file_hash"]:
+        headers["ETag"] = file_etag(info["file_hash"])
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    disposition = "inline" if inline else "attachment"
+    if info["storage_codec"] != IDENTITY:
+        # Guardado comprimido: se descomprime al enviar (sin rangos ni sendfile)
+        return compressed_blob_response(info["storage_path"], info["storage_codec"], info["file_size"],
+                                        info["original_name"], headers, disposition, request.method == "HEAD")
+
+    response = BlobFileResponse(info["storage_path"], headers=headers, filename=info["original_name"],
+                                content_disposition_type=disposition)
+    return accel_redirect_response(response, storage_path) or response
+
+@app.get("/api/storage")
+async def storage_usage(user_id: str = Depends(current_user)):
+    """Espacio usado y total del usuario, incluidos los cambios aún sin volcar."""
+    return await run_manager(get_file_manager, "get_storage_usage", user_id)
+
+@app.get("/api/shared/files")
+async def shared_files(user_id: str = Depends(current_user)):
+    """Archivos compartidos con el usuario y su nivel de acceso (una consulta, sin validar uno a uno)."""
+    return await run_manager(get_file_manager, "list_shared_files", user_id)
+
+@app.post("/api/files/{file_id}/shares", status_code=204)
+async def share_file(file_id: str, compartir: CompartirRecurso, user_id: str = Depends(current_user)):
+    """Compartir un archivo propio; la ACL cacheada del archivo se invalida en todo el proceso."""
+    await run_manager(get_file_manager, "share_file", user_id, file_id, compartir.email, compartir.access_type)
+    return Response(status_code=204)
+
+@app.delete("/api/files/{file_id}/shares", status_code=204)
+async def unshare_file(file_id: str, email: str, user_id: str = Depends(current_user)):
+    if not await run_manager(get_file_manager, "unshare_file", user_id, file_id, email):
+        raise HTTPException(status_code=404, detail="El archivo no estaba compartido con ese email")
+    return Response(status_code=204)
+
+@app.post("/api/folders/{folder_id}/shares", status_code=204)
+async def share_folder(folder_id: str, compartir: CompartirRecurso, user_id: str = Depends(current_user)):
+    """Compartir una carpeta propia; la ACL cacheada de la carpeta se invalida en todo el proceso."""
+    await run_manager(get_folder_manager, "share_folder", user_id, folder_id, compartir.email, compartir.access_type)
+    return Response(status_code=204)
+
+@app.delete("/api/folders/{folder_id}/shares", status_code=204)
+async def unshare_folder(folder_id: str, email: str, user_id: str = Depends(current_user)):
+    if not await run_manager(get_folder_manager, "unshare_folder", user_id, folder_id, email):
+        raise HTTPException(status_code=404, detail="La carpeta no estaba compartida con ese email")
+    return Response(status_code=204)
+
+@app.get("/api/folders/{folder_id}/path", response_model=List[NodoCarpeta])
+async def folder_breadcrumb(folder_id: str, user_id: str = Depends(current_user)):
+    """Breadcrumb de la carpeta (de la raíz visible para el usuario a la carpeta) en una consulta."""
+    return await run_manager(get_folder_manager, "get_breadcrumb", user_id, folder_id)
+
+@app.get("/api/folders/{folder_id}/tree", response_model=List[NodoCarpeta])
+async def folder_subtree(folder_id: str, depth: Optional[int] = Query(None, ge=0),
+                         include_deleted: bool = False, user_id: str = Depends(current_user)):
+    """
+    Subárbol de la carpeta como lista plana (depth 0 es la carpeta pedida); sin
+    depth devuelve el subárbol completo.
+    """
+    return await run_manager(get_folder_manager, "get_subtree", user_id, folder_id,
+                             max_depth=depth, include_deleted=include_deleted)
+
+@app.get("/api/folders/{folder_id}/stats", response_model=EstadisticasCarpeta)
+async def folder_statistics(folder_id: str, user_id: str = Depends(current_user)):
+    """Archivos, subcarpetas y bytes no eliminados de todo el subárbol (una fila precalculada)."""
+    return await run_manager(get_folder_manager, "get_folder_statistics", user_id, folder_id)
+
+@app.post("/api/folders/{folder_id}/trash", response_model=ResultadoPapelera)
+async def trash_folder(folder_id: str, user_id: str = Depends(current_user)):
+    """Enviar la carpeta y todo su contenido a la papelera en una transacción."""
+    return await run_manager(get_folder_manager, "trash_folder", user_id, folder_id)
+
+@app.post("/api/folders/{folder_id}/restore", response_model=ResultadoPapelera)
+async def restore_folder(folder_id: str, user_id: str = Depends(current_user)):
+    """Restaurar la carpeta con lo que se envió a la papelera junto con ella."""
+    return await run_manager(get_folder_manager, "restore_folder_tree", user_id, folder_id)
+
+@app.delete("/api/folders/{folder_id}", response_model=ResultadoPapelera)
+async def purge_folder(folder_id: str, user_id: str = Depends(current_user)):
+    """Eliminar definitivamente la carpeta, su subárbol y los contenidos que queden sin referencias."""
+    return await run_manager(get_folder_manager, "purge_folder", user_id, folder_id)
+
+@app.post("/api/move", response_model=List[ResultadoMovimiento])
+async def move_items(movimiento: MovimientoLote, user_id: str = Depends(current_user)):
+    """
+    Mover archivos y carpetas a una carpeta en una transacción, con el resultado
+    de cada elemento; 403/404 solo si falla el destino.
+    """
+    return await run_manager(get_folder_manager, "move_items", user_id, movimiento.file_ids,
+                             movimiento.folder_ids, movimiento.target_folder_id)
+
+@app.get("/api/search", response_model=List[ResultadoBusqueda])
+async def search(response: Response, q: str = Query(..., min_length=1, max_length=200),
+                 tipo: Optional[Literal["archivo", "carpeta"]] = None, fuzzy: bool = True,
+                 after: Optional[str] = None, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+                 user_id: str = Depends(current_user)):
+    """
+    Búsqueda por nombre en archivos y carpetas del usuario, de más a menos reciente.
+    Cada término coincide como prefijo de una palabra; el cursor siguiente va en X-Next-Cursor.
+    """
+    kinds = (tipo,) if tipo else ("archivo", "carpeta")
+    rows, next_cursor = await run_manager(get_search_index, "search", user_id, q, kinds=kinds,
+                                          limit=limit, after=after, fuzzy=fuzzy)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@app.get("/api/files/{file_id}/thumbnail")
+async def get_thumbnail(file_id: str, request: Request,
+                        size: Literal["small", "medium", "large"] = "medium",
+                        format: Literal["webp", "jpeg"] = "webp", user_id: str = Depends(current_user)):
+    """
+    Miniatura del tamaño pedido. Se genera al primer acceso y queda en una caché
+    en disco con desalojo LRU; peticiones simultáneas comparten una sola generación.
+    """
+    info = await run_manager(get_file_manager, "resolve_download", user_id, file_id)
+    if info["file_type"] != "image" or not info["file_hash"]:
+        raise HTTPException(status_code=404, detail="El archivo no tiene miniatura")
+
+    # La miniatura depende solo del contenido: el ETag se conoce sin generarla
+    headers = {"ETag": file_etag(f"{info['file_hash']}-{size}.{format}"), "Cache-Control": "private, max-age=86400"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    # Fijada hasta terminar el envío: el desalojo LRU no puede borrarla por debajo.
+    # No se delega en nginx (X-Accel-Redirect): la leería después de soltarla
+    cache = await asyncio.to_thread(get_thumbnail_cache)
+    try:
+        path = await cache.acquire(info["file_hash"], info["storage_path"], size, format)
+    except InvalidImageError:
+        raise HTTPException(status_code=415, detail="El archivo no es una imagen válida")
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return BlobFileResponse(path, headers=headers, media_type=f"image/{format}",
+                            on_close=lambda: cache.release(path))
+
+@app.post("/uploads", response_model=SesionSubida)
+async def create_upload_session(sesion: SesionSubidaCrear, user_id: str = Depends(current_user)):
+    return await run_manager(get_upload_manager, "create_session", user_id, sesion.nombre, sesion.tamano,
+                             chunk_size=sesion.tamano_parte, file_hash=sesion.hash_archivo,
+                             folder_id=sesion.id_carpeta)
+
+@app.get("/uploads/{session_id}", response_model=SesionSubida)
+async def get_upload_session(session_id: str, user_id: str = Depends(current_user)):
+    sesion = await run_manager(get_upload_manager, "get_session", user_id, session_id)
+    if sesion:
+        return sesion
+    raise HTTPException(status_code=404, detail="Sesión de subida no encontrada")
+
+@app.put("/uploads/{session_id}/chunks/{index}", response_model=ParteSubida)
+async def upload_chunk(session_id: str, index: int, request: Request,
+                       x_chunk_hash: Optional[str] = Header(None), user_id: str = Depends(current_user)):
+    # El cuerpo va directo a un temporal del directorio de subidas según llega de la
+    # red; el hilo de run_db solo calcula el hash y lo mueve a su sitio
+    path = await run_manager(get_upload_manager, "chunk_temp_file")
+    try:
+        await receive_body(request, path, MAX_CHUNK_SIZE)
+        return await run_manager(get_upload_manager, "put_chunk", user_id, session_id, index, path,
+                                 chunk_hash=x_chunk_hash)
+    finally:
+        await asyncio.to_thread(path.unlink, missing_ok=True)
+
+@app.post("/uploads/{session_id}/complete", response_model=ArchivoSubido)
+async def complete_upload(session_id: str, user_id: str = Depends(current_user)):
+    return await run_manager(get_upload_manager, "complete_session", user_id, session_id)
+
+@app.delete("/uploads/{session_id}")
+async def abort_upload(session_id: str, user_id: str = Depends(current_user)):
+    if await run_manager(get_upload_manager, "abort_session", user_id, session_id):
+        return {"message": "Sesión de subida cancelada"}
+    raise HTTPException(status_code=404, detail="Sesión de subida no encontrada o ya cerrada")
 
 
 if __name__ == "__main__":
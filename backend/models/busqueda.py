@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class ResultadoBusqueda(BaseModel):
+    kind: str
+    id: str
+    name: str
+    parent_id: Optional[str] = None
+    updated_at: Optional[datetime] = None
@@ -11,3 +11,30 @@ class Carpetas(BaseModel):
     id_carpeta_padre: Optional[int] = None
     id_color: Optional[int] = None
     estado_papelera: Optional[int] = None
+
+
+class NodoCarpeta(BaseModel):
+    id: str
+    name: str
+    parent_folder_id: Optional[str] = None
+    user_id: str
+    depth: int
+    color: Optional[str] = None
+    is_deleted: bool = False
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    total_files: Optional[int] = None
+    total_folders: Optional[int] = None
+    total_size: Optional[int] = None
+
+
+class EstadisticasCarpeta(BaseModel):
+    total_files: int
+    total_folders: int
+    total_size: int
+
+
+class ResultadoPapelera(BaseModel):
+    folders: int
+    files: int
+    bytes: int
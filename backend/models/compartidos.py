@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Literal, Optional
 
 class Compartidos(BaseModel):
     id_usuario_receptor: Optional[int] = Field(..., description="ID del usuario que recibe el acceso")
@@ -7,3 +7,8 @@ class Compartidos(BaseModel):
     id_carpeta_compartida: Optional[int] = Field(None, description="ID de la carpeta compartida")
     id_archivo_compartido: Optional[int] = Field(None, description="ID del archivo compartido")
     id_tipo_acceso: Optional[int] = Field(..., description="ID del tipo de acceso")
+
+
+class CompartirRecurso(BaseModel):
+    email: str = Field(..., description="Email del usuario con quien se comparte")
+    access_type: Literal["solo_lectura", "lectura_escritura"] = "solo_lectura"
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+# Máximo de filas aceptadas por petición en los endpoints /batch
+MAX_BATCH_SIZE = 5000
+
+class ResultadoLote(BaseModel):
+    indice: int = Field(..., description="Posición de la fila en el lote recibido")
+    ok: bool = Field(..., description="True si la fila se insertó")
+    error: Optional[str] = Field(None, description="Mensaje de Oracle si la fila falló")
+
+class MovimientoLote(BaseModel):
+    file_ids: List[str] = Field(default_factory=list, max_length=MAX_BATCH_SIZE)
+    folder_ids: List[str] = Field(default_factory=list, max_length=MAX_BATCH_SIZE)
+    target_folder_id: Optional[str] = Field(None, description="Carpeta destino; sin ella, la raíz")
+
+class ResultadoMovimiento(BaseModel):
+    id: str
+    tipo: Literal["archivo", "carpeta"]
+    ok: bool = Field(..., description="True si el elemento quedó en el destino")
+    error: Optional[str] = Field(None, description="Motivo si el elemento no se movió")
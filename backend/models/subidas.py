@@ -0,0 +1,41 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+class SesionSubidaCrear(BaseModel):
+    nombre: str = Field(..., description="Nombre original del archivo")
+    tamano: int = Field(..., gt=0, description="Tamaño total en bytes")
+    tamano_parte: Optional[int] = Field(None, description="Tamaño de cada parte (8MB por defecto)")
+    hash_archivo: Optional[str] = Field(None, description="SHA-256 esperado del archivo completo")
+    id_carpeta: Optional[str] = None
+
+class SesionSubida(BaseModel):
+    id: str
+    name: str
+    folder_id: Optional[str] = None
+    file_size: int
+    chunk_size: int
+    total_chunks: int
+    file_hash: Optional[str] = None
+    status: str
+    file_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    received_chunks: List[int] = []
+    missing_chunks: List[int] = []
+
+class ParteSubida(BaseModel):
+    index: int
+    size: int
+    chunk_hash: str
+
+class ArchivoSubido(BaseModel):
+    id: str
+    name: str
+    file_type: str
+    file_size: int
+    file_hash: str
+    folder_id: Optional[str] = None
+    url: str
+    thumbnail_url: Optional[str] = None
+    created_at: datetime
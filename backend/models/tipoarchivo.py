@@ -0,0 +1,6 @@
+from pydantic import BaseModel, Field
+
+class TiposArchivos(BaseModel):
+    id_tipo_archivo: int = Field(..., description="ID del tipo de archivo, clave primaria")
+    nombre: str = Field(..., max_length=50, description="Nombre del tipo de archivo")
+    extension: str = Field(..., max_length=10, description="Extensión asociada al tipo")
@@ -0,0 +1,292 @@
+# Módulo de Permisos (permissions.py)
+# Resolución por lotes de permisos sobre archivos y carpetas con caché de ACL por usuario
+
+import os
+import time
+import uuid
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.metrics import execute
+
+# Tipos de recurso
+FILE, FOLDER = "archivo", "carpeta"
+
+# Niveles de acceso de mayor a menor (tipo_acceso.nombre más el propietario)
+OWNER, READ_WRITE, READ_ONLY = "propietario", "lectura_escritura", "solo_lectura"
+ACCESS_RANK = {OWNER: 3, READ_WRITE: 2, READ_ONLY: 1}
+
+# Nivel mínimo para cada tipo de acceso pedido
+REQUIRED_LEVEL = {"read": READ_ONLY, "write": READ_WRITE}
+
+# Segundos que se confía en una ACL cacheada; acota el efecto de cambios hechos fuera de grant/revoke
+permission_cache_ttl = float(os.getenv("PERMISSION_CACHE_TTL", "30"))
+
+Resource = Tuple[str, str]
+
+
+class AccessCache:
+    """
+    ACL por usuario en memoria: (tipo, id) -> nivel (None = sin acceso).
+    Compartida por los hilos del proceso para que una invalidación los alcance a todos.
+    """
+
+    def __init__(self, ttl: float = permission_cache_ttl, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._users: Dict[str, Tuple[float, Dict[Resource, Optional[str]]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def lookup(self, user_id: str, resources: Iterable[Resource]) -> Tuple[Dict[Resource, Optional[str]], List[Resource]]:
+        """Devuelve (niveles cacheados, recursos que faltan)."""
+        found, missing = {}, []
+        with self._lock:
+            expires_at, acl = self._users.get(user_id, (0.0, None))
+            if acl is not None and time.monotonic() >= expires_at:
+                del self._users[user_id]
+                acl = None
+            for resource in resources:
+                if acl is not None and resource in acl:
+                    found[resource] = acl[resource]
+                else:
+                    missing.append(resource)
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(missing)
+        return found, missing
+
+    def store(self, user_id: str, levels: Dict[Resource, Optional[str]]) -> None:
+        with self._lock:
+            expires_at, acl = self._users.get(user_id, (0.0, None))
+            if acl is None or time.monotonic() >= expires_at or len(acl) + len(levels) > self.max_entries:
+                # El TTL cuenta desde la primera carga: la ACL entera caduca a la vez
+                expires_at, acl = time.monotonic() + self.ttl, {}
+                self._users[user_id] = (expires_at, acl)
+            acl.update(levels)
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+        self.stats["invalidations"] += 1
+
+    def invalidate_resource(self, resource: Resource) -> None:
+        """Olvidar un recurso en todas las ACL (sus compartidos cambiaron)."""
+        with self._lock:
+            for _, acl in self._users.values():
+                acl.pop(resource, None)
+        self.stats["invalidations"] += 1
+
+    def invalidate_resources(self, resources: Iterable[Resource]) -> None:
+        """Olvidar muchos recursos a la vez (p. ej. un subárbol purgado) con una pasada por ACL."""
+        resources = set(resources)
+        with self._lock:
+            for _, acl in self._users.values():
+                for resource in [resource for resource in acl if resource in resources]:
+                    del acl[resource]
+        self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+        self.stats["invalidations"] += 1
+
+    def info(self) -> Dict[str, int]:
+        with self._lock:
+            users = len(self._users)
+            entries = sum(len(acl) for _, acl in self._users.values())
+        return {"users": users, "entries": entries, "ttl": self.ttl, **self.stats}
+
+
+class PermissionResolver:
+    """
+    Resuelve el nivel de acceso de uno o varios usuarios sobre un lote de archivos y
+    carpetas con una sola consulta (propietarios + compartidos activos), y guarda el
+    resultado en la ACL del usuario para las comprobaciones siguientes.
+    """
+
+    def __init__(self, db_connection, cache: Optional[AccessCache] = None):
+        """
+        Inicializa el resolvedor de permisos.
+
+        Args:
+            db_connection: Conexión a la base de datos
+            cache: ACL compartida (por defecto una propia de esta instancia)
+        """
+        self.db = db_connection
+        self.cache = cache if cache is not None else AccessCache()
+
+    def resolve(self, pairs: Iterable[Tuple[str, Resource]]) -> Dict[Tuple[str, Resource], Optional[str]]:
+        """
+        Nivel de acceso de cada par (usuario, (tipo, id)).
+
+        Returns:
+            Diccionario par -> OWNER / READ_WRITE / READ_ONLY, o None si no tiene acceso
+        """
+        by_user: Dict[str, List[Resource]] = {}
+        for user_id, resource in pairs:
+            by_user.setdefault(user_id, []).append(resource)
+
+        levels = {}
+        pending: Dict[str, List[Resource]] = {}
+        for user_id, resources in by_user.items():
+            found, missing = self.cache.lookup(user_id, resources)
+            levels.update({(user_id, resource): level for resource, level in found.items()})
+            if missing:
+                pending[user_id] = missing
+
+        if pending:
+            loaded = self._load(pending)
+            for user_id, resources in pending.items():
+                user_levels = {resource: loaded.get((user_id, resource)) for resource in resources}
+                self.cache.store(user_id, user_levels)
+                levels.update({(user_id, resource): level for resource, level in user_levels.items()})
+
+        return levels
+
+    def check(self, user_id: str, resource: Resource, access_type: str = "read") -> bool:
+        """True si el usuario tiene al menos el acceso pedido ("read" o "write")."""
+        return self.check_many(user_id, [resource], access_type)[resource]
+
+    def check_many(self, user_id: str, resources: Iterable[Resource],
+                   access_type: str = "read") -> Dict[Resource, bool]:
+        """Comprobar un lote de recursos de un usuario con una sola consulta."""
+        required = ACCESS_RANK.get(REQUIRED_LEVEL.get(access_type), 99)
+        levels = self.resolve((user_id, resource) for resource in resources)
+        return {resource: ACCESS_RANK.get(level, 0) >= required for (_, resource), level in levels.items()}
+
+    def remember(self, user_id: str, levels: Dict[Resource, Optional[str]]) -> None:
+        """Guardar en la ACL niveles ya obtenidos por otra consulta (p. ej. el listado de compartidos)."""
+        self.cache.store(user_id, levels)
+
+    def user_for_email(self, email: str) -> str:
+        """
+        ID en la base de almacenamiento del usuario con ese email (el del JWT); se
+        registra la primera vez que se autentica, y desde entonces ve lo compartido con él.
+        """
+        try:
+            self._execute(
+                "user_for_email.register",
+                "INSERT OR IGNORE INTO usuarios (id, email) VALUES (:user_id, :email)",
+                {'user_id': f"user_{uuid.uuid4().hex[:12]}", 'email': email},
+            )
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return self._execute("user_for_email", "SELECT id FROM usuarios WHERE email = :email", {'email': email}).fetchone()[0]
+
+    def share(self, user_id: str, resource: Resource, email: str, access_type: str = READ_ONLY) -> None:
+        """Compartir un recurso en nombre de su propietario."""
+        self._require_owner(user_id, resource)
+        self.grant(resource, email, access_type)
+
+    def unshare(self, user_id: str, resource: Resource, email: str) -> bool:
+        """Dejar de compartir un recurso en nombre de su propietario."""
+        self._require_owner(user_id, resource)
+        return self.revoke(resource, email)
+
+    def grant(self, resource: Resource, email: str, access_type: str = READ_ONLY) -> None:
+        """Compartir (o cambiar el nivel de) un archivo o carpeta con un email."""
+        if access_type not in (READ_ONLY, READ_WRITE):
+            raise ValueError(f"Tipo de acceso desconocido: {access_type}")
+        kind, resource_id = resource
+        column = self._share_column(kind)
+        params = {'resource_id': resource_id, 'email': email}
+        try:
+            self._execute("revoke", f"DELETE FROM compartidos WHERE {column} = :resource_id AND email_compartido = :email", params)
+            self._execute(
+                "grant",
+                f"""
+                INSERT INTO compartidos ({column}, email_compartido, tipo_acceso_id, activo)
+                SELECT :resource_id, :email, id, 1 FROM tipo_acceso WHERE nombre = :access_type
+                """,
+                {**params, 'access_type': access_type},
+            )
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self.cache.invalidate_resource(resource)
+
+    def revoke(self, resource: Resource, email: str) -> bool:
+        """Dejar de compartir un archivo o carpeta con un email."""
+        kind, resource_id = resource
+        try:
+            cursor = self._execute(
+                "revoke",
+                f"DELETE FROM compartidos WHERE {self._share_column(kind)} = :resource_id AND email_compartido = :email",
+                {'resource_id': resource_id, 'email': email},
+            )
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self.cache.invalidate_resource(resource)
+        return cursor.rowcount > 0
+
+    def invalidate(self, resource: Resource) -> None:
+        """Olvidar un recurso cuyos compartidos cambiaron por otra vía (p. ej. al purgarlo)."""
+        self.cache.invalidate_resource(resource)
+
+    def invalidate_many(self, resources: Iterable[Resource]) -> None:
+        """Olvidar varios recursos borrados de una vez."""
+        self.cache.invalidate_resources(resources)
+
+    def _require_owner(self, user_id: str, resource: Resource) -> None:
+        if self.resolve([(user_id, resource)])[(user_id, resource)] != OWNER:
+            raise PermissionError("Solo el propietario puede cambiar los compartidos")
+
+    def _load(self, pending: Dict[str, List[Resource]]) -> Dict[Tuple[str, Resource], str]:
+        params = {}
+
+        def placeholders(prefix: str, values) -> str:
+            names = []
+            for i, value in enumerate(values):
+                params[f"{prefix}{i}"] = value
+                names.append(f":{prefix}{i}")
+            return ", ".join(names) or "NULL"
+
+        users = placeholders("u", pending)
+        file_ids = placeholders("f", sorted({rid for rs in pending.values() for kind, rid in rs if kind == FILE}))
+        folder_ids = placeholders("c", sorted({rid for rs in pending.values() for kind, rid in rs if kind == FOLDER}))
+
+        query = f"""
+        SELECT 'archivo' as kind, a.id as resource_id, a.usuario_id as user_id, '{OWNER}' as access_type
+        FROM archivos a
+        WHERE a.id IN ({file_ids}) AND a.usuario_id IN ({users})
+        UNION ALL
+        SELECT 'carpeta', c.id, c.usuario_id, '{OWNER}'
+        FROM carpetas c
+        WHERE c.id IN ({folder_ids}) AND c.usuario_id IN ({users})
+        UNION ALL
+        SELECT 'archivo', s.archivo_id, u.id, ta.nombre
+        FROM compartidos s
+        JOIN usuarios u ON u.email = s.email_compartido
+        JOIN tipo_acceso ta ON ta.id = s.tipo_acceso_id
+        WHERE s.archivo_id IN ({file_ids}) AND u.id IN ({users}) AND s.activo = 1
+        UNION ALL
+        SELECT 'carpeta', s.carpeta_id, u.id, ta.nombre
+        FROM compartidos s
+        JOIN usuarios u ON u.email = s.email_compartido
+        JOIN tipo_acceso ta ON ta.id = s.tipo_acceso_id
+        WHERE s.carpeta_id IN ({folder_ids}) AND u.id IN ({users}) AND s.activo = 1
+        """
+
+        loaded = {}
+        for kind, resource_id, user_id, access_type in self._execute("resolve", query, params).fetchall():
+            key = (user_id, (kind, resource_id))
+            # Un usuario puede tener varios compartidos sobre el mismo recurso: gana el mayor
+            if ACCESS_RANK.get(access_type, 0) > ACCESS_RANK.get(loaded.get(key), 0):
+                loaded[key] = access_type
+        return loaded
+
+    def _share_column(self, kind: str) -> str:
+        if kind == FILE:
+            return "archivo_id"
+        if kind == FOLDER:
+            return "carpeta_id"
+        raise ValueError(f"Tipo de recurso desconocido: {kind}")
+
+    def _execute(self, name: str, query: str, params: Optional[Dict] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"permissions.{name}", query, params)
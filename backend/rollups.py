@@ -0,0 +1,229 @@
+# Módulo de Totales de Carpetas (rollups.py)
+# Totales recursivos por carpeta (archivos, subcarpetas y bytes) mantenidos de forma
+# incremental sobre la tabla de ancestros
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import execute, executemany
+
+logger = logging.getLogger(__name__)
+
+
+# Totales de las carpetas de {folders} (una tabla o subconsulta con columna id), en
+# una pasada agrupada sobre la tabla de ancestros
+TOTALS_QUERY = """
+SELECT c.id, COALESCE(f.archivos, 0), COALESCE(s.carpetas, 0), COALESCE(f.bytes, 0)
+FROM {folders} c
+LEFT JOIN (
+    SELECT a.ancestro_id, COUNT(*) as archivos, SUM(x.tamaño) as bytes
+    FROM carpetas_ancestros a
+    JOIN archivos x ON x.carpeta_id = a.descendiente_id
+    WHERE a.ancestro_id IN (SELECT id FROM {folders}) AND x.eliminado = 0
+    GROUP BY a.ancestro_id
+) f ON f.ancestro_id = c.id
+LEFT JOIN (
+    SELECT a.ancestro_id, COUNT(*) as carpetas
+    FROM carpetas_ancestros a
+    JOIN carpetas d ON d.id = a.descendiente_id
+    WHERE a.ancestro_id IN (SELECT id FROM {folders}) AND a.profundidad > 0 AND d.eliminado = 0
+    GROUP BY a.ancestro_id
+) s ON s.ancestro_id = c.id
+"""
+
+
+class FolderRollups:
+    """
+    Mantiene carpetas_totales: por cada carpeta, los archivos, subcarpetas y bytes
+    no eliminados de todo su subárbol. Cada cambio suma o resta en las filas de
+    los ancestros con un solo UPDATE sobre carpetas_ancestros, así que leer los
+    totales de cualquier carpeta es una búsqueda por clave primaria.
+
+    Cuenta cada fila según su propio eliminado: un archivo en la papelera deja de
+    contar aunque su carpeta no lo esté, y viceversa.
+
+    Los métodos de escritura no confirman: se llaman dentro de la transacción de
+    la operación (FileManager, FolderManager).
+    """
+
+    def __init__(self, db_connection):
+        """
+        Inicializa los totales de carpetas.
+
+        Args:
+            db_connection: Conexión a la base de datos
+        """
+        self.db = db_connection
+
+    def get(self, folder_id: str) -> Optional[Dict[str, int]]:
+        """Totales recursivos de una carpeta, o None si no existe."""
+        row = self._execute(
+            "get",
+            """
+            SELECT archivos as total_files, carpetas as total_folders, bytes as total_size
+            FROM carpetas_totales
+            WHERE carpeta_id = :folder_id
+            """,
+            {'folder_id': folder_id},
+        ).fetchone()
+        return dict(row) if row else None
+
+    def add_folder(self, folder_id: str) -> None:
+        """Registrar una carpeta nueva (vacía) y contarla en sus ancestros."""
+        self._execute(
+            "add_folder",
+            "INSERT INTO carpetas_totales (carpeta_id, archivos, carpetas, bytes) VALUES (:folder_id, 0, 0, 0)",
+            {'folder_id': folder_id},
+        )
+        self.count_folder(folder_id, 1)
+
+    def count_folder(self, folder_id: str, sign: int) -> None:
+        """Sumar (1) o restar (-1) una carpeta en sus ancestros, p. ej. al eliminarla o restaurarla."""
+        self._execute(
+            "count_folder",
+            """
+            UPDATE carpetas_totales
+            SET carpetas = carpetas + :sign
+            WHERE carpeta_id IN (
+                SELECT ancestro_id FROM carpetas_ancestros
+                WHERE descendiente_id = :folder_id AND profundidad > 0
+            )
+            """,
+            {'folder_id': folder_id, 'sign': sign},
+        )
+
+    def shift_subtree(self, folder_id: str, sign: int) -> None:
+        """
+        Restar (-1) el subárbol de una carpeta de sus ancestros antes de moverla, o
+        sumarlo (1) en los nuevos después de actualizar la tabla de ancestros.
+        """
+        self._execute(
+            "shift_subtree",
+            """
+            UPDATE carpetas_totales
+            SET archivos = archivos + :sign * (SELECT archivos FROM carpetas_totales WHERE carpeta_id = :folder_id),
+                carpetas = carpetas + :sign * (
+                    (SELECT carpetas FROM carpetas_totales WHERE carpeta_id = :folder_id)
+                    + (SELECT 1 - eliminado FROM carpetas WHERE id = :folder_id)
+                ),
+                bytes = bytes + :sign * (SELECT bytes FROM carpetas_totales WHERE carpeta_id = :folder_id)
+            WHERE carpeta_id IN (
+                SELECT ancestro_id FROM carpetas_ancestros
+                WHERE descendiente_id = :folder_id AND profundidad > 0
+            )
+            """,
+            {'folder_id': folder_id, 'sign': sign},
+        )
+
+    def count_file(self, file_id: str, sign: int) -> None:
+        """
+        Sumar (1) o restar (-1) un archivo en la carpeta que lo contiene y sus
+        ancestros. Solo se llama cuando el archivo entra o sale de lo contado:
+        al insertarlo, eliminarlo, restaurarlo, purgarlo sin estar eliminado, o
+        antes y después de mover uno no eliminado.
+        """
+        self._execute(
+            "count_file",
+            """
+            UPDATE carpetas_totales
+            SET archivos = archivos + :sign,
+                bytes = bytes + :sign * (SELECT tamaño FROM archivos WHERE id = :file_id)
+            WHERE carpeta_id IN (
+                SELECT a.ancestro_id
+                FROM archivos f
+                JOIN carpetas_ancestros a ON a.descendiente_id = f.carpeta_id
+                WHERE f.id = :file_id
+            )
+            """,
+            {'file_id': file_id, 'sign': sign},
+        )
+
+    def shift_files(self, totals: Dict[str, Tuple[int, int]], sign: int) -> None:
+        """
+        Sumar (1) o restar (-1) archivos ya agrupados por carpeta, {carpeta: (archivos,
+        bytes)}, en cada carpeta y sus ancestros; p. ej. al mover un lote de archivos.
+        """
+        self._executemany(
+            "shift_files",
+            """
+            UPDATE carpetas_totales
+            SET archivos = archivos + ?, bytes = bytes + ?
+            WHERE carpeta_id IN (SELECT ancestro_id FROM carpetas_ancestros WHERE descendiente_id = ?)
+            """,
+            [(sign * files, sign * size, folder_id) for folder_id, (files, size) in totals.items() if folder_id],
+        )
+
+    def ensure(self) -> bool:
+        """
+        Recalcular los totales si alguna carpeta no tiene fila (p. ej. una base
+        anterior a la tabla). Devuelve True si se recalcularon.
+        """
+        missing = self._execute(
+            "ensure",
+            """
+            SELECT 1 FROM carpetas c
+            WHERE NOT EXISTS (SELECT 1 FROM carpetas_totales t WHERE t.carpeta_id = c.id)
+            LIMIT 1
+            """,
+        ).fetchone()
+        if missing is None:
+            return False
+        try:
+            self.rebuild()
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return True
+
+    def rebuild(self) -> int:
+        """Recalcular todos los totales desde archivos y carpetas_ancestros (sin confirmar)."""
+        self._execute("rebuild.clear", "DELETE FROM carpetas_totales")
+        cursor = self._execute(
+            "rebuild",
+            "INSERT INTO carpetas_totales (carpeta_id, archivos, carpetas, bytes) " + TOTALS_QUERY.format(folders="carpetas"),
+        )
+        logger.info(f"Totales de carpetas recalculados ({cursor.rowcount} carpetas)")
+        return cursor.rowcount
+
+    def rebuild_subtree(self, folder_id: str) -> int:
+        """Recalcular los totales de las carpetas de un subárbol, p. ej. al restaurarlo (sin confirmar)."""
+        subtree = "(SELECT id FROM carpetas WHERE id IN (SELECT descendiente_id FROM carpetas_ancestros WHERE ancestro_id = :folder_id))"
+        cursor = self._execute(
+            "rebuild_subtree",
+            "INSERT OR REPLACE INTO carpetas_totales (carpeta_id, archivos, carpetas, bytes) "
+            + TOTALS_QUERY.format(folders=subtree),
+            {'folder_id': folder_id},
+        )
+        return cursor.rowcount
+
+    def clear_subtree(self, folder_id: str) -> None:
+        """Dejar en cero los totales de un subárbol cuyo contenido se eliminó entero (sin confirmar)."""
+        self._execute(
+            "clear_subtree",
+            """
+            UPDATE carpetas_totales
+            SET archivos = 0, carpetas = 0, bytes = 0
+            WHERE carpeta_id IN (SELECT descendiente_id FROM carpetas_ancestros WHERE ancestro_id = :folder_id)
+            """,
+            {'folder_id': folder_id},
+        )
+
+    def remove_subtree(self, folder_id: str) -> None:
+        """Borrar las filas de un subárbol purgado (antes de borrar sus ancestros; sin confirmar)."""
+        self._execute(
+            "remove_subtree",
+            """
+            DELETE FROM carpetas_totales
+            WHERE carpeta_id IN (SELECT descendiente_id FROM carpetas_ancestros WHERE ancestro_id = :folder_id)
+            """,
+            {'folder_id': folder_id},
+        )
+
+    def _execute(self, name: str, query: str, params: Optional[Dict] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"rollups.{name}", query, params)
+
+    def _executemany(self, name: str, query: str, rows: List[tuple]):
+        """Ejecutar una sentencia por lotes de parámetros registrando latencia en utils.metrics."""
+        return executemany(self.db, f"rollups.{name}", query, rows)
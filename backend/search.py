@@ -0,0 +1,476 @@
+# Módulo de Búsqueda (search.py)
+# Índice de tokens y trigramas sobre nombres de archivos y carpetas
+
+import re
+import math
+import unicodedata
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from permissions import FILE, FOLDER
+from utils.metrics import execute, executemany
+from utils.pagination import decode_cursor, encode_cursor
+
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+")
+
+# Similitud mínima (Jaccard de trigramas, el mismo umbral por defecto que pg_trgm)
+FUZZY_THRESHOLD = 0.3
+# Tokens aproximados por término, los más parecidos primero
+MAX_FUZZY_TOKENS = 20
+# Términos por consulta
+MAX_TERMS = 8
+
+# Coincidencias estimadas hasta las que se leen todas y se ordenan por fecha;
+# por encima se recorre la tabla en orden de fecha hasta llenar la página
+CANDIDATE_LIMIT = 5000
+
+SEARCH_KEYSET = ("updated_at", "id")
+
+# Tabla, alias, columna padre e índice por fecha de cada tipo de recurso
+SEARCH_TABLES = {
+    FILE: ("archivos", "a", "carpeta_id", "idx_archivos_usuario_recientes"),
+    FOLDER: ("carpetas", "c", "carpeta_padre_id", "idx_carpetas_usuario_recientes"),
+}
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin acentos: 'Canción' -> 'cancion'."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(name: str) -> List[str]:
+    """Palabras del nombre normalizado, sin repetir ('Informe_Final.pdf' -> informe, final, pdf)."""
+    return list(dict.fromkeys(TOKEN_PATTERN.findall(normalize(name))))
+
+
+def trigrams(token: str) -> set:
+    """Trigramas con el relleno de pg_trgm: el inicio de palabra pesa más que el final."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _prefix_bounds(term: str) -> Tuple[str, str]:
+    """Rango [lo, hi) de los tokens que empiezan por term (usa el índice, a diferencia de LIKE)."""
+    return term, term[:-1] + chr(ord(term[-1]) + 1)
+
+
+class SearchIndex:
+    """
+    Índice invertido por propietario: cada nombre se divide en tokens normalizados y
+    cada término de la consulta se resuelve como prefijo con un rango sobre la clave
+    primaria. Los términos sin ninguna coincidencia por prefijo se buscan de forma
+    aproximada en los trigramas del vocabulario del usuario (p. ej. 'infrome').
+
+    El índice se mantiene al crear, renombrar y purgar; los elementos en la papelera
+    siguen indexados y se filtran al consultar. Al arrancar, un hilo construye por
+    lotes el índice de los usuarios con archivos anteriores al índice; si uno busca
+    antes de que le llegue el turno, su búsqueda lo construye (también por lotes).
+    """
+
+    def __init__(self, db_connection):
+        """
+        Inicializa el índice de búsqueda.
+
+        Args:
+            db_connection: Conexión a la base de datos
+        """
+        self.db = db_connection
+
+    def add(self, kind: str, resource_id: str, user_id: str, name: str) -> None:
+        """Indexar un nombre (sin commit: forma parte de la transacción del llamador)."""
+        tokens = tokenize(name)
+        if not tokens:
+            return
+
+        self._executemany(
+            "add.tokens",
+            "INSERT OR IGNORE INTO busqueda_tokens (usuario_id, token, tipo, recurso_id) VALUES (?, ?, ?, ?)",
+            [(user_id, token, kind, resource_id) for token in tokens],
+        )
+
+        new_tokens = []
+        for token in tokens:
+            cursor = self._execute(
+                "add.vocabulary",
+                "UPDATE busqueda_vocabulario SET documentos = documentos + 1 WHERE usuario_id = :user_id AND token = :token",
+                {'user_id': user_id, 'token': token},
+            )
+            if cursor.rowcount == 0:
+                new_tokens.append(token)
+
+        if new_tokens:
+            self._executemany(
+                "add.new_vocabulary",
+                "INSERT INTO busqueda_vocabulario (usuario_id, token, documentos) VALUES (?, ?, 1)",
+                [(user_id, token) for token in new_tokens],
+            )
+            self._executemany(
+                "add.trigrams",
+                "INSERT OR IGNORE INTO busqueda_trigramas (usuario_id, trigrama, token) VALUES (?, ?, ?)",
+                [(user_id, gram, token) for token in new_tokens for gram in trigrams(token)],
+            )
+
+    def remove(self, kind: str, resource_id: str) -> None:
+        """Quitar un recurso del índice (sin commit)."""
+        rows = self._execute(
+            "remove.select",
+            "SELECT usuario_id, token FROM busqueda_tokens WHERE tipo = :kind AND recurso_id = :resource_id",
+            {'kind': kind, 'resource_id': resource_id},
+        ).fetchall()
+        if not rows:
+            return
+
+        self._execute(
+            "remove.tokens",
+            "DELETE FROM busqueda_tokens WHERE tipo = :kind AND recurso_id = :resource_id",
+            {'kind': kind, 'resource_id': resource_id},
+        )
+        pairs = [(row[0], row[1]) for row in rows]
+        self._executemany(
+            "remove.vocabulary",
+            "UPDATE busqueda_vocabulario SET documentos = documentos - 1 WHERE usuario_id = ? AND token = ?",
+            pairs,
+        )
+
+        # Tokens que ya no aparecen en ningún nombre: fuera del vocabulario y sus trigramas
+        unused = [
+            pair for pair in pairs
+            if self._execute(
+                "remove.unused",
+                "SELECT documentos FROM busqueda_vocabulario WHERE usuario_id = :user_id AND token = :token",
+                {'user_id': pair[0], 'token': pair[1]},
+            ).fetchone()[0] <= 0
+        ]
+        if unused:
+            self._executemany("remove.unused_vocabulary",
+                              "DELETE FROM busqueda_vocabulario WHERE usuario_id = ? AND token = ?", unused)
+            self._executemany("remove.unused_trigrams",
+                              "DELETE FROM busqueda_trigramas WHERE usuario_id = ? AND token = ?", unused)
+
+    def remove_many(self, kind: str, resource_ids: Sequence[str], batch_size: int = 500) -> None:
+        """Quitar muchos recursos del índice por lotes, p. ej. al purgar un subárbol (sin commit)."""
+        documents: Dict[Tuple[str, str], int] = {}
+        for start in range(0, len(resource_ids), batch_size):
+            batch = list(resource_ids[start:start + batch_size])
+            placeholders = ", ".join("?" * len(batch))
+            rows = self._execute(
+                "remove_many.select",
+                f"SELECT usuario_id, token FROM busqueda_tokens WHERE tipo = ? AND recurso_id IN ({placeholders})",
+                [kind, *batch],
+            ).fetchall()
+            for row in rows:
+                documents[(row[0], row[1])] = documents.get((row[0], row[1]), 0) + 1
+            self._execute(
+                "remove_many.tokens",
+                f"DELETE FROM busqueda_tokens WHERE tipo = ? AND recurso_id IN ({placeholders})",
+                [kind, *batch],
+            )
+        if not documents:
+            return
+
+        self._executemany(
+            "remove_many.vocabulary",
+            "UPDATE busqueda_vocabulario SET documentos = documentos - ? WHERE usuario_id = ? AND token = ?",
+            [(count, user_id, token) for (user_id, token), count in documents.items()],
+        )
+        # Tokens sin documentos de los usuarios afectados: fuera del vocabulario y sus trigramas
+        for user_id in {user_id for user_id, _ in documents}:
+            params = {'user_id': user_id}
+            self._execute(
+                "remove_many.unused_trigrams",
+                """
+                DELETE FROM busqueda_trigramas
+                WHERE usuario_id = :user_id AND token IN (
+                    SELECT token FROM busqueda_vocabulario WHERE usuario_id = :user_id AND documentos <= 0
+                )
+                """,
+                params,
+            )
+            self._execute(
+                "remove_many.unused_vocabulary",
+                "DELETE FROM busqueda_vocabulario WHERE usuario_id = :user_id AND documentos <= 0",
+                params,
+            )
+
+    def rename(self, kind: str, resource_id: str, user_id: str, name: str) -> None:
+        """Reindexar un recurso con su nombre nuevo (sin commit)."""
+        self.remove(kind, resource_id)
+        self.add(kind, resource_id, user_id, name)
+
+    def ensure_user(self, user_id: str) -> None:
+        """Construir el índice del usuario si el relleno de arranque aún no llegó a él."""
+        row = self._execute(
+            "ensure_user",
+            "SELECT 1 FROM busqueda_usuarios WHERE usuario_id = :user_id",
+            {'user_id': user_id},
+        ).fetchone()
+        if not row:
+            self.rebuild_user(user_id)
+
+    def pending_users(self) -> List[str]:
+        """Usuarios con archivos o carpetas cuyo índice aún no se construyó."""
+        rows = self._execute(
+            "pending_users",
+            """
+            SELECT usuario_id FROM archivos
+            WHERE usuario_id NOT IN (SELECT usuario_id FROM busqueda_usuarios)
+            UNION
+            SELECT usuario_id FROM carpetas
+            WHERE usuario_id NOT IN (SELECT usuario_id FROM busqueda_usuarios)
+            """,
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def backfill(self) -> int:
+        """
+        Construir el índice de todos los usuarios pendientes (lo ejecuta un hilo al
+        arrancar la API). Devuelve el número de usuarios indexados.
+        """
+        users = self.pending_users()
+        for user_id in users:
+            self.rebuild_user(user_id)
+        return len(users)
+
+    def rebuild_user(self, user_id: str, batch_size: int = 2000) -> int:
+        """
+        Construir el índice de un usuario desde archivos y carpetas por lotes de
+        batch_size nombres, confirmando cada lote: las escrituras de otras
+        peticiones no esperan a que termine el usuario entero.
+
+        Es idempotente y convive con add/remove concurrentes: las entradas se
+        insertan con INSERT OR IGNORE y, en la misma transacción, el vocabulario de
+        los tokens del lote se recalcula contando sus entradas, así que siempre es
+        exacto. Al terminar se marca al usuario como indexado.
+
+        Returns:
+            Número de recursos indexados
+        """
+        indexed = 0
+        for kind, table in ((FILE, "archivos"), (FOLDER, "carpetas")):
+            after = ""
+            while True:
+                try:
+                    rows = self._execute(
+                        f"rebuild.select_{table}",
+                        f"""
+                        SELECT id, nombre FROM {table}
+                        WHERE usuario_id = :user_id AND id > :after
+                        ORDER BY id
+                        LIMIT :batch_size
+                        """,
+                        {'user_id': user_id, 'after': after, 'batch_size': batch_size},
+                    ).fetchall()
+                    if not rows:
+                        break
+
+                    postings, tokens = [], set()
+                    for resource_id, name in rows:
+                        for token in tokenize(name or ""):
+                            postings.append((user_id, token, kind, resource_id))
+                            tokens.add(token)
+
+                    self._executemany(
+                        "rebuild.tokens",
+                        "INSERT OR IGNORE INTO busqueda_tokens (usuario_id, token, tipo, recurso_id) VALUES (?, ?, ?, ?)",
+                        postings,
+                    )
+                    self._executemany(
+                        "rebuild.vocabulary",
+                        """
+                        INSERT OR REPLACE INTO busqueda_vocabulario (usuario_id, token, documentos)
+                        SELECT usuario_id, token, COUNT(*) FROM busqueda_tokens
+                        WHERE usuario_id = ? AND token = ?
+                        GROUP BY usuario_id, token
+                        """,
+                        [(user_id, token) for token in tokens],
+                    )
+                    self._executemany(
+                        "rebuild.trigrams",
+                        "INSERT OR IGNORE INTO busqueda_trigramas (usuario_id, trigrama, token) VALUES (?, ?, ?)",
+                        [(user_id, gram, token) for token in tokens for gram in trigrams(token)],
+                    )
+                    self.db.commit()
+                except Exception as e:
+                    self.db.rollback()
+                    raise e
+
+                indexed += len(rows)
+                after = rows[-1][0]
+
+        try:
+            self._execute(
+                "rebuild.mark",
+                "INSERT OR REPLACE INTO busqueda_usuarios (usuario_id, fecha_indexado) VALUES (:user_id, :indexed_at)",
+                {'user_id': user_id, 'indexed_at': datetime.now()},
+            )
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            raise e
+
+        return indexed
+
+    def similar_tokens(self, user_id: str, term: str) -> List[str]:
+        """Tokens del vocabulario del usuario parecidos a term (Jaccard de trigramas)."""
+        if len(term) < 3:
+            return []
+        grams = trigrams(term)
+
+        names = [f":g{i}" for i in range(len(grams))]
+        params = {'user_id': user_id, 'min_shared': math.ceil(FUZZY_THRESHOLD * len(grams))}
+        params.update({name[1:]: gram for name, gram in zip(names, sorted(grams))})
+
+        # J = compartidos / (|q| + |t| - compartidos) <= compartidos / |q|: se descarta en SQL lo imposible
+        rows = self._execute(
+            "similar_tokens",
+            f"""
+            SELECT token, COUNT(*) as shared
+            FROM busqueda_trigramas
+            WHERE usuario_id = :user_id AND trigrama IN ({', '.join(names)})
+            GROUP BY token
+            HAVING COUNT(*) >= :min_shared
+            """,
+            params,
+        ).fetchall()
+
+        scored = []
+        for token, shared in rows:
+            similarity = shared / (len(grams) + len(trigrams(token)) - shared)
+            if similarity >= FUZZY_THRESHOLD:
+                scored.append((-similarity, token))
+        return [token for _, token in sorted(scored)[:MAX_FUZZY_TOKENS]]
+
+    def search(self, user_id: str, text: str, kinds: Sequence[str] = (FILE, FOLDER),
+               limit: int = 50, after: Optional[str] = None,
+               fuzzy: bool = True) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Buscar archivos y carpetas del usuario por nombre, de más a menos reciente.
+
+        Args:
+            user_id: ID del usuario
+            text: Términos de búsqueda (cada uno como prefijo de una palabra del nombre)
+            kinds: Tipos de recurso a incluir
+            limit: Resultados por página
+            after: Cursor devuelto por la página anterior
+            fuzzy: Buscar de forma aproximada los términos sin coincidencias por prefijo
+
+        Returns:
+            (resultados, cursor siguiente o None)
+        """
+        terms = self._resolve_terms(user_id, text, fuzzy)
+        if terms is None:
+            return [], None
+        conditions, params, estimate = terms
+
+        if after:
+            params['k0'], params['k1'] = decode_cursor(after, SEARCH_KEYSET)
+
+        # Con pocas coincidencias se leen todas y se ordenan; con muchas es más barato
+        # recorrer la tabla por fecha (índice) y parar en cuanto se llena la página
+        strategy = "candidates" if estimate <= CANDIDATE_LIMIT else "recency_scan"
+        params['limit'] = limit + 1
+
+        rows = []
+        for kind in kinds:
+            query = self._kind_query(kind, conditions, strategy, after is not None)
+            rows += [dict(row) for row in self._execute(f"search.{strategy}", query, params).fetchall()]
+
+        rows.sort(key=lambda row: (row['updated_at'], row['id']), reverse=True)
+        next_cursor = encode_cursor(rows[limit - 1], SEARCH_KEYSET) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def _resolve_terms(self, user_id: str, text: str, fuzzy: bool) -> Optional[Tuple[List[str], Dict, int]]:
+        """
+        Condición sobre busqueda_tokens (alias t) de cada término de la consulta.
+
+        Returns:
+            (condiciones, params, estimación de coincidencias), o None si algún término
+            no coincide con nada
+        """
+        terms = tokenize(text)[:MAX_TERMS]
+        if not terms:
+            return None
+
+        self.ensure_user(user_id)
+
+        params = {'user_id': user_id}
+        resolved = []
+        for i, term in enumerate(terms):
+            lo, hi = _prefix_bounds(term)
+            documents = self._documents("documents.prefix", "token >= :lo AND token < :hi",
+                                        {'user_id': user_id, 'lo': lo, 'hi': hi})
+            if documents:
+                condition = f"t.token >= :lo{i} AND t.token < :hi{i}"
+                params.update({f"lo{i}": lo, f"hi{i}": hi})
+            else:
+                similar = self.similar_tokens(user_id, term) if fuzzy else []
+                if not similar:
+                    return None
+                names = {f"f{i}_{j}": token for j, token in enumerate(similar)}
+                condition = f"t.token IN ({', '.join(':' + name for name in names)})"
+                params.update(names)
+                documents = self._documents("documents.fuzzy", condition.replace("t.token", "token"),
+                                            {'user_id': user_id, **names})
+            resolved.append((documents, condition))
+
+        # El término más selectivo primero: acota los candidatos y corta antes los EXISTS
+        resolved.sort(key=lambda item: item[0])
+        return [condition for _, condition in resolved], params, resolved[0][0]
+
+    def _kind_query(self, kind: str, conditions: List[str], strategy: str, has_after: bool) -> str:
+        table, alias, parent, recency_index = SEARCH_TABLES[kind]
+        keyset = ""
+        if has_after:
+            # Equivale a (fecha, id) < (:k0, :k1) pero deja usar el índice por fecha
+            keyset = (f"AND {alias}.fecha_actualizacion <= :k0 "
+                      f"AND ({alias}.fecha_actualizacion < :k0 OR {alias}.id < :k1)")
+
+        columns = f"""'{kind}' as kind, {alias}.id, {alias}.nombre as name, {alias}.{parent} as parent_id,
+               {alias}.fecha_actualizacion as updated_at"""
+
+        # INDEXED BY: sin estadísticas (ANALYZE) SQLite puede elegir la clave primaria de
+        # los tokens y recorrer todo el rango del prefijo por cada fila
+        def exists(condition: str) -> str:
+            return (f"AND EXISTS (SELECT 1 FROM busqueda_tokens t INDEXED BY idx_busqueda_tokens_recurso "
+                    f"WHERE t.tipo = '{kind}' AND t.recurso_id = {alias}.id "
+                    f"AND t.usuario_id = :user_id AND {condition})")
+
+        if strategy == "candidates":
+            # Candidatos del término más selectivo; los demás se comprueban por fila
+            return f"""
+            WITH coincidencias AS (
+                SELECT DISTINCT t.recurso_id FROM busqueda_tokens t
+                WHERE t.usuario_id = :user_id AND t.tipo = '{kind}' AND {conditions[0]}
+            )
+            SELECT {columns}
+            FROM coincidencias m JOIN {table} {alias} ON {alias}.id = m.recurso_id
+            WHERE {alias}.eliminado = 0 {keyset}
+            {" ".join(exists(condition) for condition in conditions[1:])}
+            ORDER BY {alias}.fecha_actualizacion DESC, {alias}.id DESC
+            LIMIT :limit
+            """
+
+        return f"""
+        SELECT {columns}
+        FROM {table} {alias} INDEXED BY {recency_index}
+        WHERE {alias}.usuario_id = :user_id AND {alias}.eliminado = 0 {keyset}
+        {" ".join(exists(condition) for condition in conditions)}
+        ORDER BY {alias}.fecha_actualizacion DESC, {alias}.id DESC
+        LIMIT :limit
+        """
+
+    def _documents(self, name: str, condition: str, params: Dict) -> int:
+        """Recursos (aprox.) con algún token que cumple condition, según el vocabulario."""
+        return self._execute(
+            name,
+            f"SELECT COALESCE(SUM(documentos), 0) FROM busqueda_vocabulario WHERE usuario_id = :user_id AND {condition}",
+            params,
+        ).fetchone()[0]
+
+    def _execute(self, name: str, query: str, params: Optional[Dict] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"search.{name}", query, params)
+
+    def _executemany(self, name: str, query: str, rows: Iterable[tuple]):
+        return executemany(self.db, f"search.{name}", query, rows)
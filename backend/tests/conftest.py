@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Los módulos del backend se importan por nombre (como al arrancar main.py desde backend/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from files import FileManager  # noqa: E402
+from folders import FolderManager  # noqa: E402
+from utils.managers import connect_storage  # noqa: E402
+
+
+@pytest.fixture
+def gestores(tmp_path):
+    """Conexión y gestores sobre una base nueva, con el usuario u1."""
+    conn = connect_storage(str(tmp_path / "gestores.sqlite3"))
+    conn.execute("INSERT INTO usuarios (id, email) VALUES ('u1', 'u1@example.com')")
+    conn.commit()
+    files = FileManager(conn, str(tmp_path / "storage"))
+    folders = FolderManager(conn, permissions=files.permissions, files=files)
+    yield conn, files, folders
+    conn.close()
@@ -0,0 +1,212 @@
+# Pruebas del contador de referencias de los blobs y la deduplicación por hash: la
+# publicación del archivo físico y su borrado se intercalan con otras subidas del
+# mismo contenido y el archivo nunca debe quedar huérfano ni desaparecer con referencias vivas
+import io
+import os
+import random
+import threading
+from pathlib import Path
+
+import pytest
+
+from files import FileManager
+from utils.compression import GZIP, IDENTITY
+from utils.managers import connect_storage
+
+TEXTO = ("informe trimestral con datos repetidos ñ;" * 2000).encode()
+
+
+def referencias(conn, file_hash):
+    row = conn.execute("SELECT referencias FROM blobs WHERE hash_archivo = ?", (file_hash,)).fetchone()
+    return row[0] if row else 0
+
+
+def leer(files, file_id, user_id="u1"):
+    _, handle = files.download_file(user_id, file_id)
+    with handle:
+        return handle.read()
+
+
+def archivos_en_disco(files):
+    return {path for path in files.blobs.blobs_path.rglob("*") if path.is_file()}
+
+
+def comprobar_invariantes(conn, files):
+    """Referencias = filas de archivos por hash, cada blob en disco y ningún archivo sin blob."""
+    blobs = conn.execute("SELECT hash_archivo, referencias, ruta_almacenamiento FROM blobs").fetchall()
+    usos = dict(conn.execute(
+        "SELECT hash_archivo, COUNT(*) FROM archivos GROUP BY hash_archivo").fetchall())
+    assert {row[0]: row[1] for row in blobs} == usos
+    for _, _, path in blobs:
+        assert os.path.exists(path)
+    assert archivos_en_disco(files) == {Path(row[2]) for row in blobs}
+
+
+def subida_preparada(monkeypatch, files, blob):
+    """Hacer que la próxima subida use un contenido ya recibido (intercalar dos subidas)."""
+    monkeypatch.setattr(files.blobs, "ingest", lambda *args, **kwargs: blob)
+
+
+def test_deduplicacion_y_purga(gestores):
+    conn, files, _ = gestores
+    a = files.upload_file("u1", io.BytesIO(TEXTO), "a.txt")
+    b = files.upload_file("u1", io.BytesIO(TEXTO), "b.txt")
+
+    assert a['file_hash'] == b['file_hash'] and a['storage_path'] == b['storage_path']
+    assert referencias(conn, a['file_hash']) == 2
+    assert len(archivos_en_disco(files)) == 1
+
+    files.purge_file("u1", a['id'])
+    assert referencias(conn, a['file_hash']) == 1
+    assert leer(files, b['id']) == TEXTO
+
+    files.purge_file("u1", b['id'])
+    assert referencias(conn, a['file_hash']) == 0
+    assert archivos_en_disco(files) == set()
+
+
+def test_subida_fallida_no_deja_referencia(gestores, monkeypatch):
+    conn, files, _ = gestores
+
+    def sin_espacio(user_id, size):
+        raise ValueError("Espacio insuficiente")
+
+    monkeypatch.setattr(files, "check_storage_quota", sin_espacio)
+    with pytest.raises(ValueError):
+        files.upload_file("u1", io.BytesIO(TEXTO), "a.txt")
+
+    assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 0
+    assert archivos_en_disco(files) == set()
+
+
+def test_fallo_al_registrar_no_deja_archivo_publicado(gestores, monkeypatch):
+    conn, files, _ = gestores
+
+    def falla(*args, **kwargs):
+        raise RuntimeError("índice no disponible")
+
+    # El blob ya se publicó dentro de la transacción que luego se deshace
+    monkeypatch.setattr(files.search_index, "add", falla)
+    with pytest.raises(RuntimeError):
+        files.upload_file("u1", io.BytesIO(TEXTO), "a.txt")
+
+    assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 0
+    assert archivos_en_disco(files) == set()
+
+
+def test_subida_fallida_respeta_la_copia_de_otra_subida(gestores, monkeypatch):
+    conn, files, _ = gestores
+    # Las dos subidas reciben el contenido antes de que ninguna lo registre
+    pendiente = files.blobs.ingest(io.BytesIO(TEXTO), files.max_file_size)
+    otra = files.upload_file("u1", io.BytesIO(TEXTO), "a.txt")
+
+    def sin_espacio(user_id, size):
+        raise ValueError("Espacio insuficiente")
+
+    subida_preparada(monkeypatch, files, pendiente)
+    monkeypatch.setattr(files, "check_storage_quota", sin_espacio)
+    with pytest.raises(ValueError):
+        files.upload_file("u1", io.BytesIO(TEXTO), "b.txt")
+
+    assert referencias(conn, otra['file_hash']) == 1
+    assert leer(files, otra['id']) == TEXTO
+
+
+def test_codecs_distintos_del_mismo_contenido(gestores, monkeypatch):
+    conn, files, _ = gestores
+    # Dos primeras subidas simultáneas del mismo contenido con códecs distintos
+    comprimido = files.blobs.ingest(io.BytesIO(TEXTO), files.max_file_size, codec=GZIP)
+    plano = files.blobs.ingest(io.BytesIO(TEXTO), files.max_file_size, codec=IDENTITY)
+    assert comprimido['temp_path'] and plano['temp_path']
+
+    subida_preparada(monkeypatch, files, comprimido)
+    a = files.upload_file("u1", io.BytesIO(TEXTO), "a.txt")
+    subida_preparada(monkeypatch, files, plano)
+    b = files.upload_file("u1", io.BytesIO(TEXTO), "b.zip")
+
+    # La segunda se suma al blob ya registrado y su copia sin registrar se descarta
+    assert b['storage_path'] == a['storage_path']
+    assert referencias(conn, a['file_hash']) == 2
+    assert leer(files, a['id']) == TEXTO and leer(files, b['id']) == TEXTO
+    comprobar_invariantes(conn, files)
+
+
+def test_purga_intercalada_con_subida_del_mismo_contenido(gestores, monkeypatch):
+    conn, files, _ = gestores
+    a = files.upload_file("u1", io.BytesIO(TEXTO), "a.txt")
+
+    # La purga confirma la última referencia pero aún no ha borrado el archivo
+    diferidos = []
+    unlink_many = files.blobs.unlink_many
+    monkeypatch.setattr(files.blobs, "unlink_many", diferidos.extend)
+    files.purge_file("u1", a['id'])
+    monkeypatch.setattr(files.blobs, "unlink_many", unlink_many)
+    assert diferidos == [a['storage_path']]
+
+    # Otra subida del mismo contenido vuelve a registrarlo en ese intervalo
+    b = files.upload_file("u1", io.BytesIO(TEXTO), "b.txt")
+    assert b['storage_path'] == a['storage_path']
+
+    # El borrado diferido comprueba de nuevo el registro y conserva el archivo
+    files.blobs.unlink_many(diferidos)
+    assert leer(files, b['id']) == TEXTO
+    comprobar_invariantes(conn, files)
+
+
+def test_dedup_con_blob_purgado_durante_la_subida(gestores, monkeypatch):
+    conn, files, _ = gestores
+    a = files.upload_file("u1", io.BytesIO(TEXTO), "a.txt")
+    pendiente = files.blobs.ingest(io.BytesIO(TEXTO), files.max_file_size)
+    assert pendiente['deduplicated'] and pendiente['temp_path'] is None
+
+    files.purge_file("u1", a['id'])
+    subida_preparada(monkeypatch, files, pendiente)
+    with pytest.raises(ValueError):
+        files.upload_file("u1", io.BytesIO(TEXTO), "b.txt")
+
+    assert conn.execute("SELECT COUNT(*) FROM archivos").fetchone()[0] == 0
+    comprobar_invariantes(conn, files)
+
+
+def test_subidas_y_purgas_concurrentes(tmp_path):
+    db_path = str(tmp_path / "gestores.sqlite3")
+    storage = str(tmp_path / "storage")
+    conn = connect_storage(db_path)
+    conn.execute("INSERT INTO usuarios (id, email) VALUES ('u1', 'u1@example.com')")
+    conn.commit()
+
+    contenidos = [TEXTO, TEXTO[:5000], os.urandom(20000)]
+    errores = []
+
+    def trabajador(semilla):
+        rng = random.Random(semilla)
+        db = connect_storage(db_path)
+        files = FileManager(db, storage)
+        propios = []
+        try:
+            for _ in range(40):
+                if propios and rng.random() < 0.4:
+                    files.purge_file("u1", propios.pop(rng.randrange(len(propios))))
+                    continue
+                data = rng.choice(contenidos)
+                try:
+                    record = files.upload_file("u1", io.BytesIO(data), rng.choice(["a.txt", "a.zip"]))
+                except ValueError:
+                    # Contenido deduplicado que otro hilo purgó a mitad de la subida
+                    continue
+                propios.append(record['id'])
+                assert leer(files, record['id']) == data
+        except Exception as e:  # noqa: BLE001 - se informa desde el hilo principal
+            errores.append(e)
+        finally:
+            db.close()
+
+    hilos = [threading.Thread(target=trabajador, args=(semilla,)) for semilla in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert not errores, errores
+    comprobar_invariantes(conn, FileManager(conn, storage))
+    conn.close()
@@ -0,0 +1,102 @@
+# Pruebas de la jerarquía de carpetas: carpetas_ancestros y carpetas_totales se
+# mantienen de forma incremental y deben coincidir en todo momento con lo que
+# saldría de recalcularlas desde cero, tras cualquier secuencia de operaciones
+
+import io
+import random
+
+import pytest
+
+from rollups import TOTALS_QUERY
+
+OPERACIONES = 400
+COMPROBAR_CADA = 50
+
+
+def filas(conn, query):
+    return sorted(tuple(row) for row in conn.execute(query))
+
+
+def comprobar_invariantes(conn, folders):
+    """La tabla de cierre coincide con rebuild() y los totales con TOTALS_QUERY."""
+    totales = filas(conn, "SELECT carpeta_id, archivos, carpetas, bytes FROM carpetas_totales")
+    assert totales == filas(conn, TOTALS_QUERY.format(folders="carpetas"))
+
+    caminos = filas(conn, "SELECT ancestro_id, descendiente_id, profundidad FROM carpetas_ancestros")
+    try:
+        folders.ancestry.rebuild()
+        assert caminos == filas(conn, "SELECT ancestro_id, descendiente_id, profundidad FROM carpetas_ancestros")
+    finally:
+        # rebuild no confirma: se descarta para seguir con la tabla incremental
+        conn.rollback()
+
+
+@pytest.mark.parametrize("semilla", [1, 7, 23])
+def test_operaciones_aleatorias(gestores, semilla):
+    conn, files, folders = gestores
+    rng = random.Random(semilla)
+    contenidos = [rng.randbytes(rng.randrange(1, 2000)) for _ in range(6)]
+    carpetas, archivos = [], []
+
+    def carpeta():
+        return rng.choice(carpetas + [None])
+
+    def existentes(ids, tabla):
+        return [i for i in ids if conn.execute(f"SELECT 1 FROM {tabla} WHERE id = ?", (i,)).fetchone()]
+
+    for i in range(20):
+        carpetas.append(folders.create_folder("u1", f"carpeta{i}", carpeta())["id"])
+
+    for paso in range(1, OPERACIONES + 1):
+        operacion = rng.choice([
+            "subir", "subir", "crear", "eliminar", "restaurar", "purgar", "mover",
+            "mover_carpeta", "eliminar_carpeta", "restaurar_carpeta", "papelera",
+            "restaurar_arbol", "purgar_arbol", "mover_lote",
+        ])
+        try:
+            if operacion == "subir":
+                archivo = files.upload_file("u1", io.BytesIO(rng.choice(contenidos)), f"doc{paso}.txt", carpeta())
+                archivos.append(archivo["id"])
+            elif operacion == "crear":
+                carpetas.append(folders.create_folder("u1", f"nueva{paso}", carpeta())["id"])
+            elif not archivos or not carpetas:
+                continue
+            elif operacion == "eliminar":
+                files.delete_file("u1", rng.choice(archivos))
+            elif operacion == "restaurar":
+                files.restore_file("u1", rng.choice(archivos))
+            elif operacion == "purgar":
+                archivo = rng.choice(archivos)
+                files.purge_file("u1", archivo)
+                archivos.remove(archivo)
+            elif operacion == "mover":
+                files.move_file("u1", rng.choice(archivos), carpeta())
+            elif operacion == "mover_carpeta":
+                folders.move_folder("u1", rng.choice(carpetas), carpeta())
+            elif operacion == "eliminar_carpeta":
+                folders.soft_delete_folder("u1", rng.choice(carpetas))
+            elif operacion == "restaurar_carpeta":
+                folders.restore_folder("u1", rng.choice(carpetas))
+            elif operacion == "papelera":
+                folders.trash_folder("u1", rng.choice(carpetas))
+            elif operacion == "restaurar_arbol":
+                folders.restore_folder_tree("u1", rng.choice(carpetas))
+            elif operacion == "purgar_arbol" and rng.random() < 0.3:
+                folders.purge_folder("u1", rng.choice(carpetas))
+                carpetas = existentes(carpetas, "carpetas")
+                archivos = existentes(archivos, "archivos")
+            elif operacion == "mover_lote":
+                folders.move_items(
+                    "u1",
+                    rng.sample(archivos, min(len(archivos), rng.randrange(0, 12))),
+                    rng.sample(carpetas, min(len(carpetas), rng.randrange(0, 4))),
+                    carpeta(),
+                )
+        except ValueError:
+            # Movimientos a un descendiente, nombres repetidos, etc.: no cambian nada
+            pass
+
+        if paso % COMPROBAR_CADA == 0:
+            comprobar_invariantes(conn, folders)
+
+    comprobar_invariantes(conn, folders)
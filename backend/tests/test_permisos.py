@@ -0,0 +1,122 @@
+# Pruebas del resolvedor de permisos y de la ACL en memoria: un compartido hecho con
+# grant/revoke se ve de inmediato en todos los resolvedores que comparten la caché;
+# los cambios hechos por otra vía, como tarde al caducar el TTL
+
+import io
+import time
+
+import pytest
+
+from permissions import (FILE, FOLDER, OWNER, READ_ONLY, READ_WRITE, AccessCache,
+                         PermissionResolver)
+from utils.managers import connect_storage
+
+
+@pytest.fixture
+def recursos(gestores):
+    conn, files, folders = gestores
+    conn.execute("INSERT INTO usuarios (id, email) VALUES ('u2', 'u2@example.com')")
+    conn.commit()
+    archivo = (FILE, files.upload_file("u1", io.BytesIO(b"contenido"), "a.txt")["id"])
+    carpeta = (FOLDER, folders.create_folder("u1", "compartida")["id"])
+    return conn, files, folders, archivo, carpeta
+
+
+def nivel(resolver, user_id, resource):
+    return resolver.resolve([(user_id, resource)])[(user_id, resource)]
+
+
+def test_propietario_y_sin_acceso(recursos):
+    conn, files, _, archivo, carpeta = recursos
+    resolver = files.permissions
+    levels = resolver.resolve([("u1", archivo), ("u1", carpeta), ("u2", archivo), ("u2", carpeta),
+                               ("u1", (FILE, "no_existe"))])
+    assert levels == {
+        ("u1", archivo): OWNER, ("u1", carpeta): OWNER,
+        ("u2", archivo): None, ("u2", carpeta): None,
+        ("u1", (FILE, "no_existe")): None,
+    }
+    assert resolver.check("u1", archivo, "write")
+    assert not resolver.check("u2", archivo, "read")
+
+
+def test_niveles_de_compartido(recursos):
+    conn, files, folders, archivo, carpeta = recursos
+    files.share_file("u1", archivo[1], "u2@example.com", READ_ONLY)
+    folders.share_folder("u1", carpeta[1], "u2@example.com", READ_WRITE)
+
+    assert files.permissions.check_many("u2", [archivo, carpeta], "read") == {archivo: True, carpeta: True}
+    assert files.permissions.check_many("u2", [archivo, carpeta], "write") == {archivo: False, carpeta: True}
+
+    # Cambiar el nivel reemplaza el compartido anterior
+    files.share_file("u1", archivo[1], "u2@example.com", READ_WRITE)
+    assert nivel(files.permissions, "u2", archivo) == READ_WRITE
+
+
+def test_solo_el_propietario_comparte(recursos):
+    conn, files, _, archivo, _ = recursos
+    with pytest.raises(PermissionError):
+        files.share_file("u2", archivo[1], "u2@example.com", READ_WRITE)
+    with pytest.raises(ValueError):
+        files.share_file("u1", archivo[1], "u2@example.com", OWNER)
+
+
+def test_compartir_invalida_la_acl_cacheada(recursos):
+    conn, files, _, archivo, _ = recursos
+    resolver = files.permissions
+
+    # La negativa queda en la ACL de u2: la segunda consulta no va a la base
+    assert nivel(resolver, "u2", archivo) is None
+    misses = resolver.cache.stats["misses"]
+    assert nivel(resolver, "u2", archivo) is None
+    assert resolver.cache.stats["misses"] == misses
+
+    files.share_file("u1", archivo[1], "u2@example.com", READ_ONLY)
+    assert nivel(resolver, "u2", archivo) == READ_ONLY
+
+    assert files.unshare_file("u1", archivo[1], "u2@example.com") is True
+    assert nivel(resolver, "u2", archivo) is None
+    assert files.unshare_file("u1", archivo[1], "u2@example.com") is False
+
+
+def test_invalidacion_alcanza_a_otros_resolvedores(recursos, tmp_path):
+    conn, files, _, archivo, _ = recursos
+    # Otro hilo: su propia conexión y la misma ACL del proceso
+    otra = connect_storage(str(tmp_path / "gestores.sqlite3"))
+    try:
+        resolver = PermissionResolver(otra, cache=files.permissions.cache)
+        assert nivel(resolver, "u2", archivo) is None
+
+        files.share_file("u1", archivo[1], "u2@example.com", READ_ONLY)
+        assert nivel(resolver, "u2", archivo) == READ_ONLY
+    finally:
+        otra.close()
+
+
+def test_cambios_por_otra_via_caducan_con_el_ttl(recursos, monkeypatch):
+    conn, files, _, archivo, _ = recursos
+    resolver = PermissionResolver(conn, cache=AccessCache(ttl=30))
+    assert nivel(resolver, "u2", archivo) is None
+
+    conn.execute(
+        "INSERT INTO compartidos (archivo_id, email_compartido, tipo_acceso_id, activo) VALUES (?, ?, 1, 1)",
+        (archivo[1], "u2@example.com"),
+    )
+    conn.commit()
+    assert nivel(resolver, "u2", archivo) is None
+
+    ahora = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: ahora + 31)
+    assert nivel(resolver, "u2", archivo) == READ_ONLY
+
+
+def test_purgar_olvida_el_recurso(recursos):
+    conn, files, folders, archivo, carpeta = recursos
+    resolver = files.permissions
+    assert nivel(resolver, "u1", archivo) == OWNER
+    assert nivel(resolver, "u1", carpeta) == OWNER
+
+    files.purge_file("u1", archivo[1])
+    folders.purge_folder("u1", carpeta[1])
+    assert nivel(resolver, "u1", archivo) is None
+    assert nivel(resolver, "u1", carpeta) is None
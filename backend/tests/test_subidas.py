@@ -0,0 +1,153 @@
+# Pruebas de las subidas por partes: las partes llegan en cualquier orden y pueden
+# reenviarse; al completar se ensamblan en orden y el hash del resultado se comprueba
+# contra el declarado al abrir la sesión
+
+import hashlib
+import io
+import os
+
+import pytest
+
+from uploads import UploadManager
+
+PARTE = 1024
+CONTENIDO = os.urandom(PARTE * 4 + 100)
+
+
+@pytest.fixture
+def subidas(gestores, tmp_path):
+    conn, files, _ = gestores
+    uploads = UploadManager(conn, files, str(tmp_path / "storage"))
+    # Partes pequeñas para no mover megas en cada prueba
+    uploads.min_chunk_size = PARTE
+    return conn, files, uploads
+
+
+def partes(data):
+    return [data[i:i + PARTE] for i in range(0, len(data), PARTE)]
+
+
+def sesion(uploads, data=CONTENIDO, file_hash=None):
+    return uploads.create_session("u1", "datos.bin", len(data), chunk_size=PARTE,
+                                  file_hash=file_hash or hashlib.sha256(data).hexdigest())
+
+
+def leer(files, file_id):
+    _, handle = files.download_file("u1", file_id)
+    with handle:
+        return handle.read()
+
+
+def temporales(uploads):
+    return list(uploads.uploads_path.glob(".chunk-*"))
+
+
+def test_partes_fuera_de_orden(subidas):
+    conn, files, uploads = subidas
+    s = sesion(uploads)
+    assert s['total_chunks'] == 5
+
+    for index in [3, 0, 4, 2, 1]:
+        uploads.put_chunk("u1", s['id'], index, io.BytesIO(partes(CONTENIDO)[index]))
+    assert uploads.get_session("u1", s['id'])['missing_chunks'] == []
+
+    record = uploads.complete_session("u1", s['id'])
+    assert record['file_hash'] == hashlib.sha256(CONTENIDO).hexdigest()
+    assert leer(files, record['id']) == CONTENIDO
+    assert uploads.get_session("u1", s['id'])['status'] == 'completada'
+    assert not uploads.session_dir(s['id']).exists()
+
+
+def test_parte_reenviada_reemplaza_a_la_anterior(subidas):
+    conn, files, uploads = subidas
+    s = sesion(uploads)
+    trozos = partes(CONTENIDO)
+
+    # Un primer envío corrupto del mismo tamaño y su reintento correcto
+    uploads.put_chunk("u1", s['id'], 2, io.BytesIO(bytes(len(trozos[2]))))
+    for index, trozo in enumerate(trozos):
+        uploads.put_chunk("u1", s['id'], index, io.BytesIO(trozo))
+
+    filas = conn.execute("SELECT COUNT(*) FROM partes_subida WHERE sesion_id = ?", (s['id'],)).fetchone()[0]
+    assert filas == len(trozos)
+    record = uploads.complete_session("u1", s['id'])
+    assert leer(files, record['id']) == CONTENIDO
+
+
+def test_parte_desde_temporal(subidas):
+    conn, files, uploads = subidas
+    s = sesion(uploads)
+    for index, trozo in enumerate(partes(CONTENIDO)):
+        path = uploads.chunk_temp_file()
+        path.write_bytes(trozo)
+        uploads.put_chunk("u1", s['id'], index, path)
+        # Se mueve a su sitio, no se copia
+        assert not path.exists()
+
+    record = uploads.complete_session("u1", s['id'])
+    assert leer(files, record['id']) == CONTENIDO
+
+
+def test_hash_de_parte_incorrecto(subidas):
+    conn, files, uploads = subidas
+    s = sesion(uploads)
+    trozo = partes(CONTENIDO)[0]
+
+    with pytest.raises(ValueError):
+        uploads.put_chunk("u1", s['id'], 0, io.BytesIO(trozo), chunk_hash="0" * 64)
+    assert uploads.get_session("u1", s['id'])['received_chunks'] == []
+    assert temporales(uploads) == []
+
+    uploads.put_chunk("u1", s['id'], 0, io.BytesIO(trozo), chunk_hash=hashlib.sha256(trozo).hexdigest().upper())
+    assert uploads.get_session("u1", s['id'])['received_chunks'] == [0]
+
+
+@pytest.mark.parametrize("contenido", [b"x" * (PARTE - 1), b"x" * (PARTE + 1)])
+def test_parte_de_tamano_incorrecto(subidas, contenido):
+    conn, files, uploads = subidas
+    s = sesion(uploads)
+    with pytest.raises(ValueError):
+        uploads.put_chunk("u1", s['id'], 0, io.BytesIO(contenido))
+    assert uploads.get_session("u1", s['id'])['received_chunks'] == []
+    assert temporales(uploads) == []
+
+
+def test_parte_fuera_de_rango_y_partes_que_faltan(subidas):
+    conn, files, uploads = subidas
+    s = sesion(uploads)
+    with pytest.raises(ValueError):
+        uploads.put_chunk("u1", s['id'], s['total_chunks'], io.BytesIO(b"x"))
+
+    uploads.put_chunk("u1", s['id'], 0, io.BytesIO(partes(CONTENIDO)[0]))
+    with pytest.raises(ValueError, match="Faltan partes"):
+        uploads.complete_session("u1", s['id'])
+    assert uploads.get_session("u1", s['id'])['status'] == 'abierta'
+
+
+def test_hash_del_archivo_ensamblado_incorrecto(subidas):
+    conn, files, uploads = subidas
+    s = sesion(uploads, file_hash="f" * 64)
+    for index, trozo in enumerate(partes(CONTENIDO)):
+        uploads.put_chunk("u1", s['id'], index, io.BytesIO(trozo))
+
+    with pytest.raises(ValueError, match="no coincide"):
+        uploads.complete_session("u1", s['id'])
+
+    # No queda el archivo ni su blob, y la sesión vuelve a aceptar partes
+    assert conn.execute("SELECT COUNT(*) FROM archivos").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 0
+    assert [p for p in files.blobs.blobs_path.rglob("*") if p.is_file()] == []
+    assert uploads.get_session("u1", s['id'])['status'] == 'abierta'
+
+
+def test_sesion_de_otro_usuario(subidas):
+    conn, files, uploads = subidas
+    s = sesion(uploads)
+    assert uploads.get_session("u2", s['id']) is None
+    with pytest.raises(FileNotFoundError):
+        uploads.put_chunk("u2", s['id'], 0, io.BytesIO(partes(CONTENIDO)[0]))
+    assert uploads.abort_session("u2", s['id']) is False
+
+    assert uploads.abort_session("u1", s['id']) is True
+    with pytest.raises(ValueError):
+        uploads.put_chunk("u1", s['id'], 0, io.BytesIO(partes(CONTENIDO)[0]))
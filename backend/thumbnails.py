@@ -0,0 +1,490 @@
+# Módulo de Miniaturas (thumbnails.py)
+# Generación de miniaturas en segundo plano, en un pool de procesos alimentado por una cola
+
+import os
+import queue
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any
+from pathlib import Path
+
+from utils.metrics import execute
+
+logger = logging.getLogger(__name__)
+
+# Lado mayor (px) de cada tamaño y formatos generados por cada uno
+THUMBNAIL_SIZES = {"small": 128, "medium": 256, "large": 512}
+THUMBNAIL_FORMATS = {"jpeg": "jpg", "webp": "webp"}
+
+# Estados de archivos.estado_miniatura
+PENDING, READY, FAILED, UNAVAILABLE = "pendiente", "lista", "fallida", "no_disponible"
+
+# Presupuesto en disco de storage/thumbnails; al superarlo se borran las menos usadas
+THUMBNAIL_CACHE_BYTES = int(os.getenv("THUMBNAIL_CACHE_BYTES", 512 * 1024 * 1024))
+
+
+class InvalidImageError(Exception):
+    """El archivo no es una imagen decodificable: reintentar no sirve."""
+
+
+def thumbnail_dir(thumbnails_path: Path, file_hash: str) -> Path:
+    """Las miniaturas dependen solo del contenido: archivos duplicados las comparten."""
+    return Path(thumbnails_path) / file_hash[:2] / file_hash
+
+
+def thumbnail_name(size: str, fmt: str) -> str:
+    return f"{size}.{THUMBNAIL_FORMATS[fmt]}"
+
+
+def thumbnail_url(file_id: str, size: str = "medium", fmt: str = "webp") -> str:
+    """URL del endpoint que sirve (y genera si falta) la miniatura, con control de acceso."""
+    return f"/api/files/{file_id}/thumbnail?size={size}&format={fmt}"
+
+
+def _open_image(image_path: str, largest: int):
+    """Abrir, orientar y convertir a RGB reduciendo la decodificación al lado mayor pedido."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        img = Image.open(image_path)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(str(e))
+
+    with img:
+        # En JPEG, draft() decodifica directamente a una escala reducida
+        img.draft("RGB", (largest, largest))
+        return ImageOps.exif_transpose(img).convert("RGB")
+
+
+def _save(img, output_path: Path, fmt: str) -> int:
+    temp = output_path.with_name(f".{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    img.save(temp, fmt.upper(), quality=82)
+    os.replace(temp, output_path)
+    return output_path.stat().st_size
+
+
+def render_thumbnail(image_path: str, output_path: str, side: int, fmt: str) -> Optional[int]:
+    """
+    Generar una sola miniatura (tamaño y formato) bajo demanda.
+
+    Returns:
+        Bytes escritos, o None si PIL no está instalado
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return None
+
+    img = _open_image(image_path, side)
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    img.thumbnail((side, side))
+    return _save(img, output, fmt)
+
+
+def render_thumbnails(image_path: str, output_dir: str, sizes: Dict[str, int] = None,
+                      formats=tuple(THUMBNAIL_FORMATS)) -> Optional[Dict[str, str]]:
+    """
+    Decodificar la imagen una vez y guardar cada tamaño en cada formato.
+    Se ejecuta en los procesos del pool (función de módulo para poder serializarla).
+
+    Returns:
+        Dict "<tamaño>.<formato>" -> nombre de archivo, o None si PIL no está instalado
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return None
+
+    sizes = sizes or THUMBNAIL_SIZES
+    output = Path(output_dir)
+    img = _open_image(image_path, max(sizes.values()))
+    output.mkdir(parents=True, exist_ok=True)
+
+    written = {}
+    # De mayor a menor: cada tamaño se reduce desde el anterior, no desde el original
+    for size, side in sorted(sizes.items(), key=lambda item: -item[1]):
+        img.thumbnail((side, side))
+        for fmt in formats:
+            name = thumbnail_name(size, fmt)
+            _save(img, output / name, fmt)
+            written[f"{size}.{fmt}"] = name
+
+    return written
+
+
+class ThumbnailCache:
+    """
+    Miniaturas bajo demanda en storage/thumbnails con presupuesto de bytes y desalojo LRU.
+
+    La primera petición de un (contenido, tamaño, formato) la genera en el pool del
+    pipeline (o en un hilo si está desactivado); las peticiones simultáneas de la misma
+    miniatura esperan esa única generación. El orden LRU se reconstruye al arrancar a
+    partir del atime/mtime de los archivos. Las miniaturas que se están enviando
+    quedan fijadas (acquire/release) y el desalojo las salta.
+    """
+
+    def __init__(self, storage_path: str = "./storage", max_bytes: Optional[int] = None, pipeline=None):
+        """
+        Inicializa la caché de miniaturas.
+
+        Args:
+            storage_path: Ruta base para almacenamiento de archivos
+            max_bytes: Presupuesto en disco (por defecto THUMBNAIL_CACHE_BYTES)
+            pipeline: ThumbnailPipeline cuyo pool de procesos se usa para generar
+        """
+        self.thumbnails_path = Path(storage_path) / "thumbnails"
+        self.thumbnails_path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes is not None else THUMBNAIL_CACHE_BYTES
+        self.pipeline = pipeline
+
+        # ruta -> bytes, de la menos a la más recientemente usada
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        # ruta -> asyncio.Future de la generación en curso
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # ruta -> respuestas que la están enviando (el desalojo no las borra)
+        self._pins: Dict[str, int] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "evicted_bytes": 0}
+        self._scan()
+
+    def path_for(self, file_hash: str, size: str, fmt: str) -> Path:
+        return thumbnail_dir(self.thumbnails_path, file_hash) / thumbnail_name(size, fmt)
+
+    async def get(self, file_hash: str, image_path: str, size: str = "medium", fmt: str = "webp") -> Path:
+        """
+        Ruta de la miniatura, generándola si no está en disco.
+
+        Raises:
+            InvalidImageError: Si el archivo no es una imagen decodificable
+            FileNotFoundError: Si PIL no está instalado
+        """
+        path = self.path_for(file_hash, size, fmt)
+        if self.touch(path):
+            self.stats["hits"] += 1
+            return path
+
+        key = str(path)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            # shield: si esta petición se cancela, la generación sigue para las demás
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.stats["misses"] += 1
+        try:
+            written = await self._render(image_path, key, THUMBNAIL_SIZES[size], fmt)
+            if written is None:
+                raise FileNotFoundError("Miniaturas no disponibles (PIL no está instalado)")
+            self.track(path, written)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            # Marcar la excepción como recuperada aunque nadie más esperara
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def acquire(self, file_hash: str, image_path: str, size: str = "medium", fmt: str = "webp") -> Path:
+        """
+        Como get, pero la ruta queda fijada hasta release(): el desalojo no la borra
+        mientras se envía. Si se desalojó entre la generación y el fijado, se vuelve
+        a generar.
+        """
+        for _ in range(3):
+            path = await self.get(file_hash, image_path, size, fmt)
+            key = str(path)
+            with self._lock:
+                if key in self._entries and path.exists():
+                    self._pins[key] = self._pins.get(key, 0) + 1
+                    return path
+        raise FileNotFoundError("La miniatura se desalojó antes de poder enviarla")
+
+    def release(self, path: Path) -> None:
+        """Soltar una ruta fijada por acquire y desalojar lo que haya quedado pendiente."""
+        key = str(path)
+        with self._lock:
+            remaining = self._pins.get(key, 0) - 1
+            if remaining > 0:
+                self._pins[key] = remaining
+            else:
+                self._pins.pop(key, None)
+                self._evict(keep=None)
+
+    def touch(self, path: Path) -> bool:
+        """Marcar la miniatura como recién usada; False si no existe."""
+        key = str(path)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            # Borrada fuera de la caché: dejar de contabilizarla para regenerarla
+            with self._lock:
+                self._total -= self._entries.pop(key, 0)
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return True
+        # Escrita por el pipeline o por otro proceso: empezar a contabilizarla
+        self.track(path, size)
+        return True
+
+    def track(self, path: Path, size: int) -> None:
+        """Contabilizar una miniatura escrita y desalojar si se supera el presupuesto."""
+        key = str(path)
+        with self._lock:
+            self._total += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict(keep=key)
+
+    def track_dir(self, directory: Path) -> None:
+        """Contabilizar las miniaturas escritas por el pipeline en un directorio."""
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                self.track(Path(entry.path), entry.stat().st_size)
+
+    def _evict(self, keep: str) -> None:
+        # De la menos a la más recientemente usada, saltando las fijadas
+        for key, size in list(self._entries.items()):
+            if self._total <= self.max_bytes or len(self._entries) <= 1:
+                break
+            if key == keep or key in self._pins:
+                continue
+            del self._entries[key]
+            self._total -= size
+            self.stats["evictions"] += 1
+            self.stats["evicted_bytes"] += size
+            try:
+                os.unlink(key)
+            except FileNotFoundError:
+                pass
+
+    def _scan(self) -> None:
+        found = []
+        for root, _, names in os.walk(self.thumbnails_path):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((max(st.st_atime, st.st_mtime), path, st.st_size))
+
+        with self._lock:
+            for _, path, size in sorted(found):
+                self._entries[path] = size
+                self._total += size
+            self._evict(keep=None)
+
+    async def _render(self, image_path: str, output_path: str, side: int, fmt: str) -> Optional[int]:
+        if self.pipeline is not None:
+            return await asyncio.wrap_future(self.pipeline.run(render_thumbnail, image_path, output_path, side, fmt))
+        return await asyncio.to_thread(render_thumbnail, image_path, output_path, side, fmt)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = len(self._entries), self._total
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes, **self.stats}
+
+
+class ThumbnailPipeline:
+    """
+    Cola acotada de trabajos de miniaturas despachados a un ProcessPoolExecutor.
+
+    Las subidas solo encolan el trabajo y responden con estado 'pendiente'; un hilo
+    despachador limita los trabajos en vuelo, reintenta con espera creciente los que
+    fallan y actualiza archivos.estado_miniatura / thumbnail_url al terminar.
+    """
+
+    def __init__(self, db_connection, storage_path: str = "./storage", workers: Optional[int] = None,
+                 queue_size: int = 1000, max_retries: int = 3, retry_delay: float = 2.0, cache=None):
+        """
+        Inicializa el pipeline de miniaturas.
+
+        Args:
+            db_connection: Conexión a la base de datos (de uso exclusivo del pipeline)
+            storage_path: Ruta base para almacenamiento de archivos
+            workers: Procesos del pool (por defecto THUMBNAIL_WORKERS o min(2, CPUs))
+            queue_size: Trabajos máximos en espera
+            max_retries: Reintentos por trabajo antes de marcarlo como fallido
+            retry_delay: Espera base entre reintentos (se duplica en cada intento)
+            cache: ThumbnailCache que contabiliza las miniaturas escritas
+        """
+        self.db = db_connection
+        self.thumbnails_path = Path(storage_path) / "thumbnails"
+        self.thumbnails_path.mkdir(parents=True, exist_ok=True)
+        self.workers = workers or int(os.getenv("THUMBNAIL_WORKERS", min(2, os.cpu_count() or 1)))
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.cache = cache
+
+        self._jobs = queue.Queue(maxsize=queue_size)
+        # Trabajos en vuelo: como mucho dos por proceso (uno ejecutando, uno esperando)
+        self._in_flight = threading.BoundedSemaphore(self.workers * 2)
+        self._db_lock = threading.Lock()
+        self._pool = None
+        self._dispatcher = None
+        self._stopping = threading.Event()
+        self.stats = {"queued": 0, "completed": 0, "retried": 0, "failed": 0, "rejected": 0}
+
+    def start(self) -> None:
+        """Arrancar el pool y el hilo despachador (idempotente)."""
+        if self._pool is not None:
+            return
+        # spawn: hacer fork de un proceso con hilos (el de la API) no es seguro
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._stopping.clear()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="thumbnail-dispatcher", daemon=True)
+        self._dispatcher.start()
+        threading.Thread(target=self._resume_pending, name="thumbnail-resume", daemon=True).start()
+        logger.info(f"Pipeline de miniaturas iniciado ({self.workers} procesos)")
+
+    def stop(self, wait: bool = True) -> None:
+        """Detener el despachador y el pool; los trabajos en cola quedan 'pendiente' hasta el próximo start()."""
+        if self._pool is None:
+            return
+        self._stopping.set()
+        self._dispatcher.join()
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+        self._pool = None
+
+    def submit(self, file_id: str, file_hash: str, image_path: str) -> bool:
+        """
+        Encolar la generación de miniaturas de un archivo sin bloquear.
+
+        Returns:
+            False si la cola está llena (el archivo queda como 'fallida')
+        """
+        try:
+            self._jobs.put_nowait({'file_id': file_id, 'file_hash': file_hash,
+                                   'image_path': str(image_path), 'attempt': 0})
+        except queue.Full:
+            logger.warning(f"Cola de miniaturas llena, se descarta {file_id}")
+            self.stats["rejected"] += 1
+            self._set_status(file_id, FAILED)
+            return False
+
+        self.stats["queued"] += 1
+        return True
+
+    def run(self, func, *args):
+        """Ejecutar un trabajo interactivo en el pool, fuera de la cola (devuelve un Future)."""
+        self.start()
+        return self._pool.submit(func, *args)
+
+    def _resume_pending(self) -> None:
+        """
+        Volver a encolar los archivos que quedaron 'pendiente' (p. ej. en la cola al
+        apagar). Espera a que haya sitio en la cola en lugar de descartarlos.
+        """
+        query = "SELECT id, hash_archivo, ruta_almacenamiento FROM archivos WHERE estado_miniatura = :status"
+        with self._db_lock:
+            rows = execute(self.db, "thumbnails.resume_pending", query, {'status': PENDING}).fetchall()
+
+        if rows:
+            logger.info(f"Reanudando {len(rows)} miniaturas pendientes")
+        for file_id, file_hash, image_path in rows:
+            job = {'file_id': file_id, 'file_hash': file_hash, 'image_path': image_path, 'attempt': 0}
+            while not self._stopping.is_set():
+                try:
+                    self._jobs.put(job, timeout=0.5)
+                    self.stats["queued"] += 1
+                    break
+                except queue.Full:
+                    continue
+
+    def _dispatch(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = self._jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            output_dir = thumbnail_dir(self.thumbnails_path, job['file_hash'])
+            expected = [thumbnail_name(size, fmt) for size in THUMBNAIL_SIZES for fmt in THUMBNAIL_FORMATS]
+            if all((output_dir / name).exists() for name in expected):
+                # Contenido duplicado: sus miniaturas ya existen
+                self._finish(job, READY)
+                continue
+
+            self._in_flight.acquire()
+            try:
+                future = self._pool.submit(render_thumbnails, job['image_path'], str(output_dir))
+            except RuntimeError:
+                # Pool cerrado durante el apagado
+                self._in_flight.release()
+                break
+            future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+
+    def _on_done(self, job: Dict[str, Any], future) -> None:
+        self._in_flight.release()
+        try:
+            written = future.result()
+        except Exception as e:
+            self._retry(job, e)
+            return
+
+        if written is not None and self.cache is not None:
+            self.cache.track_dir(thumbnail_dir(self.thumbnails_path, job['file_hash']))
+        self._finish(job, READY if written is not None else UNAVAILABLE)
+
+    def _retry(self, job: Dict[str, Any], error: Exception) -> None:
+        permanent = isinstance(error, InvalidImageError)
+        if permanent or job['attempt'] >= self.max_retries or self._stopping.is_set():
+            logger.warning(f"Miniaturas de {job['file_id']} fallidas tras {job['attempt'] + 1} intentos: {error}")
+            self.stats["failed"] += 1
+            self._set_status(job['file_id'], FAILED)
+            return
+
+        job = {**job, 'attempt': job['attempt'] + 1}
+        self.stats["retried"] += 1
+        delay = self.retry_delay * 2 ** (job['attempt'] - 1)
+        timer = threading.Timer(delay, self._requeue, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, job: Dict[str, Any]) -> None:
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            self.stats["failed"] += 1
+            self._set_status(job['file_id'], FAILED)
+
+    def _finish(self, job: Dict[str, Any], status: str) -> None:
+        self.stats["completed"] += 1
+        url = thumbnail_url(job['file_id']) if status == READY else None
+        self._set_status(job['file_id'], status, url)
+
+    def _set_status(self, file_id: str, status: str, thumbnail_url: Optional[str] = None) -> None:
+        query = """
+        UPDATE archivos
+        SET estado_miniatura = :status, thumbnail_url = :thumbnail_url
+        WHERE id = :file_id
+        """
+
+        # fecha_actualizacion no cambia: es el orden de /api/search y de su cursor
+        params = {
+            'status': status,
+            'thumbnail_url': thumbnail_url,
+            'file_id': file_id
+        }
+
+        with self._db_lock:
+            try:
+                execute(self.db, "thumbnails.set_status", query, params)
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                logger.error(f"No se pudo actualizar la miniatura de {file_id}: {e}")
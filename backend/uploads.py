@@ -0,0 +1,417 @@
+# Módulo de Subidas (uploads.py)
+# Subidas por partes reanudables: iniciar sesión, enviar partes en cualquier orden y completar
+
+import io
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, BinaryIO, Union
+from pathlib import Path
+
+from utils.metrics import execute
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo de una parte aceptada por petición PUT
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Segundos entre pasadas de purge_expired_sessions (las lanza el lifespan de la API)
+UPLOAD_PURGE_INTERVAL = float(os.getenv("UPLOAD_PURGE_INTERVAL", "3600"))
+
+class ChunkReader(io.RawIOBase):
+    """Stream de solo lectura que encadena los archivos de las partes en orden."""
+
+    def __init__(self, paths: List[Path]):
+        self.paths = list(paths)
+        self.current = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while True:
+            if self.current is None:
+                if not self.paths:
+                    return 0
+                self.current = open(self.paths.pop(0), 'rb')
+            read = self.current.readinto(buffer)
+            if read:
+                return read
+            self.current.close()
+            self.current = None
+
+    def close(self) -> None:
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+class UploadManager:
+    """
+    Gestor de sesiones de subida por partes. Cada parte se guarda en disco al llegar,
+    de forma independiente, así que pueden enviarse en paralelo, fuera de orden y
+    reintentarse solo las que fallaron.
+    """
+
+    def __init__(self, db_connection, file_manager, storage_path: str = "./storage"):
+        """
+        Inicializa el gestor de subidas.
+
+        Args:
+            db_connection: Conexión a la base de datos
+            file_manager: FileManager que registra el archivo al completar
+            storage_path: Ruta base para almacenamiento de archivos
+        """
+        self.db = db_connection
+        self.files = file_manager
+        self.uploads_path = Path(storage_path) / "uploads"
+        self.uploads_path.mkdir(parents=True, exist_ok=True)
+
+        # Tamaño de parte por defecto y límites aceptados (8MB, entre 256KB y 64MB)
+        self.default_chunk_size = 8 * 1024 * 1024
+        self.min_chunk_size = 256 * 1024
+        self.max_chunk_size = MAX_CHUNK_SIZE
+
+        # Sesiones sin actividad durante este tiempo se consideran abandonadas
+        self.session_ttl = timedelta(hours=24)
+        # Un ensamblado que no terminó en este tiempo quedó cortado (p. ej. el proceso cayó)
+        self.assembly_timeout = timedelta(hours=1)
+
+    def create_session(self, user_id: str, filename: str, file_size: int,
+                       chunk_size: Optional[int] = None, file_hash: Optional[str] = None,
+                       folder_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Iniciar una sesión de subida.
+
+        Args:
+            user_id: ID del usuario
+            filename: Nombre original del archivo
+            file_size: Tamaño total en bytes
+            chunk_size: Tamaño de cada parte (la última puede ser menor)
+            file_hash: SHA-256 esperado del archivo completo (opcional)
+            folder_id: ID de la carpeta destino (opcional)
+
+        Returns:
+            Dict con la sesión creada
+        """
+        chunk_size = chunk_size or self.default_chunk_size
+
+        if file_size <= 0:
+            raise ValueError("El tamaño del archivo debe ser mayor que cero")
+        if file_size > self.files.max_file_size:
+            raise ValueError(f"Archivo demasiado grande. Máximo: {self.files.max_file_size / (1024*1024):.1f}MB")
+        if not self.min_chunk_size <= chunk_size <= self.max_chunk_size:
+            raise ValueError(f"Tamaño de parte fuera de rango ({self.min_chunk_size}-{self.max_chunk_size} bytes)")
+        # Rechazar antes de recibir partes; upload_file vuelve a validar al completar
+        self.files.check_storage_quota(user_id, file_size)
+
+        if folder_id:
+            if not self.files.validate_folder_access(user_id, folder_id, "write"):
+                raise PermissionError("No tienes permisos para subir archivos a esta carpeta")
+
+        session = {
+            'id': self.generate_session_id(),
+            'user_id': user_id,
+            'folder_id': folder_id,
+            'name': filename,
+            'file_size': file_size,
+            'chunk_size': chunk_size,
+            'total_chunks': -(-file_size // chunk_size),
+            'file_hash': file_hash.lower() if file_hash else None,
+            'status': 'abierta',
+            'created_at': datetime.now(),
+            'updated_at': datetime.now()
+        }
+
+        query = """
+        INSERT INTO sesiones_subida (id, usuario_id, carpeta_id, nombre, tamaño, tamaño_parte,
+                                     total_partes, hash_archivo, estado, fecha_creacion, fecha_actualizacion)
+        VALUES (:id, :user_id, :folder_id, :name, :file_size, :chunk_size,
+               :total_chunks, :file_hash, :status, :created_at, :updated_at)
+        """
+
+        self._execute("create_session", query, session)
+        self.db.commit()
+        self.session_dir(session['id']).mkdir(parents=True, exist_ok=True)
+
+        return {**session, 'received_chunks': [], 'missing_chunks': list(range(session['total_chunks']))}
+
+    def get_session(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtener una sesión con las partes recibidas y las que faltan.
+
+        Returns:
+            Diccionario con la sesión o None si no existe o es de otro usuario
+        """
+        query = """
+        SELECT id, usuario_id as user_id, carpeta_id as folder_id, nombre as name,
+               tamaño as file_size, tamaño_parte as chunk_size, total_partes as total_chunks,
+               hash_archivo as file_hash, estado as status, archivo_id as file_id,
+               fecha_creacion as created_at, fecha_actualizacion as updated_at
+        FROM sesiones_subida
+        WHERE id = :session_id AND usuario_id = :user_id
+        """
+
+        cursor = self._execute("get_session", query, {'session_id': session_id, 'user_id': user_id})
+        row = cursor.fetchone()
+        if not row:
+            return None
+
+        session = dict(row)
+        received = self.received_chunks(session_id)
+        session['received_chunks'] = received
+        session['missing_chunks'] = sorted(set(range(session['total_chunks'])) - set(received))
+
+        return session
+
+    def put_chunk(self, user_id: str, session_id: str, index: int, chunk_data: Union[BinaryIO, Path],
+                  chunk_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Guardar una parte. Reenviar una parte ya recibida la reemplaza (reintentos idempotentes).
+
+        Args:
+            user_id: ID del usuario
+            session_id: ID de la sesión
+            index: Posición de la parte (desde 0)
+            chunk_data: Contenido de la parte, o un temporal de chunk_temp_file ya escrito
+                        (se mueve a su sitio sin copiarlo)
+            chunk_hash: SHA-256 esperado de la parte (opcional)
+
+        Returns:
+            Dict con índice, tamaño y hash de la parte guardada
+        """
+        session = self._open_session(user_id, session_id)
+
+        if not 0 <= index < session['total_chunks']:
+            raise ValueError(f"Parte fuera de rango (0-{session['total_chunks'] - 1})")
+
+        # Todas las partes miden chunk_size salvo la última
+        expected_size = min(session['chunk_size'], session['file_size'] - index * session['chunk_size'])
+
+        size, digest, temp_name = self._receive(chunk_data, expected_size)
+        try:
+            if size != expected_size:
+                raise ValueError(f"La parte {index} debe medir {expected_size} bytes y se recibieron {size}")
+            if chunk_hash and chunk_hash.lower() != digest:
+                raise ValueError(f"El hash de la parte {index} no coincide")
+
+            os.replace(temp_name, self.chunk_path(session_id, index))
+        finally:
+            if os.path.exists(temp_name):
+                os.unlink(temp_name)
+
+        params = {
+            'session_id': session_id,
+            'index': index,
+            'size': size,
+            'chunk_hash': digest,
+            'received_at': datetime.now()
+        }
+
+        try:
+            self._execute("put_chunk.delete", "DELETE FROM partes_subida WHERE sesion_id = :session_id AND indice = :index",
+                          params)
+            query = """
+            INSERT INTO partes_subida (sesion_id, indice, tamaño, hash_parte, fecha_recepcion)
+            VALUES (:session_id, :index, :size, :chunk_hash, :received_at)
+            """
+            self._execute("put_chunk", query, params)
+            self._execute("put_chunk.touch",
+                          "UPDATE sesiones_subida SET fecha_actualizacion = :received_at WHERE id = :session_id",
+                          params)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            raise e
+
+        return {'index': index, 'size': size, 'chunk_hash': digest}
+
+    def complete_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        """
+        Ensamblar las partes y registrar el archivo.
+
+        Las partes se encadenan como un solo stream hacia FileManager.upload_file, que
+        calcula el hash completo y escribe el blob en una sola pasada con un buffer fijo.
+
+        Returns:
+            Dict con información del archivo creado
+        """
+        session = self._open_session(user_id, session_id)
+
+        missing = sorted(set(range(session['total_chunks'])) - set(self.received_chunks(session_id)))
+        if missing:
+            raise ValueError(f"Faltan partes: {missing[:20]}")
+
+        # Reclamar la sesión: un segundo "completar" concurrente no ensambla dos veces
+        cursor = self._execute("complete_session.claim",
+                               """
+                               UPDATE sesiones_subida SET estado = 'ensamblando', fecha_actualizacion = :claimed_at
+                               WHERE id = :session_id AND estado = 'abierta'
+                               """,
+                               {'session_id': session_id, 'claimed_at': datetime.now()})
+        self.db.commit()
+        if cursor.rowcount == 0:
+            raise ValueError("La sesión de subida ya se está completando")
+
+        try:
+            paths = [self.chunk_path(session_id, i) for i in range(session['total_chunks'])]
+            with ChunkReader(paths) as reader:
+                file_record = self.files.upload_file(user_id, reader, session['name'], session['folder_id'])
+
+            if session['file_hash'] and session['file_hash'] != file_record['file_hash']:
+                self.files.purge_file(user_id, file_record['id'])
+                raise ValueError("El hash del archivo ensamblado no coincide con el declarado")
+        except Exception as e:
+            self._execute("complete_session.release",
+                          "UPDATE sesiones_subida SET estado = 'abierta' WHERE id = :session_id",
+                          {'session_id': session_id})
+            self.db.commit()
+            raise e
+
+        query = """
+        UPDATE sesiones_subida
+        SET estado = 'completada', archivo_id = :file_id, fecha_actualizacion = :updated_at
+        WHERE id = :session_id
+        """
+        params = {'file_id': file_record['id'], 'updated_at': datetime.now(), 'session_id': session_id}
+
+        self._execute("complete_session", query, params)
+        self._execute("complete_session.chunks", "DELETE FROM partes_subida WHERE sesion_id = :session_id",
+                      {'session_id': session_id})
+        self.db.commit()
+        shutil.rmtree(self.session_dir(session_id), ignore_errors=True)
+
+        return file_record
+
+    def abort_session(self, user_id: str, session_id: str) -> bool:
+        """Cancelar una sesión abierta y borrar sus partes."""
+        session = self.get_session(user_id, session_id)
+        if not session or session['status'] != 'abierta':
+            return False
+
+        self._discard(session_id)
+        return True
+
+    def purge_expired_sessions(self) -> int:
+        """
+        Mantenimiento periódico de las subidas: reabre los ensamblados cortados
+        (estado 'ensamblando' más allá de assembly_timeout), borra las sesiones
+        abiertas sin actividad durante session_ttl y los temporales de partes
+        huérfanos.
+
+        Returns:
+            Número de sesiones eliminadas
+        """
+        now = datetime.now()
+        cursor = self._execute(
+            "purge_expired_sessions.stale_assembly",
+            """
+            UPDATE sesiones_subida SET estado = 'abierta', fecha_actualizacion = :now
+            WHERE estado = 'ensamblando' AND fecha_actualizacion < :limit
+            """,
+            {'now': now, 'limit': now - self.assembly_timeout},
+        )
+        self.db.commit()
+        if cursor.rowcount:
+            logger.warning(f"{cursor.rowcount} sesiones de subida con el ensamblado cortado vuelven a estar abiertas")
+
+        query = """
+        SELECT id
+        FROM sesiones_subida
+        WHERE estado = 'abierta' AND fecha_actualizacion < :limit
+        """
+
+        cursor = self._execute("purge_expired_sessions", query, {'limit': now - self.session_ttl})
+        expired = [row[0] for row in cursor.fetchall()]
+        for session_id in expired:
+            self._discard(session_id)
+
+        # Temporales de partes de peticiones que no llegaron a terminar
+        cutoff = time.time() - self.session_ttl.total_seconds()
+        for temp in self.uploads_path.glob(".chunk-*"):
+            try:
+                if temp.stat().st_mtime < cutoff:
+                    temp.unlink()
+            except FileNotFoundError:
+                pass
+
+        return len(expired)
+
+    def chunk_temp_file(self) -> Path:
+        """Temporal vacío en el directorio de subidas donde escribir una parte según llega."""
+        fd, temp_name = tempfile.mkstemp(dir=self.uploads_path, prefix=".chunk-")
+        os.close(fd)
+        return Path(temp_name)
+
+    def received_chunks(self, session_id: str) -> List[int]:
+        """Índices de las partes ya guardadas."""
+        query = "SELECT indice FROM partes_subida WHERE sesion_id = :session_id ORDER BY indice"
+        cursor = self._execute("received_chunks", query, {'session_id': session_id})
+        return [row[0] for row in cursor.fetchall()]
+
+    def session_dir(self, session_id: str) -> Path:
+        return self.uploads_path / session_id
+
+    def chunk_path(self, session_id: str, index: int) -> Path:
+        return self.session_dir(session_id) / f"{index:06d}.part"
+
+    def generate_session_id(self) -> str:
+        """Generar ID único para sesión de subida."""
+        import uuid
+        return f"upload_{uuid.uuid4().hex}"
+
+    def _open_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        session = self.get_session(user_id, session_id)
+        if not session:
+            raise FileNotFoundError("Sesión de subida no encontrada")
+        if session['status'] != 'abierta':
+            raise ValueError(f"La sesión de subida no está abierta (estado: {session['status']})")
+        return session
+
+    def _receive(self, chunk_data: Union[BinaryIO, Path], max_size: int) -> tuple[int, str, str]:
+        """Copiar una parte a un temporal del directorio de subidas calculando su hash."""
+        hash_sha256 = hashlib.sha256()
+        size = 0
+
+        if isinstance(chunk_data, Path):
+            # Ya está en el directorio de subidas: solo se mide y se calcula su hash
+            size = chunk_data.stat().st_size
+            if size > max_size:
+                raise ValueError(f"La parte supera el tamaño esperado ({max_size} bytes)")
+            with open(chunk_data, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.files.upload_buffer_size), b""):
+                    hash_sha256.update(chunk)
+            return size, hash_sha256.hexdigest(), str(chunk_data)
+
+        fd, temp_name = tempfile.mkstemp(dir=self.uploads_path, prefix=".chunk-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: chunk_data.read(self.files.upload_buffer_size), b""):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f"La parte supera el tamaño esperado ({max_size} bytes)")
+                    hash_sha256.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+
+        return size, hash_sha256.hexdigest(), temp_name
+
+    def _discard(self, session_id: str) -> None:
+        params = {'session_id': session_id, 'updated_at': datetime.now()}
+        self._execute("discard.chunks", "DELETE FROM partes_subida WHERE sesion_id = :session_id", params)
+        self._execute("discard",
+                      "UPDATE sesiones_subida SET estado = 'cancelada', fecha_actualizacion = :updated_at WHERE id = :session_id",
+                      params)
+        self.db.commit()
+        shutil.rmtree(self.session_dir(session_id), ignore_errors=True)
+
+    def _execute(self, name: str, query: str, params: Optional[Dict[str, Any]] = None):
+        """Ejecutar una sentencia registrando latencia y filas en utils.metrics."""
+        return execute(self.db, f"uploads.{name}", query, params)
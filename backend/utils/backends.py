@@ -0,0 +1,395 @@
+import os
+import re
+import time
+import queue
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from dotenv import load_dotenv
+from utils.statements import stmt_cache_size
+
+# Cargar variables de entorno
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Carpeta con los scripts DDL/DML del proyecto
+DB_SCRIPTS_DIR = Path(__file__).resolve().parent.parent.parent / "db"
+
+
+class DatabaseBackend:
+    """
+    Interfaz de un motor de base de datos para utils.database.
+    Cada implementación presta conexiones DB-API (cursor/commit/rollback/close,
+    donde close() devuelve la conexión) y resuelve las diferencias de dialecto.
+    """
+
+    name = "base"
+
+    def open(self) -> None:
+        """Prepara el motor (pool, esquema...). Debe ser idempotente."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Drena y libera las conexiones."""
+        raise NotImplementedError
+
+    def acquire(self):
+        """Presta una conexión; conn.close() la devuelve."""
+        raise NotImplementedError
+
+    def is_saturated(self) -> bool:
+        """True si la próxima adquisición tendrá que esperar."""
+        return False
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+    def translate(self, sql: str) -> str:
+        """Adapta el SQL (escrito para Oracle) al dialecto del motor."""
+        return sql
+
+    def tune_cursor(self, cursor, arraysize: int, prefetchrows: int) -> None:
+        cursor.arraysize = arraysize
+
+    def set_dict_rows(self, cursor) -> None:
+        """Hace que el cursor devuelva dicts con columnas en minúscula."""
+        raise NotImplementedError
+
+    def execute_returning(self, cursor, sql: str, params: dict, returning_vars: dict) -> dict:
+        """Ejecuta un INSERT ... RETURNING ... INTO y devuelve {variable: valor}."""
+        raise NotImplementedError
+
+    def execute_many(self, cursor, sql: str, rows: list) -> dict:
+        """Ejecuta un lote sin abortar por filas inválidas: {indice: mensaje}."""
+        raise NotImplementedError
+
+    def session_key(self, conn):
+        """Identifica la sesión física detrás de la conexión prestada."""
+        return None
+
+
+def _lowercase_columns(cursor):
+    columns = [col[0].lower() for col in cursor.description]
+
+    def make_row(*values):
+        return dict(zip(columns, values))
+
+    return make_row
+
+
+class OracleBackend(DatabaseBackend):
+    """Oracle mediante un pool de sesiones de python-oracledb."""
+
+    name = "oracle"
+
+    def __init__(self):
+        import oracledb
+        self.oracledb = oracledb
+
+        # Variables de entorno
+        self.user = os.getenv("ORA_USERNAME")
+        self.password = os.getenv("ORA_PASSWORD")
+        host = os.getenv("ORA_HOST")
+        port = os.getenv("ORA_PORT", "1521")
+        service = os.getenv("ORA_SERVICE_NAME")
+        self.dsn = f"{host}:{port}/{service}"
+
+        # Configuración del pool de sesiones
+        self.pool_min = int(os.getenv("ORA_POOL_MIN", "2"))
+        self.pool_max = int(os.getenv("ORA_POOL_MAX", "10"))
+        self.pool_increment = int(os.getenv("ORA_POOL_INCREMENT", "1"))
+        self.wait_timeout = int(os.getenv("ORA_POOL_WAIT_TIMEOUT", "5000"))  # milisegundos
+        self.ping_interval = int(os.getenv("ORA_POOL_PING_INTERVAL", "60"))  # segundos
+        self.drain_timeout = float(os.getenv("ORA_POOL_DRAIN_TIMEOUT", "10"))  # segundos
+
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        with self._lock:
+            if self._pool is None:
+                logger.info(
+                    f"Creando pool Oracle (min={self.pool_min}, max={self.pool_max}, "
+                    f"increment={self.pool_increment})..."
+                )
+                self._pool = self.oracledb.create_pool(
+                    user=self.user,
+                    password=self.password,
+                    dsn=self.dsn,
+                    min=self.pool_min,
+                    max=self.pool_max,
+                    increment=self.pool_increment,
+                    getmode=self.oracledb.POOL_GETMODE_TIMEDWAIT,
+                    wait_timeout=self.wait_timeout,
+                    ping_interval=self.ping_interval,
+                    stmtcachesize=stmt_cache_size,
+                )
+                logger.info("✅ Pool de conexiones Oracle creado.")
+
+    def close(self) -> None:
+        """
+        Espera a que se devuelvan las conexiones prestadas (hasta
+        ORA_POOL_DRAIN_TIMEOUT segundos) y luego cierra el pool.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+
+        deadline = time.monotonic() + self.drain_timeout
+        while pool.busy > 0 and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        if pool.busy > 0:
+            logger.warning(f"Cerrando pool con {pool.busy} conexiones aún en uso.")
+        pool.close(force=True)
+        logger.info("Pool de conexiones Oracle cerrado.")
+
+    def acquire(self):
+        if self._pool is None:
+            self.open()
+        return self._pool.acquire()
+
+    def is_saturated(self) -> bool:
+        pool = self._pool
+        return bool(pool) and pool.busy >= pool.opened and pool.opened >= self.pool_max
+
+    def stats(self) -> dict:
+        pool = self._pool
+        return {
+            "initialized": pool is not None,
+            "busy": pool.busy if pool else 0,
+            "open": pool.opened if pool else 0,
+            "min": self.pool_min,
+            "max": self.pool_max,
+            "increment": self.pool_increment,
+        }
+
+    def tune_cursor(self, cursor, arraysize: int, prefetchrows: int) -> None:
+        cursor.arraysize = arraysize
+        cursor.prefetchrows = prefetchrows
+
+    def set_dict_rows(self, cursor) -> None:
+        cursor.rowfactory = _lowercase_columns(cursor)
+
+    def execute_returning(self, cursor, sql: str, params: dict, returning_vars: dict) -> dict:
+        params = dict(params or {})
+        for key, var_type in returning_vars.items():
+            params[key] = cursor.var(var_type)
+        cursor.execute(sql, params)
+        return {key: params[key].getvalue() for key in returning_vars.keys()}
+
+    def execute_many(self, cursor, sql: str, rows: list) -> dict:
+        cursor.executemany(sql, rows, batcherrors=True)
+        return {error.offset: error.message for error in cursor.getbatcherrors()}
+
+    def session_key(self, conn):
+        try:
+            return (conn.session_id, conn.serial_num)
+        except Exception:
+            return None
+
+
+# Reescrituras Oracle -> SQLite para el esquema (db/*.sql) y las consultas de la API
+_SQLITE_REWRITES = [
+    (re.compile(r"NUMBER\s+GENERATED\s+ALWAYS\s+AS\s+IDENTITY\s+PRIMARY\s+KEY", re.I),
+     "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\((\d+)\s+BYTE\)", re.I), r"(\1)"),
+    (re.compile(r"TO_TIMESTAMP\(\s*('[^']*')\s*,\s*'[^']*'\s*\)", re.I), r"\1"),
+    (re.compile(r"\bSYSTIMESTAMP\b|\bSYSDATE\b", re.I), "CURRENT_TIMESTAMP"),
+    (re.compile(r"(ALTER\s+TABLE\s+\w+\s+ADD)\s+(?!COLUMN\b)", re.I), r"\1 COLUMN "),
+    (re.compile(r"FETCH\s+FIRST\s+(:\w+|\d+)\s+ROWS\s+ONLY", re.I), r"LIMIT \1"),
+]
+
+_RETURNING_INTO = re.compile(r"\bINTO\s+:\w+(\s*,\s*:\w+)*\s*$", re.I)
+
+# Fechas: se guardan como texto ISO y vuelven como datetime (columnas TIMESTAMP)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+
+
+@lru_cache(maxsize=512)
+def translate_to_sqlite(sql: str) -> str:
+    for pattern, replacement in _SQLITE_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def split_sql_script(script: str) -> list:
+    """Separa un script .sql en sentencias, quitando comentarios '--'."""
+    lines = [line.split("--", 1)[0] for line in script.splitlines()]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+
+class _PooledSQLiteConnection:
+    """Conexión prestada: close() la devuelve al pool en lugar de cerrarla."""
+
+    def __init__(self, backend, raw):
+        self._backend = backend
+        self.raw = raw
+
+    def cursor(self):
+        return self.raw.cursor()
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        if self.raw is not None:
+            raw, self.raw = self.raw, None
+            self._backend.release(raw)
+
+
+class SQLiteBackend(DatabaseBackend):
+    """
+    Sustituto local de Oracle para desarrollo, CI y benchmarks. Crea el esquema
+    desde db/DDL.sql y, opcionalmente, carga los datos de db/DML.sql.
+    Con ":memory:" la base vive en una sola conexión (pool de 1).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = None, seed: bool = None, pool_max: int = None):
+        self.path = path or os.getenv("SQLITE_PATH", ":memory:")
+        self.seed = seed if seed is not None else os.getenv("SQLITE_SEED", "1") == "1"
+        self.in_memory = self.path == ":memory:"
+        self.pool_max = 1 if self.in_memory else (pool_max or int(os.getenv("SQLITE_POOL_MAX", "4")))
+        self.wait_timeout = float(os.getenv("SQLITE_POOL_WAIT_TIMEOUT", "5"))
+
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def _connect(self):
+        raw = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            timeout=self.wait_timeout,
+        )
+        if not self.in_memory:
+            raw.execute("PRAGMA journal_mode=WAL")
+        self._all.append(raw)
+        return raw
+
+    def open(self) -> None:
+        with self._lock:
+            if self._opened:
+                return
+            raw = self._connect()
+            self.load_schema(raw)
+            self._idle.put(raw)
+            self._opened = True
+        logger.info(f"✅ Backend SQLite listo ({self.path}).")
+
+    def load_schema(self, raw) -> None:
+        """Ejecuta DDL.sql (y DML.sql si seed) traducidos; omite sentencias que fallan."""
+        scripts = [DB_SCRIPTS_DIR / "DDL.sql"] + ([DB_SCRIPTS_DIR / "DML.sql"] if self.seed else [])
+        for script in scripts:
+            for stmt in split_sql_script(script.read_text(encoding="utf-8")):
+                if stmt.upper() == "COMMIT":
+                    continue
+                try:
+                    raw.execute(translate_to_sqlite(stmt))
+                except sqlite3.Error as e:
+                    logger.debug(f"Sentencia omitida en {script.name}: {e}")
+        raw.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._all = self._all, []
+            self._opened = False
+            self._idle = queue.LifoQueue()
+        for raw in connections:
+            raw.close()
+
+    def acquire(self):
+        if not self._opened:
+            self.open()
+        with self._lock:
+            create = self._idle.empty() and len(self._all) < self.pool_max
+            raw = self._connect() if create else None
+            self._busy += 1
+        try:
+            if raw is None:
+                raw = self._idle.get(timeout=self.wait_timeout)
+        except queue.Empty:
+            with self._lock:
+                self._busy -= 1
+            raise TimeoutError("No hay conexiones SQLite libres")
+        return _PooledSQLiteConnection(self, raw)
+
+    def release(self, raw) -> None:
+        if raw.in_transaction:
+            raw.rollback()
+        with self._lock:
+            self._busy -= 1
+        self._idle.put(raw)
+
+    def is_saturated(self) -> bool:
+        return self._idle.empty() and len(self._all) >= self.pool_max
+
+    def stats(self) -> dict:
+        return {
+            "initialized": self._opened,
+            "busy": self._busy,
+            "open": len(self._all),
+            "min": 1,
+            "max": self.pool_max,
+            "increment": 1,
+        }
+
+    def translate(self, sql: str) -> str:
+        return translate_to_sqlite(sql)
+
+    def set_dict_rows(self, cursor) -> None:
+        columns = [col[0].lower() for col in cursor.description]
+        cursor.row_factory = lambda _cursor, values: dict(zip(columns, values))
+
+    def execute_returning(self, cursor, sql: str, params: dict, returning_vars: dict) -> dict:
+        # SQLite soporta RETURNING pero no INTO :variables: se lee la fila devuelta
+        cursor.execute(_RETURNING_INTO.sub("", sql.rstrip()), params or {})
+        row = cursor.fetchone()
+        return dict(zip(returning_vars.keys(), row)) if row else {}
+
+    def execute_many(self, cursor, sql: str, rows: list) -> dict:
+        # Equivalente a batcherrors: cada fila en un savepoint, las inválidas se reportan
+        errors = {}
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN")
+        for i, row in enumerate(rows):
+            cursor.execute("SAVEPOINT fila")
+            try:
+                cursor.execute(sql, row)
+            except sqlite3.Error as e:
+                cursor.execute("ROLLBACK TO fila")
+                errors[i] = str(e)
+            cursor.execute("RELEASE fila")
+        return errors
+
+    def session_key(self, conn):
+        return id(conn.raw) if conn.raw is not None else None
+
+
+BACKENDS = {
+    "oracle": OracleBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def create_backend(name: str = None) -> DatabaseBackend:
+    """Instancia el backend indicado (por defecto DB_BACKEND, u 'oracle')."""
+    name = (name or os.getenv("DB_BACKEND", "oracle")).lower()
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"DB_BACKEND desconocido: {name}")
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Segundos que una tabla de referencia se sirve desde memoria antes de recargarse
+reference_cache_ttl = int(os.getenv("REFERENCE_CACHE_TTL", "3600"))
+
+# POST /cache/invalidate solo existe con REFERENCE_CACHE_INVALIDATION=1 (y exige un JWT válido)
+invalidation_endpoint_enabled = os.getenv("REFERENCE_CACHE_INVALIDATION", "0") == "1"
+
+
+class ReferenceCache:
+    """
+    Caché en memoria de una tabla de referencia (paises, colores, ...).
+    Carga las filas con `loader`, las sirve durante `ttl` segundos y calcula un
+    ETag estable a partir del contenido para que el navegador pueda revalidar.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], List[dict]], ttl: int = reference_cache_ttl):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        # (filas, etag, expira) se reemplaza entero: un lector nunca ve una mezcla
+        # de dos cargas ni un estado a medio invalidar
+        self._entry: Optional[Tuple[List[dict], str, float]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Tuple[List[dict], str]:
+        """Devuelve (filas, etag), recargando si expiró o se invalidó."""
+        entry = self._entry
+        if entry is None or time.monotonic() >= entry[2]:
+            with self._lock:
+                # Otro hilo pudo recargar mientras esperábamos el lock
+                entry = self._entry
+                if entry is None or time.monotonic() >= entry[2]:
+                    entry = self._load()
+        return entry[0], entry[1]
+
+    def rows(self) -> List[dict]:
+        return self.get()[0]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entry = None
+
+    def _load(self) -> Tuple[List[dict], str, float]:
+        rows = self.loader()
+        payload = json.dumps(rows, default=str, sort_keys=True).encode()
+        etag = '"' + hashlib.sha256(payload).hexdigest()[:32] + '"'
+        self._entry = (rows, etag, time.monotonic() + self.ttl)
+        logger.info(f"Caché de referencia '{self.name}' cargada ({len(rows)} filas).")
+        return self._entry
+
+
+_caches: Dict[str, ReferenceCache] = {}
+
+
+def register_reference_cache(name: str, loader: Callable[[], List[dict]],
+                             ttl: int = reference_cache_ttl) -> ReferenceCache:
+    cache = ReferenceCache(name, loader, ttl)
+    _caches[name] = cache
+    return cache
+
+
+def get_reference_cache(name: str) -> ReferenceCache:
+    return _caches[name]
+
+
+def invalidate_reference_caches(name: Optional[str] = None) -> List[str]:
+    """Invalida una caché por nombre, o todas si no se indica. Devuelve las invalidadas."""
+    names = [name] if name else list(_caches)
+    for n in names:
+        _caches[n].invalidate()
+    return names
+
+
+def warm_reference_caches() -> None:
+    """Precarga todas las cachés registradas; un fallo no impide arrancar la API."""
+    for cache in _caches.values():
+        try:
+            cache.get()
+        except Exception as e:
+            logger.warning(f"No se pudo precargar la caché '{cache.name}': {e}")
@@ -0,0 +1,95 @@
+import os
+import gzip
+import zlib
+import logging
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# zstd es opcional: sin el paquete zstandard se usa gzip (zlib de la biblioteca estándar)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+IDENTITY, ZSTD, GZIP = "identity", "zstd", "gzip"
+
+# STORAGE_COMPRESSION: auto (zstd si está instalado, si no gzip), zstd, gzip u off
+_configured = os.getenv("STORAGE_COMPRESSION", "auto").lower()
+if _configured == "off":
+    storage_codec = IDENTITY
+elif _configured == ZSTD and zstandard is None:
+    logger.warning("STORAGE_COMPRESSION=zstd pero zstandard no está instalado: se usa gzip")
+    storage_codec = GZIP
+elif _configured in (ZSTD, GZIP):
+    storage_codec = _configured
+else:
+    storage_codec = ZSTD if zstandard is not None else GZIP
+
+# Tipos de FileManager.allowed_extensions que se comprimen; imágenes, video y
+# presentaciones se guardan tal cual
+COMPRESSIBLE_TYPES = {"document", "spreadsheet", "other"}
+
+# Formatos que ya son contenedores comprimidos aunque su tipo sea comprimible
+COMPRESSED_EXTENSIONS = {
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".zip", ".gz", ".tgz", ".bz2",
+    ".xz", ".zst", ".7z", ".rar", ".mp3", ".aac", ".ogg", ".flac", ".jar", ".apk",
+}
+
+# Si una muestra no baja de este ratio, comprimir no compensa la CPU al leer
+MIN_RATIO = 0.9
+SAMPLE_SIZE = 256 * 1024
+
+
+def select_codec(file_type: str, filename: str) -> str:
+    """Códec con el que guardar un archivo según su tipo y extensión."""
+    if storage_codec == IDENTITY or file_type not in COMPRESSIBLE_TYPES:
+        return IDENTITY
+    if Path(filename).suffix.lower() in COMPRESSED_EXTENSIONS:
+        return IDENTITY
+    return storage_codec
+
+
+def worth_compressing(codec: str, sample: bytes) -> bool:
+    """Comprimir una muestra del inicio del contenido y decidir si vale la pena."""
+    if codec == IDENTITY or not sample:
+        return False
+    sample = bytes(sample[:SAMPLE_SIZE])
+    compressed = compressor(codec)
+    size = len(compressed.compress(sample)) + len(compressed.flush())
+    return size <= len(sample) * MIN_RATIO
+
+
+def compressor(codec: str):
+    """Compresor incremental con compress(data) y flush()."""
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if codec == GZIP:
+        # Formato gzip (wbits=31): el blob es un .gz válido
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    raise ValueError(f"Códec de almacenamiento desconocido: {codec}")
+
+
+def open_blob(path, codec: Optional[str], chunk_size: int = 1024 * 1024):
+    """
+    Abrir un blob devolviendo siempre su contenido original. La descompresión es
+    por bloques y acotada por cada read(n): un blob muy comprimible no se expande
+    de golpe en memoria.
+    """
+    if not codec or codec == IDENTITY:
+        return open(path, "rb")
+    if codec == GZIP:
+        return gzip.open(path, "rb")
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("El blob está comprimido con zstd y el paquete zstandard no está instalado")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_size=chunk_size, closefd=True)
+    raise ValueError(f"Códec de almacenamiento desconocido: {codec}")
+
+
+def iter_blob(path, codec: Optional[str], chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """Contenido original de un blob en bloques, para respuestas en streaming."""
+    with open_blob(path, codec, chunk_size) as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            yield chunk
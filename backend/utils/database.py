@@ -2,8 +2,14 @@ import os
 import json
 import logging
 import asyncio
-import oracledb
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from utils.statements import Statement, statement_for, record_execution, forget_sessions
+from utils.backends import DatabaseBackend, create_backend
+from utils.metrics import observe_query, observe_acquire_wait, record_query_error
 
 # Cargar variables de entorno
 load_dotenv()
@@ -12,90 +18,281 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Variables de entorno
-ora_user = os.getenv("ORA_USERNAME")
-ora_password = os.getenv("ORA_PASSWORD")
-ora_host = os.getenv("ORA_HOST")
-ora_port = os.getenv("ORA_PORT", "1521")
-ora_service = os.getenv("ORA_SERVICE_NAME")
+# Hilos dedicados a consultas lanzadas desde rutas async (acotado al tamaño del pool)
+db_executor_workers = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("ORA_POOL_MAX", "10")))
 
-# Activar modo async
-dsn = f"{ora_host}:{ora_port}/{ora_service}"
+_backend = None
+_executor = None
+_pool_lock = threading.Lock()
+_pool_counters = {"acquires": 0, "waits": 0, "acquire_ms_total": 0.0}
 
 
+def get_backend() -> DatabaseBackend:
+    """Backend del proceso, elegido con DB_BACKEND (oracle | sqlite)."""
+    global _backend
+    with _pool_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
 
-# Conexión a Oracle (modo async)
+
+def set_backend(backend: DatabaseBackend) -> None:
+    """Reemplaza el backend del proceso (p. ej. un SQLiteBackend en benchmarks)."""
+    global _backend
+    with _pool_lock:
+        _backend = backend
+
+
+def init_pool():
+    """
+    Abre el backend: en Oracle crea el pool de sesiones del proceso (idempotente).
+    Se llama desde el lifespan de FastAPI; si no se llamó, se abre al primer uso.
+    """
+    backend = get_backend()
+    backend.open()
+    return backend
+
+
+def close_pool():
+    """
+    Drena el pool: espera a que terminen las consultas en curso y se
+    devuelvan las conexiones prestadas, y luego lo cierra.
+    """
+    global _executor
+    with _pool_lock:
+        executor, _executor = _executor, None
+        backend = _backend
+    if executor is not None:
+        # Deja terminar las consultas en curso antes de cerrar las sesiones
+        executor.shutdown(wait=True)
+    if backend is not None:
+        backend.close()
+    forget_sessions()
+
+
+def get_pool_stats() -> dict:
+    """Estadísticas del pool: conexiones ocupadas/abiertas y esperas al adquirir."""
+    backend = get_backend()
+    acquires = _pool_counters["acquires"]
+    return {
+        "backend": backend.name,
+        **backend.stats(),
+        "acquires": acquires,
+        "waits": _pool_counters["waits"],
+        "avg_acquire_ms": round(_pool_counters["acquire_ms_total"] / acquires, 3) if acquires else 0.0,
+    }
+
+
+# Conexión prestada del pool del backend
 def get_db_connection():
+    """
+    Presta una conexión del pool. Llamar a conn.close() la devuelve al pool.
+    """
+    backend = get_backend()
     try:
-        logger.info("Intentando conectar a Oracle...")
-        conn = oracledb.connect(
-            user=ora_user,
-            password=ora_password,
-            dsn=dsn
-        )
-        logger.info("✅ Conexión exitosa a Oracle.")
+        # Si el pool está saturado la adquisición tendrá que esperar
+        must_wait = backend.is_saturated()
+        start = time.perf_counter()
+        conn = backend.acquire()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        observe_acquire_wait(elapsed_ms / 1000)
+        with _pool_lock:
+            _pool_counters["acquires"] += 1
+            _pool_counters["acquire_ms_total"] += elapsed_ms
+            if must_wait:
+                _pool_counters["waits"] += 1
         return conn
     except Exception as e:
-        logger.error(f"❌ Error de conexión a Oracle: {str(e)}")
+        logger.error(f"❌ Error obteniendo conexión del pool ({backend.name}): {str(e)}")
         raise
 
-# Ejecutar consulta y devolver lista de diccionarios
-def execute_query_json(query: str, params=None, needs_commit=False, returning_vars=None):
+def prepare_cursor(cursor, query, arraysize: int | None = None) -> Statement:
     """
-    Ejecuta una consulta en Oracle y devuelve el resultado como JSON.
-    Convierte automáticamente datetime y otros tipos no serializables a string.
+    Resuelve la sentencia declarada (por objeto o por texto SQL) y ajusta el
+    fetch del cursor. `arraysize` permite ajustar por llamada (p. ej. tamaño de página).
+    """
+    statement = query if isinstance(query, Statement) else statement_for(query)
+    get_backend().tune_cursor(cursor, arraysize or statement.arraysize, arraysize or statement.prefetchrows)
+    return statement
+
+
+def _record(statement: Statement, conn, rows: int, start: float, params=None) -> None:
+    """Contabiliza una ejecución en el registro de sentencias y en las métricas."""
+    record_execution(statement, get_backend().session_key(conn), rows)
+    observe_query(statement.name, time.perf_counter() - start, rows, statement.sql, params)
+
+
+# Ejecutar consulta y devolver objetos Python (sin pasar por JSON)
+def execute_query(query: str | Statement, params=None, needs_commit=False, returning_vars=None,
+                  arraysize: int | None = None):
+    """
+    Ejecuta una consulta en Oracle y devuelve el resultado con tipos nativos:
+    - SELECT: lista de dicts (datetime, int, etc. se conservan tal cual; las rutas
+      los devuelven directamente y FastAPI los serializa una sola vez)
+    - RETURNING INTO: dict con los valores devueltos
+    - Otras sentencias: dict con un mensaje
+    `query` puede ser texto SQL o una sentencia declarada con register_statement.
     """
     conn = get_db_connection()
+    statement = None
     try:
         cursor = conn.cursor()
+        statement = prepare_cursor(cursor, query, arraysize)
+        start = time.perf_counter()
 
-        # Setup output variables if RETURNING INTO is needed
+        backend = get_backend()
+        sql = backend.translate(statement.sql)
+
+        # Handle RETURNING INTO
         if returning_vars:
-            for key, var_type in returning_vars.items():
-                if not params:
-                    params = {}
-                params[key] = cursor.var(var_type)
+            result = backend.execute_returning(cursor, sql, params, returning_vars)
+            if needs_commit:
+                conn.commit()
+            _record(statement, conn, 1, start, params)
+            return result
 
-        cursor.execute(query, params or {})
+        cursor.execute(sql, params or {})
 
         if needs_commit:
             conn.commit()
 
-        # Handle RETURNING INTO
-        if returning_vars:
-            result = {key: params[key].getvalue() for key in returning_vars.keys()}
-            return json.dumps(result, default=str)
-
         # Handle SELECT queries
         if cursor.description:
-            columns = [col[0].lower() for col in cursor.description]
+            backend.set_dict_rows(cursor)
             rows = cursor.fetchall()
-            result = [dict(zip(columns, row)) for row in rows]
-            return json.dumps(result, default=str)  # <-- default=str converts datetime
+            _record(statement, conn, len(rows), start, params)
+            return rows
 
         # For other queries (e.g., INSERT/UPDATE)
-        return json.dumps({"message": "Query executed successfully."}, default=str)
+        _record(statement, conn, cursor.rowcount, start, params)
+        return {"message": "Query executed successfully."}
 
     except Exception as e:
         logger.error(f"❌ Error ejecutando la consulta: {e}", exc_info=True)
+        if statement:
+            record_query_error(statement.name, e)
         raise
     finally:
         if conn:
             conn.close()
-            logger.info("Conexión cerrada.")
+
+
+# Ejecutar la misma sentencia para muchas filas en una sola transacción
+def execute_many(query: str | Statement, rows: list) -> dict:
+    """
+    Ejecuta `query` con executemany y batcherrors: las filas inválidas no abortan
+    el lote, se confirma todo en un único commit y se devuelve
+    {indice_fila: mensaje_error} con las filas que fallaron.
+    """
+    if not rows:
+        return {}
 
     conn = get_db_connection()
+    statement = None
     try:
         cursor = conn.cursor()
-        cursor.execute(query, params or {})
-        if cursor.description:
-            columns = [col[0].lower() for col in cursor.description]
-            rows = cursor.fetchall()
-            return [dict(zip(columns, row)) for row in rows]
-        return []
+        statement = prepare_cursor(cursor, query)
+        start = time.perf_counter()
+        backend = get_backend()
+        errors = backend.execute_many(cursor, backend.translate(statement.sql), rows)
+        conn.commit()
+        _record(statement, conn, len(rows) - len(errors), start, rows[0])
+        return errors
+
+    except Exception as e:
+        logger.error(f"❌ Error ejecutando el lote: {e}", exc_info=True)
+        if statement:
+            record_query_error(statement.name, e)
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def batch_results(rows: list, errors: dict) -> list:
+    """Convierte los errores de execute_many en un resultado por fila."""
+    return [
+        {"indice": i, "ok": i not in errors, "error": errors.get(i)}
+        for i in range(len(rows))
+    ]
+
+
+# Ejecutar consulta y entregar filas a medida que llegan
+def iter_query(query: str | Statement, params=None, arraysize: int | None = None):
+    """
+    Generador que ejecuta un SELECT y va entregando las filas (dicts) en lotes de
+    `arraysize` (por defecto el de la sentencia), sin cargar todo el resultado en memoria. La conexión se
+    devuelve al pool cuando el generador termina o se cierra.
+    """
+    conn = get_db_connection()
+    statement = None
+    try:
+        cursor = conn.cursor()
+        statement = prepare_cursor(cursor, query, arraysize)
+        start = time.perf_counter()
+        backend = get_backend()
+        cursor.execute(backend.translate(statement.sql), params or {})
+        backend.set_dict_rows(cursor)
+
+        total = 0
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            total += len(rows)
+            yield from rows
+
+        _record(statement, conn, total, start, params)
+
+    except Exception as e:
+        logger.error(f"❌ Error ejecutando la consulta: {e}", exc_info=True)
+        if statement:
+            record_query_error(statement.name, e)
+        raise
     finally:
         conn.close()
 
+
+# Ejecutar consulta y devolver el resultado como JSON (compatibilidad)
+def execute_query_json(query: str | Statement, params=None, needs_commit=False, returning_vars=None):
+    """
+    Ejecuta una consulta en Oracle y devuelve el resultado como JSON.
+    Convierte automáticamente datetime y otros tipos no serializables a string.
+    Preferir execute_query, que evita el ida y vuelta por JSON.
+    """
+    result = execute_query(query, params, needs_commit, returning_vars)
+    return json.dumps(result, default=str)  # <-- default=str converts datetime
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Ejecutor acotado donde corren las consultas de las rutas async."""
+    global _executor
+    with _pool_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=db_executor_workers, thread_name_prefix="db")
+        return _executor
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Ejecuta una función de acceso a datos (síncrona) fuera del event loop.
+    La concurrencia queda limitada por DB_EXECUTOR_WORKERS, no por los workers de uvicorn.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def execute_query_async(query: str | Statement, params=None, needs_commit=False, returning_vars=None,
+                              arraysize: int | None = None):
+    """Versión awaitable de execute_query."""
+    return await run_db(execute_query, query, params, needs_commit, returning_vars, arraysize)
+
+
+async def execute_query_json_async(query: str | Statement, params=None, needs_commit=False, returning_vars=None):
+    """Versión awaitable de execute_query_json."""
+    return await run_db(execute_query_json, query, params, needs_commit, returning_vars)
+
+
 def insert_user(user: dict):
     """
     Inserta un usuario en la tabla usuarios de la base de datos.
@@ -126,7 +323,7 @@ def insert_user(user: dict):
 # Ejemplo de uso
 def main():
     query = "SELECT * FROM paises"
-    result = execute_query_json(query)
+    result = execute_query(query)
     print(result)
 
 
@@ -0,0 +1,129 @@
+import os
+import mimetypes
+from pathlib import Path
+from typing import Callable
+from urllib.parse import quote
+
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from utils.compression import iter_blob
+
+# Con un proxy delante (nginx) la app solo valida y el proxy envía el archivo con
+# sendfile: DOWNLOAD_ACCEL_PREFIX es la location interna que apunta a STORAGE_PATH
+accel_prefix = os.getenv("DOWNLOAD_ACCEL_PREFIX")
+
+# Tamaño de lectura cuando el servidor ASGI no ofrece envío sin copia
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def file_etag(file_hash: str) -> str:
+    """ETag fuerte: el contenido está direccionado por su SHA-256."""
+    return f'"{file_hash}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """True si el encabezado If-None-Match incluye el ETag (o es '*')."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class BlobFileResponse(FileResponse):
+    """
+    FileResponse (Range, If-Range, HEAD, multipart) que envía el contenido sin pasar
+    por la memoria del proceso cuando el servidor ASGI lo permite:
+
+    - extensión http.response.zerocopysend: sendfile para respuestas completas y rangos
+    - extensión http.response.pathsend: el servidor envía el archivo completo
+    - sin extensiones: lecturas de DOWNLOAD_CHUNK_SIZE (el comportamiento de Starlette)
+    """
+
+    chunk_size = DOWNLOAD_CHUNK_SIZE
+
+    def __init__(self, *args, on_close: Callable[[], None] | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Se llama al terminar el envío, también si el cliente se desconecta
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self._zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    async def _handle_simple(self, send: Send, send_header_only: bool, send_pathsend: bool) -> None:
+        if not self._zerocopy or send_header_only:
+            return await super()._handle_simple(send, send_header_only, send_pathsend)
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await self._zerocopy_send(send, 0, int(self.headers["content-length"]))
+
+    async def _handle_single_range(self, send: Send, start: int, end: int, file_size: int,
+                                   send_header_only: bool) -> None:
+        if not self._zerocopy or send_header_only:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        await self._zerocopy_send(send, start, end - start)
+
+    async def _zerocopy_send(self, send: Send, offset: int, count: int) -> None:
+        with open(self.path, "rb") as file:
+            await send({
+                "type": ZEROCOPY_EXTENSION,
+                "file": file,
+                "offset": offset,
+                "count": count,
+                "more_body": False,
+            })
+
+
+def accel_redirect_response(response: FileResponse, storage_root: str) -> Response | None:
+    """
+    Respuesta vacía con X-Accel-Redirect para que nginx sirva el archivo (con sus
+    propios Range/sendfile). None si DOWNLOAD_ACCEL_PREFIX no está configurado.
+    """
+    if not accel_prefix:
+        return None
+
+    relative = Path(response.path).resolve().relative_to(Path(storage_root).resolve())
+    headers = {
+        name: value for name, value in response.headers.items()
+        if name in ("content-type", "content-disposition", "etag", "cache-control")
+    }
+    headers["X-Accel-Redirect"] = f"{accel_prefix.rstrip('/')}/{relative.as_posix()}"
+    return Response(headers=headers)
+
+
+def content_disposition(filename: str, disposition_type: str = "attachment") -> str:
+    """Content-Disposition con el nombre codificado como lo hace FileResponse."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition_type}; filename*=utf-8''{quoted}"
+    return f'{disposition_type}; filename="{filename}"'
+
+
+def compressed_blob_response(path: str, codec: str, file_size: int, filename: str, headers: dict,
+                             disposition_type: str = "attachment", head: bool = False) -> Response:
+    """
+    Respuesta de un blob guardado comprimido: se descomprime en streaming con el
+    tamaño original como Content-Length. Sin Range (Accept-Ranges: none): solo se
+    comprimen documentos y hojas de cálculo, nunca audio ni video.
+    """
+    headers = {
+        **headers,
+        "Content-Length": str(file_size),
+        "Accept-Ranges": "none",
+        "Content-Disposition": content_disposition(filename, disposition_type),
+    }
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if head:
+        return Response(headers=headers, media_type=media_type)
+    return StreamingResponse(iter_blob(path, codec, DOWNLOAD_CHUNK_SIZE), headers=headers, media_type=media_type)
@@ -0,0 +1,248 @@
+import os
+import sqlite3
+import logging
+import threading
+
+from utils.backends import DB_SCRIPTS_DIR
+
+logger = logging.getLogger(__name__)
+
+# Los gestores de almacenamiento (files.py, folders.py, uploads.py y los módulos que
+# usan) y las rutas /api/* y /uploads/* guardan sus datos en una base SQLite propia,
+# con el esquema db/gestores.sql (IDs de texto, blobs, sesiones de subida, índices).
+# Es independiente de DB_BACKEND: esa opción elige la base de las rutas heredadas
+# (/archivos, /carpetas, /compartidos...), cuyos controladores usan utils.database y el
+# esquema de Oracle. Las dos bases no comparten filas; el SQL de los gestores se
+# escribe en dialecto SQLite y el de los controladores en el que traduce el backend.
+
+# Base y directorio de los gestores de almacenamiento
+storage_db_path = os.getenv("STORAGE_DB_PATH", "./storage/drive.sqlite3")
+storage_path = os.getenv("STORAGE_PATH", "./storage")
+
+# Miniaturas en un pool de procesos (THUMBNAIL_PIPELINE=0 las genera en línea al subir)
+thumbnail_pipeline_enabled = os.getenv("THUMBNAIL_PIPELINE", "1") == "1"
+
+# Espacio usado con escritura diferida (STORAGE_ACCOUNTING=sync lo actualiza en cada subida)
+accounting_write_behind = os.getenv("STORAGE_ACCOUNTING", "write_behind") != "sync"
+
+STORAGE_SCHEMA = DB_SCRIPTS_DIR / "gestores.sql"
+
+# Columnas agregadas a tablas ya existentes (CREATE TABLE IF NOT EXISTS no las añade)
+STORAGE_COLUMNS = {
+    "blobs": {"codec": "TEXT DEFAULT 'identity' NOT NULL", "tamaño_fisico": "INTEGER"},
+    "carpetas": {"papelera_id": "TEXT"},
+    "archivos": {"estado_miniatura": "TEXT", "papelera_id": "TEXT"},
+}
+
+# Conexión y gestores por hilo: las rutas los usan desde los hilos de run_db y
+# una conexión SQLite no debe compartir transacciones entre hilos
+_local = threading.local()
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+_thumbnail_cache = None
+_cache_lock = threading.Lock()
+
+_access_cache = None
+
+_accounting = None
+_accounting_lock = threading.Lock()
+
+_search_backfill = None
+_search_backfill_lock = threading.Lock()
+
+
+def connect_storage(path: str = None) -> sqlite3.Connection:
+    """Abre la base de los gestores, crea el esquema si falta y devuelve filas tipo dict."""
+    path = path or storage_db_path
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(STORAGE_SCHEMA.read_text(encoding="utf-8"))
+    _add_missing_columns(conn)
+    return conn
+
+
+def _add_missing_columns(conn: sqlite3.Connection) -> None:
+    for table, columns in STORAGE_COLUMNS.items():
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, definition in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+                logger.info(f"Columna {table}.{name} agregada a la base de almacenamiento")
+    conn.commit()
+
+
+def _managers() -> dict:
+    managers = getattr(_local, "managers", None)
+    if managers is None:
+        # Importes diferidos: los gestores viven en la raíz del backend
+        from files import FileManager
+        from folders import FolderManager
+        from uploads import UploadManager
+        from permissions import PermissionResolver
+
+        conn = connect_storage()
+        # ACL compartida por todos los hilos: grant/revoke invalidan la de todos
+        permissions = PermissionResolver(conn, get_access_cache())
+        files = FileManager(conn, storage_path, thumbnail_pipeline=get_thumbnail_pipeline(), permissions=permissions,
+                            accounting=get_storage_accounting())
+        managers = _local.managers = {
+            "conn": conn,
+            "files": files,
+            "folders": FolderManager(conn, permissions=permissions, files=files),
+            "permissions": permissions,
+            "uploads": UploadManager(conn, files, storage_path),
+        }
+        logger.debug(f"Gestores de almacenamiento listos en {threading.current_thread().name}")
+    return managers
+
+
+def get_access_cache():
+    """Caché de ACL por usuario del proceso."""
+    global _access_cache
+    with _cache_lock:
+        if _access_cache is None:
+            from permissions import AccessCache
+
+            _access_cache = AccessCache()
+        return _access_cache
+
+
+def get_storage_accounting():
+    """Contabilidad de espacio del proceso (se arranca al primer uso); None si es síncrona."""
+    global _accounting
+    if not accounting_write_behind:
+        return None
+    with _accounting_lock:
+        if _accounting is None:
+            from accounting import StorageAccounting
+
+            _accounting = StorageAccounting(connect_storage(), storage_path)
+            _accounting.start()
+        return _accounting
+
+
+def storage_accounting_stats() -> dict:
+    """Contadores de la contabilidad sin arrancarla."""
+    if _accounting is None:
+        return {"write_behind": accounting_write_behind, "running": False}
+    return {"write_behind": True, **_accounting.info()}
+
+
+def shutdown_storage_accounting():
+    """Vuelca lo pendiente y detiene la contabilidad."""
+    global _accounting
+    with _accounting_lock:
+        if _accounting is not None:
+            _accounting.stop()
+            _accounting = None
+
+
+def start_search_backfill():
+    """
+    Construir en un hilo, por lotes, el índice de búsqueda de los usuarios que aún
+    no lo tienen (idempotente: no lanza otro si el anterior sigue en curso).
+    """
+    global _search_backfill
+    with _search_backfill_lock:
+        if _search_backfill is None or not _search_backfill.is_alive():
+            _search_backfill = threading.Thread(target=_run_search_backfill, name="search-backfill", daemon=True)
+            _search_backfill.start()
+
+
+def _run_search_backfill():
+    from search import SearchIndex
+
+    conn = connect_storage()
+    try:
+        users = SearchIndex(conn).backfill()
+        if users:
+            logger.info(f"Índice de búsqueda construido para {users} usuarios")
+    except Exception:
+        logger.exception("Error construyendo el índice de búsqueda")
+    finally:
+        conn.close()
+
+
+def get_thumbnail_pipeline():
+    """Pipeline de miniaturas del proceso (se arranca al primer uso); None si está desactivado."""
+    global _pipeline
+    if not thumbnail_pipeline_enabled:
+        return None
+    with _pipeline_lock:
+        if _pipeline is None:
+            from thumbnails import ThumbnailPipeline
+
+            cache = _cache()
+            _pipeline = ThumbnailPipeline(connect_storage(), storage_path, cache=cache)
+            _pipeline.start()
+            cache.pipeline = _pipeline
+        return _pipeline
+
+
+def _cache():
+    global _thumbnail_cache
+    with _cache_lock:
+        if _thumbnail_cache is None:
+            from thumbnails import ThumbnailCache
+
+            _thumbnail_cache = ThumbnailCache(storage_path)
+        return _thumbnail_cache
+
+
+def get_thumbnail_cache():
+    """Caché de miniaturas bajo demanda del proceso (genera en el pool del pipeline si está activo)."""
+    cache = _cache()
+    # Arrancar el pipeline (si está activo) para que la caché use su pool de procesos
+    get_thumbnail_pipeline()
+    return cache
+
+
+def thumbnail_pipeline_stats() -> dict:
+    """Contadores del pipeline sin arrancarlo."""
+    cache = _thumbnail_cache.info() if _thumbnail_cache is not None else None
+    if _pipeline is None:
+        return {"enabled": thumbnail_pipeline_enabled, "running": False, "cache": cache}
+    return {"enabled": True, "running": True, **_pipeline.stats, "cache": cache}
+
+
+def shutdown_thumbnail_pipeline():
+    """Detiene el pool de miniaturas esperando los trabajos en curso."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.stop()
+            if _pipeline.cache is not None:
+                _pipeline.cache.pipeline = None
+            _pipeline = None
+
+
+def get_file_manager():
+    """FileManager del hilo actual."""
+    return _managers()["files"]
+
+
+def get_folder_manager():
+    """FolderManager del hilo actual."""
+    return _managers()["folders"]
+
+
+def get_permission_resolver():
+    """PermissionResolver del hilo actual."""
+    return _managers()["permissions"]
+
+
+def get_search_index():
+    """SearchIndex del hilo actual (el mismo que mantiene FileManager)."""
+    return _managers()["files"].search_index
+
+
+def get_upload_manager():
+    """UploadManager del hilo actual."""
+    return _managers()["uploads"]
@@ -0,0 +1,198 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Umbral del log de consultas lentas (milisegundos, 0 lo desactiva)
+slow_query_ms = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+# Límites de los buckets de latencia en segundos (estilo Prometheus)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        sep = "," if labels else ""
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+_lock = threading.Lock()
+_query_latency: Dict[str, Histogram] = {}
+_query_rows: Dict[str, int] = {}
+_query_errors: Dict[Tuple[str, str], int] = {}
+_acquire_wait = Histogram()
+
+
+def bind_shape(params) -> object:
+    """Forma de los parámetros (nombres y tipos, nunca valores) para el log."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [type(value).__name__ for value in params]
+    return type(params).__name__
+
+
+def observe_query(statement: str, seconds: float, rows: int = 0, sql: str = None, params=None) -> None:
+    """Registra la duración y filas de una sentencia y la loguea si fue lenta."""
+    with _lock:
+        histogram = _query_latency.get(statement)
+        if histogram is None:
+            histogram = _query_latency[statement] = Histogram()
+        histogram.observe(seconds)
+        if rows and rows > 0:
+            _query_rows[statement] = _query_rows.get(statement, 0) + rows
+
+    if slow_query_ms and seconds * 1000 >= slow_query_ms:
+        sql_text = " ".join((sql or "").split())
+        logger.warning(
+            f"🐢 Consulta lenta ({seconds * 1000:.1f} ms) [{statement}]: {sql_text} | binds={bind_shape(params)}"
+        )
+
+
+def record_query_error(statement: str, error: Exception) -> None:
+    key = (statement, type(error).__name__)
+    with _lock:
+        _query_errors[key] = _query_errors.get(key, 0) + 1
+
+
+def observe_acquire_wait(seconds: float) -> None:
+    with _lock:
+        _acquire_wait.observe(seconds)
+
+
+@contextmanager
+def timed_query(statement: str, sql: str = None, params=None):
+    """
+    Mide una sentencia ejecutada fuera de utils.database (p. ej. en los managers).
+    El bloque puede fijar `result["rows"]` para contabilizar filas.
+    """
+    result = {"rows": 0}
+    start = time.perf_counter()
+    try:
+        yield result
+    except Exception as e:
+        record_query_error(statement, e)
+        raise
+    finally:
+        observe_query(statement, time.perf_counter() - start, result["rows"], sql, params)
+
+
+class FetchedCursor:
+    """Resultado ya leído de una consulta, con la interfaz del cursor que usan los managers."""
+
+    def __init__(self, cursor, rows: list):
+        self.rows = rows
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid
+        self.description = cursor.description
+        self._position = 0
+
+    def fetchone(self):
+        if self._position >= len(self.rows):
+            return None
+        self._position += 1
+        return self.rows[self._position - 1]
+
+    def fetchall(self) -> list:
+        rows = self.rows[self._position:]
+        self._position = len(self.rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+def execute(db, statement: str, sql: str, params: Optional[Dict] = None):
+    """
+    Ejecuta una sentencia en una conexión de los managers y la mide con timed_query.
+    Las consultas se leen enteras dentro de la medición y cuentan las filas
+    devueltas (rowcount es -1 en los SELECT de sqlite3); el resto cuenta las
+    filas afectadas.
+    """
+    with timed_query(statement, sql, params) as result:
+        cursor = db.execute(sql, params or {})
+        if cursor.description is None:
+            result["rows"] = max(cursor.rowcount, 0)
+            return cursor
+        rows = cursor.fetchall()
+        result["rows"] = len(rows)
+        return FetchedCursor(cursor, rows)
+
+
+def executemany(db, statement: str, sql: str, rows: Iterable[tuple]):
+    """Ejecuta una sentencia por lotes de parámetros (nada si no hay filas) y la mide."""
+    rows = list(rows)
+    if not rows:
+        return None
+    with timed_query(statement, sql) as result:
+        cursor = db.executemany(sql, rows)
+        result["rows"] = len(rows)
+        return cursor
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus(pool_stats: dict = None) -> str:
+    """Exporta las métricas en formato de texto de Prometheus."""
+    lines = []
+    with _lock:
+        lines.append("# HELP db_query_duration_seconds Latencia de las sentencias SQL.")
+        lines.append("# TYPE db_query_duration_seconds histogram")
+        for statement, histogram in sorted(_query_latency.items()):
+            lines.extend(histogram.render("db_query_duration_seconds", f'statement="{_label(statement)}"'))
+
+        lines.append("# HELP db_query_rows_total Filas devueltas o afectadas por sentencia.")
+        lines.append("# TYPE db_query_rows_total counter")
+        for statement, rows in sorted(_query_rows.items()):
+            lines.append(f'db_query_rows_total{{statement="{_label(statement)}"}} {rows}')
+
+        lines.append("# HELP db_query_errors_total Errores por sentencia y tipo de excepción.")
+        lines.append("# TYPE db_query_errors_total counter")
+        for (statement, error), count in sorted(_query_errors.items()):
+            lines.append(
+                f'db_query_errors_total{{statement="{_label(statement)}",error="{_label(error)}"}} {count}'
+            )
+
+        lines.append("# HELP db_pool_acquire_wait_seconds Tiempo esperando una conexión del pool.")
+        lines.append("# TYPE db_pool_acquire_wait_seconds histogram")
+        lines.extend(_acquire_wait.render("db_pool_acquire_wait_seconds", ""))
+
+    if pool_stats:
+        for key in ("busy", "open", "max"):
+            lines.append(f"# TYPE db_pool_{key} gauge")
+            lines.append(f"db_pool_{key} {pool_stats.get(key, 0)}")
+        lines.append("# TYPE db_pool_waits_total counter")
+        lines.append(f"db_pool_waits_total {pool_stats.get('waits', 0)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,122 @@
+import json
+import base64
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+from fastapi import HTTPException
+from utils.statements import register_statement
+
+# Tamaño de página por defecto y máximo para los listados
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$dt" in value:
+        return datetime.fromisoformat(value["$dt"])
+    return value
+
+
+def encode_cursor(row: dict, keyset: Sequence[str]) -> str:
+    """Genera un cursor opaco con los valores de las columnas de ordenamiento de la fila."""
+    values = [_encode_value(row[col]) for col in keyset]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keyset: Sequence[str]) -> List:
+    """Decodifica un cursor generado por encode_cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    if not isinstance(values, list) or len(values) != len(keyset):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return [_decode_value(v) for v in values]
+
+
+def keyset_sql(base_query: str, keyset: Sequence[str], has_after: bool, has_limit: bool) -> str:
+    """
+    Construye el texto de una consulta paginada por keyset sobre base_query (sin
+    WHERE ni ORDER BY). Oracle no soporta comparación de tuplas, así que
+    (a, b) > (:k0, :k1) se expande a a > :k0 OR (a = :k0 AND b > :k1).
+    """
+    query = base_query
+
+    if has_after:
+        ors = []
+        for i, col in enumerate(keyset):
+            ands = [f"{prev} = :k{j}" for j, prev in enumerate(keyset[:i])]
+            ands.append(f"{col} > :k{i}")
+            ors.append("(" + " AND ".join(ands) + ")")
+        query += " WHERE " + " OR ".join(ors)
+
+    query += " ORDER BY " + ", ".join(keyset)
+
+    if has_limit:
+        query += " FETCH FIRST :limit ROWS ONLY"
+
+    return query
+
+
+def keyset_query(base_query: str, keyset: Sequence[str], after: Optional[str] = None,
+                 limit: Optional[int] = None) -> Tuple[str, dict]:
+    """Devuelve (sql, params) para leer desde el cursor `after`, hasta `limit` filas."""
+    params = {}
+
+    if after:
+        for i, value in enumerate(decode_cursor(after, keyset)):
+            params[f"k{i}"] = value
+
+    if limit is not None:
+        params["limit"] = limit
+
+    return keyset_sql(base_query, keyset, bool(after), limit is not None), params
+
+
+def register_keyset_statements(name: str, base_query: str, keyset: Sequence[str],
+                               arraysize: int = 500) -> None:
+    """
+    Declara en el registro de sentencias las cuatro variantes de un listado
+    (con/sin cursor, con/sin límite), para que compartan ajuste de fetch y estadísticas.
+    """
+    for has_after in (False, True):
+        for has_limit in (False, True):
+            suffix = ("+after" if has_after else "") + ("+limit" if has_limit else "")
+            register_statement(f"{name}{suffix}", keyset_sql(base_query, keyset, has_after, has_limit),
+                               arraysize=arraysize)
+
+
+def split_page(rows: List[dict], keyset: Sequence[str], limit: int) -> Tuple[List[dict], Optional[str]]:
+    """
+    Recibe hasta limit + 1 filas: si sobra una hay página siguiente y
+    devuelve (filas de la página, cursor siguiente).
+    """
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1], keyset)
+    return rows, None
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def ndjson_lines(rows: Iterable[dict]) -> Iterator[bytes]:
+    """Serializa filas como NDJSON (una línea JSON por fila)."""
+    for row in rows:
+        yield json.dumps(row, default=_json_default).encode() + b"\n"
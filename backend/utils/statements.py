@@ -0,0 +1,117 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Tamaño de la caché de sentencias de cada sesión Oracle (stmtcachesize del pool)
+stmt_cache_size = int(os.getenv("ORA_STMT_CACHE_SIZE", "40"))
+
+# Tamaño de fetch por defecto para sentencias no declaradas
+DEFAULT_ARRAYSIZE = 100
+
+
+class Statement:
+    """
+    Sentencia SQL declarada con nombre y su ajuste de fetch.
+
+    arraysize: filas por viaje de red en fetchmany/fetchall.
+    prefetchrows: filas que Oracle devuelve junto con el execute (para
+    búsquedas de una fila basta con 2 y se ahorra un viaje).
+    """
+
+    def __init__(self, name: str, sql: str, arraysize: int = DEFAULT_ARRAYSIZE,
+                 prefetchrows: int | None = None):
+        self.name = name
+        self.sql = sql
+        self.arraysize = arraysize
+        self.prefetchrows = prefetchrows if prefetchrows is not None else arraysize
+        self.executions = 0
+        self.cache_hits = 0
+        self.rows = 0
+
+    def stats(self) -> dict:
+        return {
+            "executions": self.executions,
+            "cache_hits": self.cache_hits,
+            "hit_rate": round(self.cache_hits / self.executions, 4) if self.executions else 0.0,
+            "rows": self.rows,
+            "arraysize": self.arraysize,
+            "prefetchrows": self.prefetchrows,
+        }
+
+
+_lock = threading.Lock()
+_by_name: dict[str, Statement] = {}
+_by_sql: dict[str, Statement] = {}
+
+# Réplica de la caché LRU de sentencias de cada sesión: (session_id, serial) -> textos SQL
+_session_caches: dict[tuple, OrderedDict] = {}
+
+
+def register_statement(name: str, sql: str, arraysize: int = DEFAULT_ARRAYSIZE,
+                       prefetchrows: int | None = None) -> Statement:
+    """Declara una sentencia con nombre. Volver a registrar el mismo nombre la reemplaza."""
+    statement = Statement(name, sql, arraysize, prefetchrows)
+    with _lock:
+        _by_name[name] = statement
+        _by_sql[sql] = statement
+    return statement
+
+
+def get_statement(name: str) -> Statement:
+    return _by_name[name]
+
+
+def statement_for(sql: str) -> Statement:
+    """
+    Devuelve la sentencia declarada con ese texto; si no existe la registra
+    como ad-hoc para que igual aparezca en las estadísticas.
+    """
+    statement = _by_sql.get(sql)
+    if statement is None:
+        digest = hashlib.sha1(sql.encode()).hexdigest()[:8]
+        statement = register_statement(f"adhoc:{digest}", sql)
+    return statement
+
+
+def record_execution(statement: Statement, key, rows: int = 0) -> None:
+    """
+    Contabiliza una ejecución. Se considera acierto de caché cuando la sesión ya
+    tenía el texto SQL entre sus últimas `stmt_cache_size` sentencias, que es lo
+    que evita el reparseo en el servidor.
+    """
+    with _lock:
+        statement.executions += 1
+        statement.rows += rows
+        if key is None:
+            return
+
+        cache = _session_caches.setdefault(key, OrderedDict())
+        if statement.sql in cache:
+            statement.cache_hits += 1
+            cache.move_to_end(statement.sql)
+        else:
+            cache[statement.sql] = True
+            if len(cache) > stmt_cache_size:
+                cache.popitem(last=False)
+
+
+def forget_sessions() -> None:
+    """Olvida las cachés de sesión (al cerrar el pool las sesiones desaparecen)."""
+    with _lock:
+        _session_caches.clear()
+
+
+def statement_stats() -> dict:
+    """Estadísticas por sentencia más la tasa de aciertos global."""
+    with _lock:
+        statements = {name: st.stats() for name, st in _by_name.items()}
+        executions = sum(st.executions for st in _by_name.values())
+        hits = sum(st.cache_hits for st in _by_name.values())
+    return {
+        "stmtcachesize": stmt_cache_size,
+        "executions": executions,
+        "cache_hits": hits,
+        "hit_rate": round(hits / executions, 4) if executions else 0.0,
+        "statements": statements,
+    }
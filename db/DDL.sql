@@ -77,3 +77,8 @@ CREATE TABLE Comentarios (
     id_archivo NUMBER NOT NULL REFERENCES Archivos(id_archivo)
 );
 
+
+-- Índices para la paginación por keyset de los listados
+CREATE INDEX idx_archivos_nombre_id ON Archivos (nombre, id_archivo);
+CREATE INDEX idx_carpetas_nombre_id ON Carpetas (nombre, id_carpeta);
+CREATE INDEX idx_comentarios_fecha_id ON Comentarios (fecha_comentario, id_comentario);
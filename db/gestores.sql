@@ -0,0 +1,171 @@
+-- Esquema de almacenamiento de FileManager (files.py), FolderManager (folders.py),
+-- BlobStore (blobs.py) y UploadManager (uploads.py). Dialecto SQLite.
+-- Es una base aparte de la de DB_BACKEND (rutas heredadas): ver utils/managers.py.
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id TEXT PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tipo_archivo (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tipo_acceso (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS carpetas (
+    id TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    carpeta_padre_id TEXT REFERENCES carpetas(id),
+    usuario_id TEXT NOT NULL,
+    fecha_creacion TIMESTAMP,
+    fecha_actualizacion TIMESTAMP,
+    eliminado INTEGER DEFAULT 0 NOT NULL,
+    color TEXT,
+    -- Operación de papelera que la eliminó junto con su carpeta (folders.py)
+    papelera_id TEXT
+);
+
+-- Tabla de cierre de carpetas: un par por cada (ancestro, descendiente), incluido
+-- (c, c, 0); se mantiene al crear y mover carpetas (ancestry.py)
+CREATE TABLE IF NOT EXISTS carpetas_ancestros (
+    ancestro_id TEXT NOT NULL REFERENCES carpetas(id),
+    descendiente_id TEXT NOT NULL REFERENCES carpetas(id),
+    profundidad INTEGER NOT NULL,
+    PRIMARY KEY (ancestro_id, descendiente_id)
+);
+
+-- Totales recursivos no eliminados de cada carpeta (rollups.py)
+CREATE TABLE IF NOT EXISTS carpetas_totales (
+    carpeta_id TEXT PRIMARY KEY REFERENCES carpetas(id),
+    archivos INTEGER DEFAULT 0 NOT NULL,
+    carpetas INTEGER DEFAULT 0 NOT NULL,
+    bytes INTEGER DEFAULT 0 NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS archivos (
+    id TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    nombre_original TEXT,
+    tipo_archivo_id INTEGER REFERENCES tipo_archivo(id),
+    tamaño INTEGER NOT NULL,
+    hash_archivo TEXT,
+    carpeta_id TEXT REFERENCES carpetas(id),
+    usuario_id TEXT NOT NULL,
+    ruta_almacenamiento TEXT,
+    url TEXT,
+    thumbnail_url TEXT,
+    estado_miniatura TEXT,
+    fecha_creacion TIMESTAMP,
+    fecha_actualizacion TIMESTAMP,
+    eliminado INTEGER DEFAULT 0 NOT NULL,
+    papelera_id TEXT
+);
+
+CREATE TABLE IF NOT EXISTS compartidos (
+    archivo_id TEXT REFERENCES archivos(id),
+    carpeta_id TEXT REFERENCES carpetas(id),
+    email_compartido TEXT NOT NULL,
+    tipo_acceso_id INTEGER REFERENCES tipo_acceso(id),
+    activo INTEGER DEFAULT 1 NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    hash_archivo TEXT PRIMARY KEY,
+    tamaño INTEGER NOT NULL,
+    ruta_almacenamiento TEXT NOT NULL,
+    referencias INTEGER DEFAULT 1 NOT NULL,
+    fecha_creacion TIMESTAMP,
+    -- identity, gzip o zstd (utils/compression.py); tamaño es siempre el original
+    codec TEXT DEFAULT 'identity' NOT NULL,
+    tamaño_fisico INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS almacenamiento (
+    usuario_id TEXT PRIMARY KEY,
+    espacio_usado INTEGER DEFAULT 0 NOT NULL,
+    espacio_total INTEGER NOT NULL,
+    fecha_actualizacion TIMESTAMP
+);
+
+-- Última secuencia del diario de cada proceso ya sumada a almacenamiento (accounting.py)
+CREATE TABLE IF NOT EXISTS contabilidad_diarios (
+    diario TEXT PRIMARY KEY,
+    secuencia INTEGER NOT NULL
+);
+
+-- Subidas por partes reanudables (uploads.py)
+CREATE TABLE IF NOT EXISTS sesiones_subida (
+    id TEXT PRIMARY KEY,
+    usuario_id TEXT NOT NULL,
+    carpeta_id TEXT REFERENCES carpetas(id),
+    nombre TEXT NOT NULL,
+    tamaño INTEGER NOT NULL,
+    tamaño_parte INTEGER NOT NULL,
+    total_partes INTEGER NOT NULL,
+    hash_archivo TEXT,
+    estado TEXT DEFAULT 'abierta' NOT NULL,
+    archivo_id TEXT REFERENCES archivos(id),
+    fecha_creacion TIMESTAMP,
+    fecha_actualizacion TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS partes_subida (
+    sesion_id TEXT NOT NULL REFERENCES sesiones_subida(id),
+    indice INTEGER NOT NULL,
+    tamaño INTEGER NOT NULL,
+    hash_parte TEXT NOT NULL,
+    fecha_recepcion TIMESTAMP,
+    PRIMARY KEY (sesion_id, indice)
+);
+
+-- Índice de búsqueda por nombre (search.py): tokens normalizados de archivos y
+-- carpetas por propietario, vocabulario con contador de documentos y trigramas
+-- del vocabulario para coincidencias aproximadas
+CREATE TABLE IF NOT EXISTS busqueda_tokens (
+    usuario_id TEXT NOT NULL,
+    token TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    recurso_id TEXT NOT NULL,
+    PRIMARY KEY (usuario_id, token, tipo, recurso_id)
+);
+
+CREATE TABLE IF NOT EXISTS busqueda_vocabulario (
+    usuario_id TEXT NOT NULL,
+    token TEXT NOT NULL,
+    documentos INTEGER DEFAULT 1 NOT NULL,
+    PRIMARY KEY (usuario_id, token)
+);
+
+CREATE TABLE IF NOT EXISTS busqueda_trigramas (
+    usuario_id TEXT NOT NULL,
+    trigrama TEXT NOT NULL,
+    token TEXT NOT NULL,
+    PRIMARY KEY (usuario_id, trigrama, token)
+);
+
+-- Usuarios cuyo índice ya se construyó a partir de archivos/carpetas existentes
+CREATE TABLE IF NOT EXISTS busqueda_usuarios (
+    usuario_id TEXT PRIMARY KEY,
+    fecha_indexado TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_busqueda_tokens_recurso ON busqueda_tokens (tipo, recurso_id, token);
+CREATE INDEX IF NOT EXISTS idx_archivos_usuario_recientes ON archivos (usuario_id, eliminado, fecha_actualizacion, id);
+CREATE INDEX IF NOT EXISTS idx_carpetas_usuario_recientes ON carpetas (usuario_id, eliminado, fecha_actualizacion, id);
+CREATE INDEX IF NOT EXISTS idx_archivos_usuario_carpeta ON archivos (usuario_id, carpeta_id);
+CREATE INDEX IF NOT EXISTS idx_carpetas_usuario_padre ON carpetas (usuario_id, carpeta_padre_id);
+-- Hijos de una carpeta de cualquier usuario: reconstrucción de carpetas_ancestros (ancestry.py)
+CREATE INDEX IF NOT EXISTS idx_carpetas_padre ON carpetas (carpeta_padre_id);
+-- Archivos de las carpetas de un subárbol, de cualquier usuario (papelera y purga)
+CREATE INDEX IF NOT EXISTS idx_archivos_carpeta ON archivos (carpeta_id);
+CREATE INDEX IF NOT EXISTS idx_compartidos_carpeta ON compartidos (carpeta_id);
+CREATE INDEX IF NOT EXISTS idx_carpetas_ancestros_descendiente ON carpetas_ancestros (descendiente_id, profundidad);
+CREATE INDEX IF NOT EXISTS idx_compartidos_archivo ON compartidos (archivo_id);
+
+INSERT OR IGNORE INTO tipo_acceso (id, nombre) VALUES (1, 'solo_lectura');
+INSERT OR IGNORE INTO tipo_acceso (id, nombre) VALUES (2, 'lectura_escritura');